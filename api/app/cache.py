@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Keys are tuples starting with the pharmacy id so that everything cached for
+    one pharmacy can be dropped at once with :meth:`invalidate`.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, pharma_id: str | None = None) -> int:
+        """Drop every entry for ``pharma_id`` (or all entries) and return how many went."""
+        with self._lock:
+            if pharma_id is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries if isinstance(key, tuple) and key and key[0] == pharma_id]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def payload_etag(payload: Any) -> str:
+    body = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+
+_ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` header.
+
+    The header is a comma-separated list of entity tags, each possibly
+    prefixed with ``W/``, or ``*``; only whole tags match.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return opaque in _ENTITY_TAG.findall(if_none_match)
+
+
+# KPI payloads, keyed by (pharma_id, mart data version, endpoint, parameters).
+kpi_cache = TTLCache(
+    maxsize=int(os.environ.get("KPI_CACHE_SIZE", "512")),
+    ttl=float(os.environ.get("KPI_CACHE_TTL", "300")),
+)
+
+# Question embeddings, keyed by (backend, dim, model, question): they never go stale.
+rag_embedding_cache = TTLCache(
+    maxsize=int(os.environ.get("RAG_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("RAG_EMBEDDING_CACHE_TTL", "86400")),
+)
+
+# Search results, keyed by (pharma_id, question, index version, collection, options).
+rag_search_cache = TTLCache(
+    maxsize=int(os.environ.get("RAG_SEARCH_CACHE_SIZE", "512")),
+    ttl=float(os.environ.get("RAG_SEARCH_CACHE_TTL", "600")),
+)
@@ -17,3 +17,12 @@ def parse_hosts(raw: str) -> dict[str, str]:
 
 def get_pharmacy_hosts() -> dict[str, str]:
     return parse_hosts(os.environ.get("PHARMACY_HOSTS", ""))
+
+
+def get_datasnap_settings() -> dict[str, float | int]:
+    return {
+        "timeout": float(os.environ.get("DATASNAP_TIMEOUT", "10")),
+        "retries": int(os.environ.get("DATASNAP_RETRIES", "3")),
+        "max_connections": int(os.environ.get("DATASNAP_MAX_CONNECTIONS", "10")),
+        "keepalive_expiry": float(os.environ.get("DATASNAP_KEEPALIVE_EXPIRY", "30")),
+    }
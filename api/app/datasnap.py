@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import json
+import re
+import threading
 import time
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 import httpx
 
@@ -17,37 +22,272 @@ class DataSnapError(RuntimeError):
     pass
 
 
+def _endpoint(base_url: str, method_name: str) -> str:
+    if method_name == "query_thread":
+        return f"{base_url}/query_thread/"
+    return f"{base_url}/datasnap/rest/TServerMethods1/%22{method_name}%22/"
+
+
+def _parse_response(response: httpx.Response) -> DataSnapResponse:
+    data = response.json()
+    if "result" not in data:
+        raise DataSnapError("Missing 'result' field in response")
+    result = data["result"][0] if isinstance(data["result"], list) else data["result"]
+    return DataSnapResponse(raw=data, result=result)
+
+
+_RESULT_PREFIX = re.compile(r'\s*\{\s*"result"\s*:\s*\[\s*')
+_SEPARATORS = " \t\r\n,"
+
+
+def iter_result_rows(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Decode the rows of a ``{"result": [[row, ...]]}`` body incrementally.
+
+    Rows are yielded as soon as their closing brace has arrived, so memory is
+    bounded by one row plus one network chunk. Bodies of any other shape are
+    decoded whole and mapped like :func:`_parse_response`.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunk_iter = iter(chunks)
+    buffer = ""
+    finished = False
+
+    def fill() -> bool:
+        nonlocal buffer, finished
+        for chunk in chunk_iter:
+            buffer += text_decoder.decode(chunk)
+            return True
+        buffer += text_decoder.decode(b"", final=True)
+        finished = True
+        return False
+
+    while len(buffer) < 64 and fill():
+        pass
+    prefix = _RESULT_PREFIX.match(buffer)
+    if not prefix or not buffer[prefix.end() :].startswith("["):
+        while fill():
+            pass
+        try:
+            data = json.loads(buffer)
+        except ValueError as exc:
+            raise DataSnapError(f"Invalid JSON from DataSnap: {exc}") from exc
+        if not isinstance(data, dict) or "result" not in data:
+            raise DataSnapError("Missing 'result' field in response")
+        result = data["result"]
+        if isinstance(result, list) and result:
+            result = result[0]
+        if isinstance(result, list):
+            yield from result
+        elif result is not None:
+            yield result
+        return
+
+    pos = prefix.end() + 1
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(buffer):
+            if not fill():
+                raise DataSnapError("Truncated DataSnap response")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            row, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if finished or not fill():
+                raise DataSnapError("Truncated DataSnap response") from None
+            continue
+        if end == len(buffer) and not isinstance(row, (dict, list)) and fill():
+            continue
+        yield row
+        buffer = buffer[end:]
+        pos = 0
+
+
 class DataSnapClient:
-    def __init__(self, host: str, timeout: float = 10.0, retries: int = 3) -> None:
+    def __init__(
+        self,
+        host: str,
+        timeout: float = 10.0,
+        retries: int = 3,
+        max_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+    ) -> None:
+        self.host = host
         self.base_url = f"http://{host}:8001"
         self.timeout = timeout
         self.retries = retries
+        self._client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+        )
+
+    def __enter__(self) -> DataSnapClient:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._client.close()
 
     def _endpoint(self, method_name: str) -> str:
-        if method_name == "query_thread":
-            return f"{self.base_url}/query_thread/"
-        return f"{self.base_url}/datasnap/rest/TServerMethods1/%22{method_name}%22/"
+        return _endpoint(self.base_url, method_name)
 
     def call(self, method_name: str, payload: dict[str, Any]) -> DataSnapResponse:
         last_error: Exception | None = None
         for attempt in range(1, self.retries + 1):
             try:
-                with httpx.Client(timeout=self.timeout) as client:
-                    response = client.post(
-                        self._endpoint(method_name),
+                response = self._client.post(self._endpoint(method_name), json=payload)
+                response.raise_for_status()
+                return _parse_response(response)
+            except (httpx.HTTPError, ValueError, DataSnapError) as exc:
+                last_error = exc
+                if attempt < self.retries:
+                    time.sleep(min(2**attempt, 10))
+                    continue
+                break
+        raise DataSnapError(f"DataSnap call failed after {self.retries} attempts: {last_error}")
+
+    def stream_rows(self, method_name: str, payload: dict[str, Any]) -> Iterator[Any]:
+        """Yield result rows while the response body is still downloading.
+
+        Unlike :meth:`call` there is no retry: rows may already have been consumed.
+        """
+        try:
+            with self._client.stream("POST", self._endpoint(method_name), json=payload) as response:
+                response.raise_for_status()
+                yield from iter_result_rows(response.iter_bytes())
+        except httpx.HTTPError as exc:
+            raise DataSnapError(f"DataSnap stream failed: {exc}") from exc
+
+
+class AsyncDataSnapClient:
+    """asyncio counterpart of :class:`DataSnapClient`.
+
+    At most ``max_concurrency`` requests are in flight against the host at once.
+    Pass ``http_client`` to share one ``httpx.AsyncClient`` between hosts; it is
+    then left open by :meth:`aclose`.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        timeout: float = 10.0,
+        retries: int = 3,
+        max_concurrency: int = 4,
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.host = host
+        self.base_url = f"http://{host}:8001"
+        self.timeout = timeout
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._owns_client = http_client is None
+        self._client = http_client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency),
+        )
+
+    async def __aenter__(self) -> AsyncDataSnapClient:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def ping(self) -> httpx.Response:
+        async with self._semaphore:
+            return await self._client.get(f"{self.base_url}/test/", timeout=self.timeout)
+
+    async def call(self, method_name: str, payload: dict[str, Any]) -> DataSnapResponse:
+        last_error: Exception | None = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await self._client.post(
+                        _endpoint(self.base_url, method_name),
                         json=payload,
                         headers={"Accept": "application/json", "Content-Type": "application/json"},
+                        timeout=self.timeout,
                     )
                 response.raise_for_status()
-                data = response.json()
-                if "result" not in data:
-                    raise DataSnapError("Missing 'result' field in response")
-                result = data["result"][0] if isinstance(data["result"], list) else data["result"]
-                return DataSnapResponse(raw=data, result=result)
+                return _parse_response(response)
             except (httpx.HTTPError, ValueError, DataSnapError) as exc:
                 last_error = exc
                 if attempt < self.retries:
-                    time.sleep(min(2**attempt, 10))
+                    await asyncio.sleep(min(2**attempt, 10))
                     continue
                 break
         raise DataSnapError(f"DataSnap call failed after {self.retries} attempts: {last_error}")
+
+
+async def probe_hosts(
+    hosts: dict[str, str],
+    timeout: float = 5.0,
+    concurrency: int = 32,
+) -> list[dict[str, Any]]:
+    """Hit ``/test/`` on every host concurrently and time each probe."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout) as http_client:
+
+        async def probe(pharma_id: str, host: str) -> dict[str, Any]:
+            client = AsyncDataSnapClient(host, timeout=timeout, http_client=http_client)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.ping()
+                    ok = response.status_code == 200
+                    detail = f"HTTP {response.status_code}"
+                except httpx.HTTPError as exc:
+                    ok = False
+                    detail = str(exc) or type(exc).__name__
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            return {"pharma_id": pharma_id, "host": host, "ok": ok, "detail": detail, "elapsed_ms": elapsed_ms}
+
+        return list(await asyncio.gather(*(probe(pharma_id, host) for pharma_id, host in hosts.items())))
+
+
+_clients: dict[str, DataSnapClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    host: str,
+    timeout: float = 10.0,
+    retries: int = 3,
+    max_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+) -> DataSnapClient:
+    """Return the process-wide keep-alive client for ``host``, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = DataSnapClient(
+                host,
+                timeout=timeout,
+                retries=retries,
+                max_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            )
+            _clients[host] = client
+        return client
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -1,13 +1,75 @@
 from __future__ import annotations
 
 import os
+from contextlib import AbstractContextManager
+from typing import Any
 
 import psycopg
+from psycopg_pool import ConnectionPool
 
+_pool: ConnectionPool | None = None
 
-def get_connection() -> psycopg.Connection:
-    database_url = os.environ.get("DATABASE_URL", "postgresql://ia:ia@db:5432/ia_pharma")
-    return psycopg.connect(database_url, autocommit=True)
+
+def _database_url() -> str:
+    return os.environ.get("DATABASE_URL", "postgresql://ia:ia@db:5432/ia_pharma")
+
+
+def open_pool() -> ConnectionPool:
+    """Create the process-wide pool. Connections are opened in the background."""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            _database_url(),
+            kwargs={"autocommit": True},
+            min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            max_idle=float(os.environ.get("DB_POOL_MAX_IDLE", "300")),
+            max_lifetime=float(os.environ.get("DB_POOL_MAX_LIFETIME", "3600")),
+            name="api",
+            open=False,
+        )
+        _pool.open(wait=False)
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def get_connection() -> AbstractContextManager[psycopg.Connection]:
+    """Borrow a pooled connection, or open a direct one when no pool is running."""
+    if _pool is not None:
+        return _pool.connection()
+    return psycopg.connect(_database_url(), autocommit=True)
+
+
+def pool_stats() -> dict[str, Any]:
+    if _pool is None:
+        return {"enabled": False}
+    stats = _pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    requests = stats.get("requests_num", 0)
+    wait_ms = stats.get("requests_wait_ms", 0)
+    return {
+        "enabled": True,
+        "min_size": _pool.min_size,
+        "max_size": _pool.max_size,
+        "size": size,
+        "in_use": size - available,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": requests,
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "wait_ms_total": wait_ms,
+        "wait_ms_avg": round(wait_ms / requests, 3) if requests else 0.0,
+        "usage_ms_total": stats.get("usage_ms", 0),
+    }
 
 
 def check_connection() -> bool:
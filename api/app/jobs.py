@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import httpx
+from psycopg.types.json import Json
+
+from .cache import kpi_cache
+from .config import get_datasnap_settings, get_pharmacy_hosts
+from .datasnap import get_client
+from .db import get_connection
+
+_JOB_COLUMNS = """
+    id, pharma_id, dataset, request, status, rows_done, pages_done, result, error,
+    created_at, started_at, finished_at, updated_at
+"""
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _job_from_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "pharma_id": row[1],
+        "dataset": row[2],
+        "request": row[3],
+        "status": row[4],
+        "progress": {"rows": row[5], "pages": row[6]},
+        "result": row[7],
+        "error": row[8],
+        "created_at": row[9].isoformat() if row[9] else None,
+        "started_at": row[10].isoformat() if row[10] else None,
+        "finished_at": row[11].isoformat() if row[11] else None,
+        "updated_at": row[12].isoformat() if row[12] else None,
+    }
+
+
+def start_workers() -> None:
+    global _executor
+    if _executor is None:
+        workers = int(os.environ.get("EXTRACT_JOB_WORKERS", "4"))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract-job")
+
+
+def stop_workers() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def get_job(job_id: int) -> dict[str, Any] | None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {_JOB_COLUMNS} FROM staging.extract_jobs WHERE id = %s", (job_id,))
+            row = cur.fetchone()
+    return _job_from_row(row) if row else None
+
+
+def list_jobs(pharma_id: str | None = None, status: str | None = None, limit: int = 50) -> list[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {_JOB_COLUMNS}
+                FROM staging.extract_jobs
+                WHERE (%s::text IS NULL OR pharma_id = %s)
+                AND (%s::text IS NULL OR status = %s)
+                ORDER BY created_at DESC
+                LIMIT %s
+                """,
+                (pharma_id, pharma_id, status, status, limit),
+            )
+            rows = cur.fetchall()
+    return [_job_from_row(row) for row in rows]
+
+
+def submit_extraction(pharma_id: str, dataset: str, request: dict[str, Any]) -> dict[str, Any]:
+    """Record a queued extraction job and hand it to the background workers."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO staging.extract_jobs (pharma_id, dataset, request)
+                VALUES (%s, %s, %s)
+                RETURNING {_JOB_COLUMNS}
+                """,
+                (pharma_id, dataset, Json(request)),
+            )
+            job = _job_from_row(cur.fetchone())
+    _schedule(job["id"])
+    return job
+
+
+def _runner() -> str:
+    """Who runs the jobs this process claims: the extractor service, or this API host itself."""
+    if os.environ.get("EXTRACTOR_URL"):
+        return "extractor"
+    return f"api@{socket.gethostname()}"
+
+
+def resume_jobs() -> int:
+    """Re-schedule jobs still queued when the API last stopped.
+
+    Jobs this host was running itself (direct DataSnap path) died with it and
+    are queued again. Other running jobs that have not reported progress within
+    ``EXTRACT_JOB_TIMEOUT`` are marked failed; anything more recent is left to
+    the extractor to finish.
+    """
+    timeout = float(os.environ.get("EXTRACT_JOB_TIMEOUT", "3600"))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE staging.extract_jobs
+                SET status = 'queued', runner = NULL, started_at = NULL, updated_at = NOW()
+                WHERE status = 'running' AND runner = %s
+                """,
+                (f"api@{socket.gethostname()}",),
+            )
+            cur.execute(
+                """
+                UPDATE staging.extract_jobs
+                SET status = 'failed',
+                    error = 'Interrupted: no progress before the API restarted',
+                    finished_at = NOW(),
+                    updated_at = NOW()
+                WHERE status = 'running' AND updated_at < NOW() - make_interval(secs => %s)
+                """,
+                (timeout,),
+            )
+            cur.execute("SELECT id FROM staging.extract_jobs WHERE status = 'queued' ORDER BY id")
+            job_ids = [row[0] for row in cur.fetchall()]
+    for job_id in job_ids:
+        _schedule(job_id)
+    return len(job_ids)
+
+
+def _schedule(job_id: int) -> None:
+    start_workers()
+    assert _executor is not None
+    _executor.submit(_run_job, job_id)
+
+
+def _update_job(job_id: int, sql: str, params: tuple[Any, ...]) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (*params, job_id))
+
+
+def _claim_job(job_id: int) -> dict[str, Any] | None:
+    """Move a queued job to running; ``None`` if another worker or process got it first."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE staging.extract_jobs
+                SET status = 'running', runner = %s, started_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND status = 'queued'
+                RETURNING {_JOB_COLUMNS}
+                """,
+                (_runner(), job_id),
+            )
+            row = cur.fetchone()
+    return _job_from_row(row) if row else None
+
+
+def _run_job(job_id: int) -> None:
+    job = _claim_job(job_id)
+    if job is None:
+        return
+    try:
+        result = _execute(job)
+    except Exception as exc:
+        _update_job(
+            job_id,
+            """
+            UPDATE staging.extract_jobs
+            SET status = 'failed', error = %s, finished_at = NOW(), updated_at = NOW()
+            WHERE id = %s AND status NOT IN ('succeeded', 'failed')
+            """,
+            (_error_detail(exc),),
+        )
+        return
+    _update_job(
+        job_id,
+        """
+        UPDATE staging.extract_jobs
+        SET status = 'succeeded',
+            result = %s,
+            rows_done = GREATEST(rows_done, %s),
+            pages_done = GREATEST(pages_done, %s),
+            finished_at = COALESCE(finished_at, NOW()),
+            updated_at = NOW()
+        WHERE id = %s
+        """,
+        (Json(result), int(result.get("rows") or 0), int(result.get("pages") or 0)),
+    )
+    kpi_cache.invalidate(job["pharma_id"])
+
+
+_EXTRACTOR_ONLY = ("page_size", "key_column", "cursor_column", "row_level", "full_resync")
+
+
+def _execute(job: dict[str, Any]) -> dict[str, Any]:
+    request = job["request"]
+    extractor_url = os.environ.get("EXTRACTOR_URL")
+    if extractor_url:
+        # The extractor reports page progress and the final outcome on the job row
+        # itself, so the job completes even if this API process goes away.
+        url = f"{extractor_url}/extract/{job['pharma_id']}/{job['dataset']}"
+        timeout = float(os.environ.get("EXTRACT_JOB_TIMEOUT", "3600"))
+        response = httpx.post(url, json={**request, "job_id": job["id"]}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    # Paging, incremental cursors and row-level staging live in the extractor only.
+    unsupported = [name for name in _EXTRACTOR_ONLY if request.get(name)]
+    if unsupported:
+        raise RuntimeError(f"{', '.join(unsupported)} require the extractor service (set EXTRACTOR_URL)")
+    host = get_pharmacy_hosts().get(job["pharma_id"])
+    if not host:
+        raise RuntimeError(f"Unknown pharmacy '{job['pharma_id']}'")
+    client = get_client(host, **get_datasnap_settings())
+    payload: dict[str, Any] = {"sql": request["sql"]}
+    if request.get("params"):
+        payload["params"] = request["params"]
+    response = client.call("query_thread", payload)
+    rows = response.result if isinstance(response.result, list) else [response.result]
+    return {
+        "pharma_id": job["pharma_id"],
+        "dataset": job["dataset"],
+        "rows": len(rows),
+        "pages": 1,
+        "result": response.result,
+    }
+
+
+def _error_detail(exc: Exception) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"{exc}: {exc.response.text}"
+    return f"{type(exc).__name__}: {exc}"
@@ -1,104 +1,526 @@
 from __future__ import annotations
 
+import base64
+import json
 from datetime import date
-from typing import Any
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Iterator
 
+from .cache import kpi_cache
 from .db import get_connection
 
 
-def refresh_sales_daily(pharma_id: str) -> None:
-    sql = """
-    INSERT INTO mart.sales_daily (pharma_id, sales_date, gross_revenue, estimated_margin, ticket_count)
-    SELECT
-        %s as pharma_id,
-        (payload->>'date')::date as sales_date,
-        (payload->>'gross_revenue')::numeric as gross_revenue,
-        (payload->>'estimated_margin')::numeric as estimated_margin,
-        (payload->>'ticket_count')::int as ticket_count
-    FROM staging.sales_raw
-    WHERE pharma_id = %s;
+def refresh_sales_daily(pharma_id: str, full: bool = False) -> dict[str, Any]:
+    """Upsert ``mart.sales_daily`` from the staging rows added since the last refresh.
+
+    Progress is tracked per pharmacy in ``mart.refresh_state`` as the snapshot
+    xmin of the last refresh: every staging row written by a transaction still
+    running then (``txid >= last_xmin``) is read again, so a row committed
+    after a higher id is never skipped. When several staging rows cover the
+    same day, the highest id wins, also across refreshes. ``full`` replays the
+    whole staging history.
     """
     with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, (pharma_id, pharma_id))
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO mart.refresh_state (pharma_id, mart_table)
+                    VALUES (%s, 'sales_daily')
+                    ON CONFLICT (pharma_id, mart_table) DO NOTHING
+                    """,
+                    (pharma_id,),
+                )
+                cur.execute(
+                    """
+                    SELECT last_xmin::text FROM mart.refresh_state
+                    WHERE pharma_id = %s AND mart_table = 'sales_daily'
+                    FOR UPDATE
+                    """,
+                    (pharma_id,),
+                )
+                last_xmin = cur.fetchone()[0]
+                since_xmin = "0" if full else last_xmin
+                # Taken before reading staging: any transaction this read cannot
+                # see yet has an xid >= until_xmin and is read by the next refresh.
+                cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+                until_xmin = cur.fetchone()[0]
+                cur.execute(
+                    """
+                    INSERT INTO mart.sales_daily (
+                        pharma_id, sales_date, gross_revenue, estimated_margin, ticket_count, staging_id
+                    )
+                    SELECT DISTINCT ON ((payload->>'date')::date)
+                        pharma_id,
+                        (payload->>'date')::date as sales_date,
+                        (payload->>'gross_revenue')::numeric as gross_revenue,
+                        (payload->>'estimated_margin')::numeric as estimated_margin,
+                        (payload->>'ticket_count')::int as ticket_count,
+                        id
+                    FROM staging.sales_raw
+                    WHERE pharma_id = %s
+                    AND txid >= %s::xid8
+                    AND payload ? 'date'
+                    ORDER BY (payload->>'date')::date, id DESC
+                    ON CONFLICT (pharma_id, sales_date) DO UPDATE
+                    SET gross_revenue = EXCLUDED.gross_revenue,
+                        estimated_margin = EXCLUDED.estimated_margin,
+                        ticket_count = EXCLUDED.ticket_count,
+                        staging_id = EXCLUDED.staging_id,
+                        updated_at = NOW()
+                    WHERE mart.sales_daily.staging_id IS NULL
+                    OR mart.sales_daily.staging_id <= EXCLUDED.staging_id
+                    RETURNING sales_date
+                    """,
+                    (pharma_id, since_xmin),
+                )
+                touched = [row[0] for row in cur.fetchall()]
+                _refresh_rollups(cur, pharma_id, touched)
+                cur.execute(
+                    """
+                    UPDATE mart.refresh_state
+                    SET last_xmin = %s::xid8, refreshed_at = NOW()
+                    WHERE pharma_id = %s AND mart_table = 'sales_daily'
+                    """,
+                    (until_xmin, pharma_id),
+                )
+    kpi_cache.invalidate(pharma_id)
+    return {
+        "pharma_id": pharma_id,
+        "from_xmin": since_xmin,
+        "to_xmin": until_xmin,
+        "days_upserted": len(touched),
+    }
 
 
-def get_sales_kpi(pharma_id: str, start: date | None, end: date | None) -> list[dict[str, Any]]:
-    sql = """
-    SELECT sales_date, gross_revenue, estimated_margin, ticket_count
-    FROM mart.sales_daily
-    WHERE pharma_id = %s
-    AND (%s::date IS NULL OR sales_date >= %s::date)
-    AND (%s::date IS NULL OR sales_date <= %s::date)
-    ORDER BY sales_date DESC;
+ROLLUP_GRAINS = ("week", "month", "year")
+
+
+def _refresh_rollups(cur: Any, pharma_id: str, days: list[date]) -> None:
+    """Recompute the week/month/year rollup rows covering ``days`` from ``mart.sales_daily``."""
+    if not days:
+        return
+    for grain in ROLLUP_GRAINS:
+        cur.execute(
+            """
+            INSERT INTO mart.sales_rollup
+                (pharma_id, grain, period_start, gross_revenue, estimated_margin, ticket_count, day_count)
+            SELECT d.pharma_id, %(grain)s::text, p.period_start,
+                SUM(d.gross_revenue), SUM(d.estimated_margin), SUM(d.ticket_count), COUNT(*)
+            FROM (
+                SELECT DISTINCT date_trunc(%(grain)s::text, day)::date AS period_start
+                FROM unnest(%(days)s::date[]) AS day
+            ) AS p
+            JOIN mart.sales_daily d
+                ON d.pharma_id = %(pharma_id)s
+                AND d.sales_date >= p.period_start
+                AND d.sales_date < p.period_start + ('1 ' || %(grain)s::text)::interval
+            GROUP BY d.pharma_id, p.period_start
+            ON CONFLICT (pharma_id, grain, period_start) DO UPDATE
+            SET gross_revenue = EXCLUDED.gross_revenue,
+                estimated_margin = EXCLUDED.estimated_margin,
+                ticket_count = EXCLUDED.ticket_count,
+                day_count = EXCLUDED.day_count,
+                updated_at = NOW()
+            """,
+            {"grain": grain, "days": days, "pharma_id": pharma_id},
+        )
+
+
+def choose_granularity(start: date | None, end: date | None) -> str:
+    """Pick the coarsest grain that still gives a readable series for the range."""
+    if start is None or end is None:
+        return "month"
+    span = (end - start).days
+    if span <= 62:
+        return "day"
+    if span <= 366:
+        return "week"
+    if span <= 5 * 366:
+        return "month"
+    return "year"
+
+
+SALES_ROLLUP_SQL = """
+WITH params AS (
+    SELECT %(start)s::date AS start_date,
+           %(end)s::date AS end_date,
+           ('1 ' || %(grain)s::text)::interval AS span,
+           date_trunc(%(grain)s::text, %(start)s::date)::date AS first_period,
+           date_trunc(%(grain)s::text, %(end)s::date)::date AS last_period
+), whole AS (
+    SELECT r.period_start, (r.period_start + p.span)::date - 1 AS period_end,
+        r.gross_revenue, r.estimated_margin, r.ticket_count, r.day_count, FALSE AS partial
+    FROM mart.sales_rollup r, params p
+    WHERE r.pharma_id = %(pharma_id)s
+    AND r.grain = %(grain)s
+    AND (p.start_date IS NULL OR r.period_start >= p.start_date)
+    AND (p.end_date IS NULL OR (r.period_start + p.span)::date - 1 <= p.end_date)
+), edges AS (
+    -- Periods cut by the range are summed from the days inside it.
+    SELECT GREATEST(date_trunc(%(grain)s::text, d.sales_date)::date, p.start_date) AS period_start,
+        LEAST((date_trunc(%(grain)s::text, d.sales_date) + p.span)::date - 1, p.end_date) AS period_end,
+        SUM(d.gross_revenue), SUM(d.estimated_margin), SUM(d.ticket_count), COUNT(*), TRUE
+    FROM mart.sales_daily d, params p
+    WHERE d.pharma_id = %(pharma_id)s
+    AND (p.start_date IS NULL OR d.sales_date >= p.start_date)
+    AND (p.end_date IS NULL OR d.sales_date <= p.end_date)
+    AND (
+        (p.start_date > p.first_period AND d.sales_date < (p.first_period + p.span)::date)
+        OR (p.end_date < (p.last_period + p.span)::date - 1 AND d.sales_date >= p.last_period)
+    )
+    GROUP BY 1, 2
+)
+SELECT * FROM whole
+UNION ALL
+SELECT * FROM edges
+ORDER BY period_start DESC;
+"""
+
+
+def get_sales_rollup(pharma_id: str, grain: str, start: date | None, end: date | None) -> list[dict[str, Any]]:
+    """Return the periods of ``grain`` covering the range, newest first.
+
+    Periods entirely inside the range come from ``mart.sales_rollup``; a period
+    cut by ``start`` or ``end`` is summed from ``mart.sales_daily`` over the
+    days inside the range only, and flagged ``partial`` with its real bounds.
     """
+    params = {"pharma_id": pharma_id, "grain": grain, "start": start, "end": end}
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, (pharma_id, start, start, end, end))
+            cur.execute(SALES_ROLLUP_SQL, params)
             rows = cur.fetchall()
     return [
         {
-            "sales_date": row[0].isoformat(),
-            "gross_revenue": float(row[1]) if row[1] is not None else None,
-            "estimated_margin": float(row[2]) if row[2] is not None else None,
-            "ticket_count": row[3],
+            "period_start": row[0].isoformat(),
+            "period_end": row[1].isoformat(),
+            "gross_revenue": float(row[2]) if row[2] is not None else None,
+            "estimated_margin": float(row[3]) if row[3] is not None else None,
+            "ticket_count": row[4],
+            "day_count": row[5],
+            "partial": row[6],
         }
         for row in rows
     ]
 
 
-def get_stock_alerts(pharma_id: str) -> list[dict[str, Any]]:
-    sql = """
-    SELECT product_code, product_name, stock_qty, coverage_days, status
-    FROM mart.stock_status
-    WHERE pharma_id = %s
-    ORDER BY coverage_days DESC NULLS LAST;
+SALES_DAILY_SQL = """
+SELECT sales_date, gross_revenue, estimated_margin, ticket_count
+FROM mart.sales_daily
+WHERE pharma_id = %s
+AND (%s::date IS NULL OR sales_date >= %s::date)
+AND (%s::date IS NULL OR sales_date <= %s::date)
+ORDER BY sales_date DESC;
+"""
+
+
+def _sales_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    return {
+        "sales_date": row[0].isoformat(),
+        "gross_revenue": float(row[1]) if row[1] is not None else None,
+        "estimated_margin": float(row[2]) if row[2] is not None else None,
+        "ticket_count": row[3],
+    }
+
+
+def get_sales_kpi(pharma_id: str, start: date | None, end: date | None) -> list[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SALES_DAILY_SQL, (pharma_id, start, start, end, end))
+            rows = cur.fetchall()
+    return [_sales_row(row) for row in rows]
+
+
+def iter_sales_kpi(pharma_id: str, start: date | None, end: date | None) -> Iterator[dict[str, Any]]:
+    return _stream_rows(SALES_DAILY_SQL, (pharma_id, start, start, end, end), _sales_row)
+
+
+def _stream_rows(
+    sql: str,
+    params: Any,
+    mapper: Callable[[tuple[Any, ...]], dict[str, Any]],
+) -> Iterator[dict[str, Any]]:
+    """Yield mapped rows as the server sends them, without buffering the result set."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for row in cur.stream(sql, params):
+                yield mapper(row)
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _stock_alerts_query(
+    pharma_id: str,
+    status: str | None,
+    snapshot_date: date | None,
+    limit: int | None,
+    cursor: str | None,
+) -> tuple[str, dict[str, Any]]:
+    conditions = ["pharma_id = %(pharma_id)s"]
+    params: dict[str, Any] = {"pharma_id": pharma_id, "limit": limit}
+    if status is not None:
+        conditions.append("status = %(status)s")
+        params["status"] = status
+    if snapshot_date is not None:
+        conditions.append("snapshot_date = %(snapshot_date)s")
+        params["snapshot_date"] = snapshot_date
+    columns = "id, product_code, product_name, stock_qty, coverage_days, status"
+    order = "ORDER BY coverage_days DESC NULLS LAST, id DESC"
+    where = " AND ".join(conditions)
+    if cursor is None:
+        sql = f"SELECT {columns} FROM mart.stock_status WHERE {where} {order} LIMIT %(limit)s;"
+        return sql, params
+    after_coverage, params["after_id"] = decode_cursor(cursor, 2)
+    if after_coverage is None:
+        sql = f"""
+        SELECT {columns} FROM mart.stock_status
+        WHERE {where} AND coverage_days IS NULL AND id < %(after_id)s
+        {order}
+        LIMIT %(limit)s;
+        """
+        return sql, params
+    try:
+        params["after_coverage"] = str(Decimal(str(after_coverage)))
+    except InvalidOperation as exc:
+        raise ValueError("Invalid cursor") from exc
+    # A row comparison is an index bound on (coverage_days DESC, id DESC), unlike
+    # an OR chain; rows without coverage sort last and come from their own branch.
+    sql = f"""
+    SELECT {columns} FROM (
+        (SELECT {columns} FROM mart.stock_status
+         WHERE {where} AND (coverage_days, id) < (%(after_coverage)s::numeric, %(after_id)s)
+         {order}
+         LIMIT %(limit)s)
+        UNION ALL
+        (SELECT {columns} FROM mart.stock_status
+         WHERE {where} AND coverage_days IS NULL
+         {order}
+         LIMIT %(limit)s)
+    ) AS page
+    {order}
+    LIMIT %(limit)s;
     """
+    return sql, params
+
+
+def _stock_alert_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "product_code": row[1],
+        "product_name": row[2],
+        "stock_qty": float(row[3]) if row[3] is not None else None,
+        "coverage_days": float(row[4]) if row[4] is not None else None,
+        "status": row[5],
+    }
+
+
+def get_stock_alerts(
+    pharma_id: str,
+    status: str | None = None,
+    snapshot_date: date | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list[dict[str, Any]]:
+    """Stock rows by decreasing coverage, optionally filtered and keyset-paginated.
+
+    ``cursor`` is the value returned as ``next_cursor`` for the previous page.
+    """
+    sql, params = _stock_alerts_query(pharma_id, status, snapshot_date, limit, cursor)
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, (pharma_id,))
+            cur.execute(sql, params)
             rows = cur.fetchall()
-    return [
-        {
-            "product_code": row[0],
-            "product_name": row[1],
-            "stock_qty": float(row[2]) if row[2] is not None else None,
-            "coverage_days": float(row[3]) if row[3] is not None else None,
-            "status": row[4],
-        }
-        for row in rows
-    ]
+    return [_stock_alert_row(row) for row in rows]
+
 
+def get_stock_alerts_page(
+    pharma_id: str,
+    status: str | None,
+    snapshot_date: date | None,
+    limit: int,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """One keyset page of stock alerts with the ``next_cursor`` of the following one.
 
-def get_purchase_changes(pharma_id: str) -> list[dict[str, Any]]:
-    sql = """
-    SELECT product_code, previous_price, latest_price, change_pct, detected_at
+    The cursor carries ``coverage_days`` as the exact numeric text, so a deep
+    page resumes exactly where the previous one stopped.
+    """
+    sql, params = _stock_alerts_query(pharma_id, status, snapshot_date, limit + 1, cursor)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(None if last[4] is None else str(last[4]), last[0])
+    return {"items": [_stock_alert_row(row) for row in rows], "next_cursor": next_cursor}
+
+
+def iter_stock_alerts(
+    pharma_id: str,
+    status: str | None = None,
+    snapshot_date: date | None = None,
+) -> Iterator[dict[str, Any]]:
+    sql, params = _stock_alerts_query(pharma_id, status, snapshot_date, None, None)
+    return _stream_rows(sql, params, _stock_alert_row)
+
+
+def _purchase_changes_query(
+    pharma_id: str,
+    min_change_pct: float | None,
+    start: date | None,
+    end: date | None,
+    limit: int | None,
+    cursor: str | None,
+) -> tuple[str, dict[str, Any]]:
+    conditions = ["pharma_id = %(pharma_id)s"]
+    params: dict[str, Any] = {"pharma_id": pharma_id, "limit": limit}
+    if min_change_pct is not None:
+        conditions.append("change_pct >= %(min_change_pct)s")
+        params["min_change_pct"] = min_change_pct
+    if start is not None:
+        conditions.append("detected_at >= %(start)s::date")
+        params["start"] = start
+    if end is not None:
+        conditions.append("detected_at < %(end)s::date + 1")
+        params["end"] = end
+    if cursor is not None:
+        params["after_detected"], params["after_id"] = decode_cursor(cursor, 2)
+        conditions.append("(detected_at, id) < (%(after_detected)s::timestamptz, %(after_id)s)")
+    sql = f"""
+    SELECT id, product_code, previous_price, latest_price, change_pct, detected_at
     FROM mart.purchase_price_changes
-    WHERE pharma_id = %s
-    ORDER BY detected_at DESC;
+    WHERE {" AND ".join(conditions)}
+    ORDER BY detected_at DESC, id DESC
+    LIMIT %(limit)s;
     """
+    return sql, params
+
+
+def _purchase_change_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "product_code": row[1],
+        "previous_price": float(row[2]) if row[2] is not None else None,
+        "latest_price": float(row[3]) if row[3] is not None else None,
+        "change_pct": float(row[4]) if row[4] is not None else None,
+        "detected_at": row[5].isoformat() if row[5] else None,
+    }
+
+
+def get_purchase_changes(
+    pharma_id: str,
+    min_change_pct: float | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list[dict[str, Any]]:
+    """Price changes, newest first, optionally filtered and keyset-paginated."""
+    sql, params = _purchase_changes_query(pharma_id, min_change_pct, start, end, limit, cursor)
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, (pharma_id,))
+            cur.execute(sql, params)
             rows = cur.fetchall()
-    return [
-        {
-            "product_code": row[0],
-            "previous_price": float(row[1]) if row[1] is not None else None,
-            "latest_price": float(row[2]) if row[2] is not None else None,
-            "change_pct": float(row[3]) if row[3] is not None else None,
-            "detected_at": row[4].isoformat() if row[4] else None,
-        }
-        for row in rows
-    ]
+    return [_purchase_change_row(row) for row in rows]
+
+
+def iter_purchase_changes(
+    pharma_id: str,
+    min_change_pct: float | None = None,
+    start: date | None = None,
+    end: date | None = None,
+) -> Iterator[dict[str, Any]]:
+    sql, params = _purchase_changes_query(pharma_id, min_change_pct, start, end, None, None)
+    return _stream_rows(sql, params, _purchase_change_row)
+
+
+def kpi_data_version(pharma_id: str) -> int:
+    """Version of the pharmacy's KPI marts, bumped by a trigger on every write to them.
+
+    Cached KPI payloads are keyed by it, so a refresh or load done by another
+    process (the extractor, another API worker) is seen on the next request.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM mart.data_versions WHERE pharma_id = %s", (pharma_id,))
+            row = cur.fetchone()
+    return row[0] if row else 0
 
 
 def build_kpi_summary(pharma_id: str, start: date | None, end: date | None) -> dict[str, Any]:
-    sales = get_sales_kpi(pharma_id, start, end)
-    stock = get_stock_alerts(pharma_id)
-    purchases = get_purchase_changes(pharma_id)
+    return kpi_cache.get_or_load(
+        (pharma_id, kpi_data_version(pharma_id), "summary", start, end),
+        lambda: _load_kpi_summary(pharma_id, start, end),
+    )
+
+
+SUMMARY_SQL = """
+SELECT
+    (
+        SELECT COALESCE(json_agg(s ORDER BY s.sales_date DESC), '[]'::json)
+        FROM (
+            SELECT sales_date, gross_revenue::float8 AS gross_revenue,
+                estimated_margin::float8 AS estimated_margin, ticket_count
+            FROM mart.sales_daily
+            WHERE pharma_id = %(pharma_id)s
+            AND (%(start)s::date IS NULL OR sales_date >= %(start)s::date)
+            AND (%(end)s::date IS NULL OR sales_date <= %(end)s::date)
+            ORDER BY sales_date DESC
+            LIMIT %(limit)s
+        ) s
+    ),
+    (
+        SELECT COALESCE(json_agg(a ORDER BY a.coverage_days DESC NULLS LAST), '[]'::json)
+        FROM (
+            SELECT product_code, product_name, stock_qty::float8 AS stock_qty,
+                coverage_days::float8 AS coverage_days, status
+            FROM mart.stock_status
+            WHERE pharma_id = %(pharma_id)s
+            ORDER BY coverage_days DESC NULLS LAST
+            LIMIT %(limit)s
+        ) a
+    ),
+    (
+        SELECT COALESCE(json_agg(p ORDER BY p.detected_at DESC), '[]'::json)
+        FROM (
+            SELECT product_code, previous_price::float8 AS previous_price,
+                latest_price::float8 AS latest_price, change_pct::float8 AS change_pct, detected_at
+            FROM mart.purchase_price_changes
+            WHERE pharma_id = %(pharma_id)s
+            ORDER BY detected_at DESC
+            LIMIT %(limit)s
+        ) p
+    );
+"""
+
+
+def _load_kpi_summary(
+    pharma_id: str, start: date | None, end: date | None, limit: int = 5
+) -> dict[str, Any]:
+    """Fetch the top rows of the three KPI sections in a single query, with the limits applied in SQL."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SUMMARY_SQL, {"pharma_id": pharma_id, "start": start, "end": end, "limit": limit})
+            sales, stock, purchases = cur.fetchone()
     return {
-        "sales": sales[:5],
-        "stock_alerts": stock[:5],
-        "purchase_changes": purchases[:5],
+        "sales": sales,
+        "stock_alerts": stock,
+        "purchase_changes": purchases,
     }
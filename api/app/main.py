@@ -2,22 +2,56 @@ from __future__ import annotations
 
 import json
 import os
+import time
 import traceback
 from datetime import date
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, Literal
 
-import httpx
 from fastapi import Body, FastAPI, File, Form, HTTPException, Query, Request, UploadFile
-from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-
-from .config import get_pharmacy_hosts
-from .datasnap import DataSnapClient, DataSnapError
-from .db import check_connection
-from .kpi import get_purchase_changes, get_sales_kpi, get_stock_alerts
-from .rag.service import RagSettings, answer_question, index_folder, load_rag_settings
+from pydantic import BaseModel, Field
+
+from .cache import etag_matches, kpi_cache, payload_etag, rag_embedding_cache, rag_search_cache
+from .config import get_datasnap_settings, get_pharmacy_hosts
+from .datasnap import DataSnapClient, DataSnapError, close_clients, get_client, probe_hosts
+from .db import check_connection, close_pool, open_pool, pool_stats
+from .jobs import get_job, list_jobs, resume_jobs, start_workers, stop_workers, submit_extraction
+from .kpi import (
+    choose_granularity,
+    encode_cursor,
+    get_purchase_changes,
+    get_sales_kpi,
+    get_sales_rollup,
+    get_stock_alerts_page,
+    iter_purchase_changes,
+    iter_sales_kpi,
+    iter_stock_alerts,
+    kpi_data_version,
+    refresh_sales_daily,
+)
+from .rag.service import (
+    RagSettings,
+    answer_question,
+    index_files,
+    index_folder,
+    load_rag_settings,
+    shutdown_parse_pool,
+)
+from .rag.ann import build_vector_index, vector_index_info
+from .rag.collections import (
+    activate_collection,
+    create_collection,
+    delete_collection,
+    get_collection,
+    list_collections,
+    resume_reembedding,
+    start_reembed_workers,
+    stop_reembed_workers,
+)
+from .rag.retrieval import SearchOptions, search_documents
+from .rag.uploads import UploadTooLarge, safe_filename, save_upload, upload_limits, upload_request_limit
 from .table_descriptions import (
     get_table_description,
     list_table_descriptions,
@@ -31,6 +65,7 @@ from .query_catalog import (
     write_catalog_content,
 )
 from .query_store import create_query, delete_query, get_query, list_queries, update_query
+from .streaming import negotiate_format, stream_rows
 
 app = FastAPI(title="Assistant IA Pharmacie API")
 
@@ -41,6 +76,29 @@ if static_dir.exists():
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 
+@app.on_event("startup")
+def open_db_pool() -> None:
+    open_pool()
+
+
+@app.on_event("startup")
+def start_extract_jobs() -> None:
+    start_workers()
+    try:
+        resume_jobs()
+    except Exception:
+        return
+
+
+@app.on_event("startup")
+def start_rag_reembedding() -> None:
+    start_reembed_workers()
+    try:
+        resume_reembedding()
+    except Exception:
+        return
+
+
 @app.on_event("startup")
 def seed_catalog_queries() -> None:
     try:
@@ -55,9 +113,39 @@ def seed_catalog_queries() -> None:
     import_catalog_queries(content)
 
 
+@app.on_event("shutdown")
+def close_datasnap_clients() -> None:
+    close_clients()
+
+
+@app.on_event("shutdown")
+def stop_extract_jobs() -> None:
+    stop_workers()
+
+
+@app.on_event("shutdown")
+def stop_rag_parse_pool() -> None:
+    shutdown_parse_pool()
+
+
+@app.on_event("shutdown")
+def stop_rag_reembedding() -> None:
+    stop_reembed_workers()
+
+
+@app.on_event("shutdown")
+def close_db_pool() -> None:
+    close_pool()
+
+
 class ExtractPayload(BaseModel):
     sql: str
     params: dict | None = None
+    page_size: int | None = None
+    key_column: str | None = None
+    row_level: bool = False
+    cursor_column: str | None = None
+    full_resync: bool = False
 
 
 class RagIndexPayload(BaseModel):
@@ -65,9 +153,49 @@ class RagIndexPayload(BaseModel):
     path: str
 
 
-class RagAskPayload(BaseModel):
+class VectorIndexPayload(BaseModel):
+    method: Literal["ivfflat", "hnsw"] = "ivfflat"
+    pharma_id: str | None = None
+    collection_id: int | None = None
+    quantization: Literal["none", "halfvec", "binary"] | None = None
+    lists: int | None = Field(None, ge=1)
+    m: int = Field(16, ge=2, le=100)
+    ef_construction: int = Field(64, ge=4, le=1000)
+    maintenance_work_mem: str | None = None
+
+
+class EmbeddingCollectionPayload(BaseModel):
+    backend: str = "hashing"
+    dim: int = Field(128, ge=1, le=16000)
+    activate: bool = True
+    index_method: Literal["ivfflat", "hnsw"] = "ivfflat"
+    quantization: Literal["none", "halfvec", "binary"] = "none"
+
+
+class RagSearchPayload(BaseModel):
     pharma_id: str
     question: str
+    k: int | None = Field(None, ge=1, le=50)
+    mode: Literal["vector", "text", "hybrid"] | None = None
+    vector_weight: float | None = Field(None, ge=0)
+    text_weight: float | None = Field(None, ge=0)
+    probes: int | None = Field(None, ge=1)
+    ef_search: int | None = Field(None, ge=1, le=1000)
+    rerank_factor: int | None = Field(None, ge=1, le=50)
+
+    def search_options(self) -> SearchOptions:
+        return rag_settings.search.with_overrides(
+            k=self.k,
+            mode=self.mode,
+            vector_weight=self.vector_weight,
+            text_weight=self.text_weight,
+            probes=self.probes,
+            ef_search=self.ef_search,
+            rerank_factor=self.rerank_factor,
+        )
+
+
+class RagAskPayload(RagSearchPayload):
     start: date | None = None
     end: date | None = None
 
@@ -75,6 +203,7 @@ class RagAskPayload(BaseModel):
 class SqlQueryPayload(BaseModel):
     pharma_id: str
     sql: str
+    format: Literal["json", "ndjson", "csv"] | None = None
 
 
 class EnvUpdatePayload(BaseModel):
@@ -257,77 +386,219 @@ def health() -> dict[str, Any]:
     return {"status": "ok", "database": check_connection()}
 
 
+@app.get("/health/db_pool")
+def health_db_pool() -> dict[str, Any]:
+    return pool_stats()
+
+
+@app.get("/health/kpi_cache")
+def health_kpi_cache() -> dict[str, Any]:
+    return kpi_cache.stats()
+
+
+@app.get("/health/rag_cache")
+def health_rag_cache() -> dict[str, Any]:
+    return {"embeddings": rag_embedding_cache.stats(), "search": rag_search_cache.stats()}
+
+
 @app.get("/pharmacies/test")
-def pharmacies_test() -> dict[str, Any]:
-    results = []
-    for pharma_id, host in get_pharmacy_hosts().items():
-        url = f"http://{host}:8001/test/"
-        try:
-            response = httpx.get(url, timeout=5)
-            ok = response.status_code == 200
-            detail = f"HTTP {response.status_code}"
-        except httpx.HTTPError as exc:
-            ok = False
-            detail = str(exc)
-        results.append({"pharma_id": pharma_id, "host": host, "ok": ok, "detail": detail})
-    return {"items": results}
+async def pharmacies_test() -> dict[str, Any]:
+    started = time.perf_counter()
+    results = await probe_hosts(get_pharmacy_hosts(), timeout=5)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return {"items": results, "elapsed_ms": elapsed_ms}
 
 
-@app.post("/extract/{pharma_id}/{dataset}")
+@app.post("/extract/{pharma_id}/{dataset}", status_code=202)
 def trigger_extract(pharma_id: str, dataset: str, payload: ExtractPayload) -> dict[str, Any]:
-    extractor_url = os.environ.get("EXTRACTOR_URL")
-    if extractor_url:
-        url = f"{extractor_url}/extract/{pharma_id}/{dataset}"
-        try:
-            response = httpx.post(url, json=payload.model_dump(), timeout=30)
-            response.raise_for_status()
-        except httpx.HTTPError as exc:
-            raise HTTPException(status_code=502, detail=str(exc)) from exc
-        return response.json()
-    hosts = get_pharmacy_hosts()
-    host = hosts.get(pharma_id)
-    if not host:
+    if not os.environ.get("EXTRACTOR_URL") and pharma_id not in get_pharmacy_hosts():
         raise HTTPException(status_code=404, detail="Unknown pharmacy")
-    client = DataSnapClient(host)
-    try:
-        response = client.call("query_thread", {"sql": payload.sql})
-    except DataSnapError as exc:
-        raise HTTPException(status_code=502, detail=str(exc)) from exc
-    return {"pharma_id": pharma_id, "dataset": dataset, "result": response.result}
+    return submit_extraction(pharma_id, dataset, payload.model_dump())
+
+
+@app.get("/jobs")
+def jobs_list(
+    pharma_id: str | None = None,
+    status: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+) -> dict[str, Any]:
+    return {"items": list_jobs(pharma_id, status, limit)}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: int) -> dict[str, Any]:
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _kpi_response(request: Request, key: tuple[Any, ...], build: Callable[[], dict[str, Any]]) -> Response:
+    """Serve a KPI payload from the cache, answering 304 when the client's ETag still matches.
+
+    ``key`` starts with the pharmacy id and is completed with its mart data
+    version, so entries cached before any write to the marts are never served.
+    """
+
+    def load() -> tuple[dict[str, Any], str]:
+        payload = build()
+        return payload, payload_etag(payload)
+
+    pharma_id, *params = key
+    payload, etag = kpi_cache.get_or_load((pharma_id, kpi_data_version(pharma_id), *params), load)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
 
 
 @app.get("/kpi/{pharma_id}/sales")
 def sales_kpi(
+    request: Request,
     pharma_id: str,
     from_: date | None = Query(None, alias="from"),
     to: date | None = Query(None, alias="to"),
+    granularity: Literal["day", "week", "month", "year", "auto"] = "day",
+    format: Literal["json", "ndjson", "csv"] | None = None,
+) -> Response:
+    grain = choose_granularity(from_, to) if granularity == "auto" else granularity
+    fmt = negotiate_format(request, format)
+    if fmt != "json":
+        if grain == "day":
+            rows = iter_sales_kpi(pharma_id, from_, to)
+        else:
+            rows = iter(get_sales_rollup(pharma_id, grain, from_, to))
+        return stream_rows(rows, fmt, f"sales_{pharma_id}_{grain}")
+
+    def build() -> dict[str, Any]:
+        if grain == "day":
+            data = get_sales_kpi(pharma_id, from_, to)
+        else:
+            data = get_sales_rollup(pharma_id, grain, from_, to)
+        return {"pharma_id": pharma_id, "granularity": grain, "items": data}
+
+    return _kpi_response(request, (pharma_id, "sales", from_, to, grain), build)
+
+
+@app.post("/kpi/{pharma_id}/refresh")
+def sales_refresh(pharma_id: str, full: bool = False) -> dict[str, Any]:
+    return refresh_sales_daily(pharma_id, full=full)
+
+
+def _keyset_page(
+    pharma_id: str,
+    rows: list[dict[str, Any]],
+    limit: int,
+    sort_key: str,
 ) -> dict[str, Any]:
-    data = get_sales_kpi(pharma_id, from_, to)
-    return {"pharma_id": pharma_id, "items": data}
+    """Trim the ``limit + 1`` rows fetched to one page and derive the cursor of the next one."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][sort_key], rows[-1]["id"])
+    return {"pharma_id": pharma_id, "items": rows, "limit": limit, "next_cursor": next_cursor}
 
 
 @app.get("/kpi/{pharma_id}/stock_alerts")
-def stock_alerts(pharma_id: str) -> dict[str, Any]:
-    data = get_stock_alerts(pharma_id)
-    return {"pharma_id": pharma_id, "items": data}
+def stock_alerts(
+    request: Request,
+    pharma_id: str,
+    status: str | None = None,
+    snapshot_date: date | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    format: Literal["json", "ndjson", "csv"] | None = None,
+) -> Response:
+    fmt = negotiate_format(request, format)
+    if fmt != "json":
+        rows = iter_stock_alerts(pharma_id, status=status, snapshot_date=snapshot_date)
+        return stream_rows(rows, fmt, f"stock_alerts_{pharma_id}")
+
+    def build() -> dict[str, Any]:
+        page = get_stock_alerts_page(
+            pharma_id, status=status, snapshot_date=snapshot_date, limit=limit, cursor=cursor
+        )
+        return {"pharma_id": pharma_id, "items": page["items"], "limit": limit, "next_cursor": page["next_cursor"]}
+
+    key = (pharma_id, "stock_alerts", status, snapshot_date, limit, cursor)
+    try:
+        return _kpi_response(request, key, build)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @app.get("/kpi/{pharma_id}/purchases")
-def purchase_changes(pharma_id: str) -> dict[str, Any]:
-    data = get_purchase_changes(pharma_id)
-    return {"pharma_id": pharma_id, "items": data}
+def purchase_changes(
+    request: Request,
+    pharma_id: str,
+    min_change_pct: float | None = None,
+    from_: date | None = Query(None, alias="from"),
+    to: date | None = Query(None, alias="to"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    format: Literal["json", "ndjson", "csv"] | None = None,
+) -> Response:
+    fmt = negotiate_format(request, format)
+    if fmt != "json":
+        rows = iter_purchase_changes(pharma_id, min_change_pct=min_change_pct, start=from_, end=to)
+        return stream_rows(rows, fmt, f"purchases_{pharma_id}")
+
+    def build() -> dict[str, Any]:
+        rows = get_purchase_changes(
+            pharma_id,
+            min_change_pct=min_change_pct,
+            start=from_,
+            end=to,
+            limit=limit + 1,
+            cursor=cursor,
+        )
+        return _keyset_page(pharma_id, rows, limit, "detected_at")
+
+    key = (pharma_id, "purchases", min_change_pct, from_, to, limit, cursor)
+    try:
+        return _kpi_response(request, key, build)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _index_response(report: dict[str, Any]) -> dict[str, Any]:
+    response: dict[str, Any] = {"status": "ok", **report}
+    if not response["errors"]:
+        del response["errors"]
+    return response
 
 
 @app.post("/rag/index")
 def rag_index(payload: RagIndexPayload) -> dict[str, Any]:
     try:
-        count, errors = index_folder(payload.pharma_id, payload.path, rag_settings)
+        report = index_folder(payload.pharma_id, payload.path, rag_settings)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
-    response: dict[str, Any] = {"status": "ok", "indexed": count}
-    if errors:
-        response["errors"] = errors
-    return response
+    return _index_response(report)
+
+
+def _upload_dir(pharma_id: str) -> Path:
+    try:
+        folder = safe_filename(pharma_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid pharmacy id") from exc
+    return Path(os.environ.get("RAG_UPLOAD_DIR", "/data/uploads")) / folder
+
+
+@app.middleware("http")
+async def reject_oversized_upload(request: Request, call_next):
+    # Refuse before the multipart body is received and spooled to disk; a body
+    # sent without Content-Length is only checked file by file afterwards.
+    if request.url.path == "/rag/upload":
+        length = request.headers.get("content-length", "")
+        limit = upload_request_limit()
+        if length.isdigit() and int(length) > limit:
+            return JSONResponse(
+                {"detail": f"Upload exceeds the {limit} byte request limit"},
+                status_code=413,
+                headers={"Connection": "close"},
+            )
+    return await call_next(request)
 
 
 @app.post("/rag/upload")
@@ -335,39 +606,56 @@ def rag_upload(
     pharma_id: str = Form(...),
     files: list[UploadFile] = File(...),
 ) -> dict[str, Any]:
-    upload_dir = Path(os.environ.get("RAG_UPLOAD_DIR", "/data/uploads")) / pharma_id
+    upload_dir = _upload_dir(pharma_id)
     upload_dir.mkdir(parents=True, exist_ok=True)
-    for upload in files:
-        target = upload_dir / upload.filename
-        with target.open("wb") as buffer:
-            buffer.write(upload.file.read())
+    max_bytes, chunk_size = upload_limits()
+    saved: list[dict[str, Any]] = []
+    rejected: list[dict[str, str]] = []
+
+    def copied_files() -> Iterator[tuple[Path, str]]:
+        # The request body is already spooled to temporary files at this point:
+        # parsing a file overlaps with copying the next one to the upload
+        # directory, not with receiving it.
+        for upload in files:
+            try:
+                name = safe_filename(upload.filename)
+                if upload.size is not None and upload.size > max_bytes:
+                    raise UploadTooLarge(f"{name} exceeds the {max_bytes} byte upload limit")
+                target, content_hash, size = save_upload(upload.file, upload_dir, name, max_bytes, chunk_size)
+            except ValueError as exc:
+                rejected.append({"path": upload.filename or "", "error": str(exc)})
+                continue
+            saved.append({"filename": name, "size": size, "sha256": content_hash})
+            yield target, content_hash
+
     try:
-        count, errors = index_folder(pharma_id, str(upload_dir), rag_settings)
+        report = index_files(pharma_id, upload_dir, copied_files(), rag_settings)
     except Exception as exc:
         error_details = "".join(
             traceback.format_exception(type(exc), exc, exc.__traceback__)
         )
         return PlainTextResponse(error_details, status_code=500)
-    response: dict[str, Any] = {"status": "ok", "indexed": count}
-    if errors:
-        response["errors"] = errors
-    return response
+    if rejected and not saved:
+        status_code = 413 if any("upload limit" in item["error"] for item in rejected) else 400
+        raise HTTPException(status_code=status_code, detail=rejected)
+    report["errors"] = rejected + report["errors"]
+    return {**_index_response(report), "files": saved}
 
 
 @app.get("/rag/uploads")
 def rag_uploads(pharma_id: str = Query(...)) -> dict[str, Any]:
-    upload_dir = Path(os.environ.get("RAG_UPLOAD_DIR", "/data/uploads")) / pharma_id
+    upload_dir = _upload_dir(pharma_id)
     if not upload_dir.exists():
         return {"pharma_id": pharma_id, "items": []}
     items: list[str] = []
     for path in sorted(upload_dir.rglob("*")):
-        if path.is_file():
+        if path.is_file() and not path.name.startswith("."):
             items.append(str(path.relative_to(upload_dir)))
     return {"pharma_id": pharma_id, "items": items}
 
 
-@app.post("/sql/query")
-def sql_query(payload: SqlQueryPayload) -> dict[str, Any]:
+@app.post("/sql/query", response_model=None)
+def sql_query(payload: SqlQueryPayload, request: Request) -> dict[str, Any] | Response:
     sql_text = payload.sql.strip()
     if not sql_text.lower().startswith("select"):
         raise HTTPException(status_code=400, detail="Only SELECT queries are allowed")
@@ -375,8 +663,14 @@ def sql_query(payload: SqlQueryPayload) -> dict[str, Any]:
     host = hosts.get(payload.pharma_id)
     if not host:
         raise HTTPException(status_code=404, detail="Unknown pharmacy")
-    client = DataSnapClient(host)
+    client = get_client(host, **get_datasnap_settings())
+    fmt = negotiate_format(request, payload.format)
     try:
+        if fmt != "json":
+            # Rows are re-encoded as they are decoded from the DataSnap body, so
+            # large result sets never sit in memory as one JSON document.
+            rows = client.stream_rows("query_thread", {"sql": sql_text})
+            return stream_rows(rows, fmt, f"query_{payload.pharma_id}")
         response = client.call("query_thread", {"sql": sql_text})
     except DataSnapError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
@@ -461,7 +755,7 @@ def sql_tables(pharma_id: str = Query(...)) -> dict[str, Any]:
     host = hosts.get(pharma_id)
     if not host:
         raise HTTPException(status_code=404, detail="Unknown pharmacy")
-    client = DataSnapClient(host)
+    client = get_client(host, **get_datasnap_settings())
     try:
         tables = _fetch_tables(client)
     except DataSnapError as exc:
@@ -475,7 +769,7 @@ def sql_table_info(payload: TableInfoPayload) -> dict[str, Any]:
     host = hosts.get(payload.pharma_id)
     if not host:
         raise HTTPException(status_code=404, detail="Unknown pharmacy")
-    client = DataSnapClient(host)
+    client = get_client(host, **get_datasnap_settings())
     try:
         columns = _fetch_columns(client, payload.table)
     except DataSnapError as exc:
@@ -624,12 +918,93 @@ def query_get(query_id: int) -> dict[str, Any]:
 @app.post("/rag/ask")
 def rag_ask(payload: RagAskPayload) -> dict[str, Any]:
     try:
-        result = answer_question(payload.pharma_id, payload.question, payload.start, payload.end, rag_settings)
+        result = answer_question(
+            payload.pharma_id,
+            payload.question,
+            payload.start,
+            payload.end,
+            rag_settings,
+            payload.search_options(),
+        )
         return result
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"RAG error: {exc}") from exc
 
 
+@app.get("/rag/vector_index")
+def rag_vector_index(pharma_id: str | None = None, collection_id: int | None = None) -> dict[str, Any]:
+    try:
+        return vector_index_info(pharma_id, collection_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+@app.post("/rag/vector_index")
+def rag_vector_index_build(payload: VectorIndexPayload) -> dict[str, Any]:
+    try:
+        return build_vector_index(
+            payload.method,
+            pharma_id=payload.pharma_id,
+            collection_id=payload.collection_id,
+            quantization=payload.quantization,
+            lists=payload.lists,
+            m=payload.m,
+            ef_construction=payload.ef_construction,
+            maintenance_work_mem=payload.maintenance_work_mem,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/rag/collections")
+def rag_collections() -> list[dict[str, Any]]:
+    return list_collections()
+
+
+@app.post("/rag/collections", status_code=202)
+def rag_collection_create(payload: EmbeddingCollectionPayload) -> dict[str, Any]:
+    try:
+        return create_collection(
+            payload.backend, payload.dim, payload.activate, payload.index_method, payload.quantization
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/rag/collections/{collection_id}")
+def rag_collection_get(collection_id: int) -> dict[str, Any]:
+    collection = get_collection(collection_id)
+    if not collection:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    return collection
+
+
+@app.post("/rag/collections/{collection_id}/activate")
+def rag_collection_activate(collection_id: int) -> dict[str, Any]:
+    try:
+        return activate_collection(collection_id)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+
+@app.delete("/rag/collections/{collection_id}")
+def rag_collection_delete(collection_id: int) -> dict[str, Any]:
+    if not delete_collection(collection_id):
+        raise HTTPException(status_code=409, detail="Collection not found or active")
+    return {"status": "deleted", "id": collection_id}
+
+
+@app.post("/rag/search")
+def rag_search(payload: RagSearchPayload) -> dict[str, Any]:
+    try:
+        result = search_documents(payload.pharma_id, payload.question, rag_settings, payload.search_options())
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"RAG error: {exc}") from exc
+    return {"pharma_id": payload.pharma_id, **result}
+
+
 @app.get("/rag/llm_status")
 def rag_llm_status() -> dict[str, Any]:
     provider = rag_settings.llm_provider
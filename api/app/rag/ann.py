@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import random
+import statistics
+import time
+from typing import TYPE_CHECKING, Any, Literal
+
+import psycopg
+from psycopg import sql
+
+from ..db import get_connection
+from .collections import active_collection, collection_embedder
+from .embeddings import vector_literal
+from .quantization import QUANTIZATIONS, Quantization, operator_class, quantized
+from .retrieval import SearchOptions, search_documents, vector_search_sql
+
+if TYPE_CHECKING:
+    from .service import RagSettings
+
+IndexMethod = Literal["ivfflat", "hnsw"]
+
+
+def _partitions(cur: psycopg.Cursor, pharma_id: str | None) -> list[tuple[str, str]]:
+    cur.execute(
+        """
+        SELECT pharma_id, embeddings_partition
+        FROM rag.document_partitions
+        WHERE %s::text IS NULL OR pharma_id = %s
+        ORDER BY pharma_id
+        """,
+        (pharma_id, pharma_id),
+    )
+    return [(row[0], row[1]) for row in cur.fetchall()]
+
+
+def _collection(cur: psycopg.Cursor, collection_id: int | None) -> dict[str, Any]:
+    if collection_id is None:
+        collection = active_collection(cur)
+        if collection is None:
+            raise ValueError("No active embedding collection")
+        return collection
+    cur.execute(
+        "SELECT id, dim, quantization FROM rag.embedding_collections WHERE id = %s",
+        (collection_id,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Unknown embedding collection {collection_id}")
+    return {"id": row[0], "dim": row[1], "quantization": row[2]}
+
+
+_QUANTIZATION_SUFFIXES = {"none": "", "halfvec": "_h", "binary": "_b"}
+
+
+def _index_name(partition: str, collection_id: int, quantization: str = "none") -> str:
+    # Partition names run to 52 characters; hash them so "<name>_new" stays under 63.
+    suffix = _QUANTIZATION_SUFFIXES[quantization]
+    return f"{hashlib.md5(partition.encode()).hexdigest()[:12]}_c{collection_id}{suffix}_vec"
+
+
+def ivfflat_lists(rows: int) -> int:
+    """pgvector's guidance: ``rows / 1000`` lists up to 1M rows, ``sqrt(rows)`` beyond."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def default_probes(lists: int) -> int:
+    return max(1, int(math.sqrt(lists)))
+
+
+def vector_index_info(pharma_id: str | None = None, collection_id: int | None = None) -> dict[str, Any]:
+    """Describe the ANN index of each pharmacy partition for one collection (the active one by default)."""
+    partitions = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            collection = _collection(cur, collection_id)
+            for partition_pharma, partition in _partitions(cur, pharma_id):
+                cur.execute(
+                    sql.SQL("SELECT count(*) FROM {} WHERE collection_id = %s").format(
+                        sql.Identifier("rag", partition)
+                    ),
+                    (collection["id"],),
+                )
+                rows = cur.fetchone()[0]
+                cur.execute(
+                    """
+                    SELECT indexname, indexdef,
+                           pg_relation_size(format('%%I.%%I', schemaname, indexname)::regclass)
+                    FROM pg_indexes
+                    WHERE schemaname = 'rag' AND tablename = %s AND indexname = %s
+                    """,
+                    (partition, _index_name(partition, collection["id"], collection["quantization"])),
+                )
+                index = cur.fetchone()
+                info: dict[str, Any] = {
+                    "pharma_id": partition_pharma,
+                    "partition": partition,
+                    "rows": rows,
+                    "recommended_lists": ivfflat_lists(rows),
+                    "index": None,
+                }
+                if index:
+                    info["index"] = {
+                        "name": index[0],
+                        "method": "hnsw" if " using hnsw " in index[1].lower() else "ivfflat",
+                        "definition": index[1],
+                        "size_bytes": index[2],
+                    }
+                partitions.append(info)
+    return {
+        "collection_id": collection["id"],
+        "dim": collection["dim"],
+        "quantization": collection["quantization"],
+        "partitions": partitions,
+    }
+
+
+def _build_partition_index(
+    cur: psycopg.Cursor,
+    partition: str,
+    collection: dict[str, Any],
+    quantization: Quantization,
+    method: IndexMethod,
+    lists: int | None,
+    m: int,
+    ef_construction: int,
+) -> dict[str, Any]:
+    started = time.perf_counter()
+    table = sql.Identifier("rag", partition)
+    cur.execute(sql.SQL("SELECT count(*) FROM {} WHERE collection_id = %s").format(table), (collection["id"],))
+    rows = cur.fetchone()[0]
+    report: dict[str, Any] = {"partition": partition, "rows": rows, "quantization": quantization}
+    if method == "ivfflat":
+        lists = lists or ivfflat_lists(rows)
+        options = sql.SQL("lists = {}").format(sql.Literal(lists))
+        report.update(lists=lists, recommended_probes=default_probes(lists))
+    else:
+        options = sql.SQL("m = {}, ef_construction = {}").format(sql.Literal(m), sql.Literal(ef_construction))
+        report.update(m=m, ef_construction=ef_construction)
+    name = _index_name(partition, collection["id"], quantization)
+    # The column has no fixed dimension: index the (quantized) cast to this
+    # collection's size, restricted to its rows, matching what search orders by.
+    cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier("rag", f"{name}_new")))
+    cur.execute(
+        sql.SQL("CREATE INDEX CONCURRENTLY {} ON {} USING {} (({}) {}) WITH ({}) WHERE collection_id = {}").format(
+            sql.Identifier(f"{name}_new"),
+            table,
+            sql.SQL(method),
+            quantized(quantization, sql.SQL("embedding"), collection["dim"]),
+            operator_class(quantization),
+            options,
+            sql.Literal(collection["id"]),
+        )
+    )
+    with cur.connection.transaction():
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier("rag", name)))
+        cur.execute(
+            sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier("rag", f"{name}_new"), sql.Identifier(name))
+        )
+    cur.execute("SELECT pg_relation_size(%s::regclass)", (f"rag.{name}",))
+    report["size_bytes"] = cur.fetchone()[0]
+    cur.execute(sql.SQL("ANALYZE {}").format(table))
+    report["build_s"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def build_vector_index(
+    method: IndexMethod = "ivfflat",
+    pharma_id: str | None = None,
+    collection_id: int | None = None,
+    quantization: Quantization | None = None,
+    lists: int | None = None,
+    m: int = 16,
+    ef_construction: int = 64,
+    maintenance_work_mem: str | None = None,
+) -> dict[str, Any]:
+    """(Re)build the ANN index of each pharmacy partition (or only ``pharma_id``'s).
+
+    Indexes are per embedding collection (the active one unless
+    ``collection_id`` is given). ``ivfflat`` centroids are trained on existing
+    rows, so the index should be rebuilt once a pharmacy's corpus has grown;
+    ``lists`` defaults to :func:`ivfflat_lists` of that partition's row count.
+    ``hnsw`` needs no training and takes ``m`` / ``ef_construction``. Each index
+    is built ``CONCURRENTLY`` under a temporary name and swapped in, so searches
+    keep working during the build.
+
+    ``quantization`` (default: the collection's) chooses what the index scans:
+    full ``vector``, ``halfvec`` or ``binary``; the last two are re-ranked at
+    full precision by search. Changing it builds the new indexes next to the
+    old ones, switches the collection, then drops the old indexes, so it must
+    cover every partition.
+    """
+    if method not in ("ivfflat", "hnsw"):
+        raise ValueError(f"Unknown index method '{method}'")
+    if lists is not None and lists < 1:
+        raise ValueError("lists must be positive")
+    if m < 2 or ef_construction < 2 * m:
+        raise ValueError("hnsw needs m >= 2 and ef_construction >= 2 * m")
+    if quantization is not None and quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}'")
+    started = time.perf_counter()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            collection = _collection(cur, collection_id)
+            previous = collection["quantization"]
+            quantization = quantization or previous
+            if quantization != previous and pharma_id is not None:
+                raise ValueError("Changing quantization rebuilds every partition; omit pharma_id")
+            partitions = _partitions(cur, pharma_id)
+            if pharma_id is not None and not partitions:
+                raise ValueError(f"No indexed documents for '{pharma_id}'")
+            if maintenance_work_mem:
+                cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+            try:
+                built = [
+                    {"pharma_id": partition_pharma}
+                    | _build_partition_index(
+                        cur, partition, collection, quantization, method, lists, m, ef_construction
+                    )
+                    for partition_pharma, partition in partitions
+                ]
+            finally:
+                if maintenance_work_mem:
+                    cur.execute("RESET maintenance_work_mem")
+            cur.execute(
+                """
+                UPDATE rag.embedding_collections
+                SET index_method = %s, quantization = %s, updated_at = NOW()
+                WHERE id = %s
+                """,
+                (method, quantization, collection["id"]),
+            )
+            if quantization != previous:
+                # Searches now use the new expression; the old indexes are dead weight.
+                for _, partition in partitions:
+                    cur.execute(
+                        sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                            sql.Identifier("rag", _index_name(partition, collection["id"], previous))
+                        )
+                    )
+    return {
+        "method": method,
+        "quantization": quantization,
+        "collection_id": collection["id"],
+        "partitions": built,
+        "build_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def _sample_questions(pharma_id: str, count: int, seed: int) -> list[str]:
+    """Use the opening words of random indexed chunks as stand-in questions."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT content FROM rag.documents WHERE pharma_id = %s ORDER BY id LIMIT 5000",
+                (pharma_id,),
+            )
+            contents = [row[0] for row in cur.fetchall()]
+    rng = random.Random(seed)
+    picked = rng.sample(contents, min(count, len(contents)))
+    return [" ".join(content.split()[:12]) for content in picked]
+
+
+def _exact_ids(pharma_id: str, question: str, k: int) -> list[int]:
+    with get_connection() as conn:
+        with conn.transaction(), conn.cursor() as cur:
+            collection = _collection(cur, None)
+            vector = vector_literal(collection_embedder(collection).embed_batch([question])[0])
+            # With index scans off the planner falls back to the exact sequential scan.
+            cur.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            cur.execute(
+                vector_search_sql(collection, exact=True),
+                {"pharma_id": pharma_id, "vector": vector, "limit": k},
+            )
+            return [row[0] for row in cur.fetchall()]
+
+
+def recall_report(
+    pharma_id: str,
+    settings: RagSettings,
+    questions: list[str] | None = None,
+    k: int = 10,
+    probes: list[int] | None = None,
+    ef_search: list[int] | None = None,
+    samples: int = 50,
+    seed: int = 7,
+    rerank_factor: int = 4,
+) -> dict[str, Any]:
+    """Measure recall@k and latency of ANN vector search against exact search, on the active collection.
+
+    Each ``probes`` value (ivfflat) or ``ef_search`` value (hnsw) is one row of
+    the report; questions default to ``samples`` chunk openings of ``pharma_id``.
+    The exact baseline always uses full-precision vectors, so the recall of a
+    quantized index includes its quantization loss after re-ranking.
+    """
+    questions = questions or _sample_questions(pharma_id, samples, seed)
+    if not questions:
+        raise ValueError(f"No indexed documents for '{pharma_id}'")
+    exact = {question: set(_exact_ids(pharma_id, question, k)) for question in questions}
+    info = vector_index_info(pharma_id)
+    partitions = info["partitions"]
+    method = ((partitions[0]["index"] if partitions else None) or {}).get("method", "ivfflat")
+    if method == "hnsw":
+        settings_to_try = [{"ef_search": value} for value in (ef_search or [10, 20, 40, 80, 160])]
+    else:
+        settings_to_try = [{"probes": value} for value in (probes or [1, 2, 4, 8, 16, 32])]
+    rows = []
+    for knobs in settings_to_try:
+        options = SearchOptions(k=k, mode="vector", rerank_factor=rerank_factor, **knobs)
+        latencies = []
+        recalls = []
+        for question in questions:
+            result = search_documents(pharma_id, question, settings, options, use_cache=False)
+            latencies.append(result["timings_ms"]["vector_ms"])
+            found = {item["id"] for item in result["items"]}
+            expected = exact[question]
+            recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+        latencies.sort()
+        rows.append(
+            {
+                **knobs,
+                "recall": round(statistics.fmean(recalls), 4),
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(latencies[max(0, math.ceil(len(latencies) * 0.95) - 1)], 3),
+            }
+        )
+    return {
+        "pharma_id": pharma_id,
+        "method": method,
+        "quantization": info["quantization"],
+        "index_bytes": sum((partition["index"] or {}).get("size_bytes", 0) for partition in partitions),
+        "k": k,
+        "questions": len(questions),
+        "results": rows,
+    }
@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+import psycopg
+
+from ..db import get_connection
+from .embeddings import EmbeddingBackend, get_embedder, vector_literal
+from .quantization import QUANTIZATIONS
+
+if TYPE_CHECKING:
+    from .service import RagSettings
+
+_COLLECTION_COLUMNS = """
+    id, backend, model, dim, status, index_method, activate_when_ready, rows_total, rows_done, error,
+    created_at, updated_at, activated_at, quantization
+"""
+
+_MISSING_SQL = """
+    SELECT d.id, d.content
+    FROM rag.documents d
+    WHERE d.pharma_id = %s
+    AND NOT EXISTS (
+        SELECT 1 FROM rag.document_embeddings e
+        WHERE e.pharma_id = d.pharma_id AND e.collection_id = %s AND e.document_id = d.id
+    )
+    ORDER BY d.id
+    LIMIT %s
+"""
+
+# Rows deleted since they were read are skipped by FOR KEY SHARE instead of
+# failing the foreign key; rows already embedded by the indexer are left alone.
+_INSERT_SQL = """
+    WITH live AS (
+        SELECT id FROM rag.documents WHERE pharma_id = %s AND id = ANY(%s) FOR KEY SHARE
+    )
+    INSERT INTO rag.document_embeddings (collection_id, pharma_id, document_id, embedding)
+    SELECT %s, %s, v.id, v.embedding::vector
+    FROM unnest(%s::bigint[], %s::text[]) AS v (id, embedding)
+    JOIN live ON live.id = v.id
+    ON CONFLICT DO NOTHING
+"""
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _collection_from_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "backend": row[1],
+        "model": row[2],
+        "dim": row[3],
+        "status": row[4],
+        "index_method": row[5],
+        "quantization": row[13],
+        "activate_when_ready": row[6],
+        "progress": {"rows": row[8], "total": row[7]},
+        "error": row[9],
+        "created_at": row[10].isoformat() if row[10] else None,
+        "updated_at": row[11].isoformat() if row[11] else None,
+        "activated_at": row[12].isoformat() if row[12] else None,
+    }
+
+
+def collection_embedder(collection: dict[str, Any]) -> EmbeddingBackend:
+    return get_embedder(collection["backend"], collection["dim"])
+
+
+def active_collection(cur: psycopg.Cursor) -> dict[str, Any] | None:
+    cur.execute(f"SELECT {_COLLECTION_COLUMNS} FROM rag.embedding_collections WHERE status = 'active'")
+    row = cur.fetchone()
+    return _collection_from_row(row) if row else None
+
+
+def writable_collections(cur: psycopg.Cursor) -> list[dict[str, Any]]:
+    """Collections new chunks must be embedded into: the active one and any being built.
+
+    Must run inside the transaction that writes the chunks. The share locks make
+    :func:`activate_collection` wait for that transaction, so a cutover never
+    misses chunks written concurrently.
+    """
+    cur.execute(
+        f"""
+        SELECT {_COLLECTION_COLUMNS}
+        FROM rag.embedding_collections
+        WHERE status IN ('active', 'building')
+        ORDER BY id
+        FOR SHARE
+        """
+    )
+    return [_collection_from_row(row) for row in cur.fetchall()]
+
+
+def ensure_active_collection(cur: psycopg.Cursor, settings: RagSettings) -> dict[str, Any]:
+    """Return the active collection, creating it from ``settings`` on a fresh database."""
+    collection = active_collection(cur)
+    if collection is not None:
+        return collection
+    embedder = settings.embedder
+    cur.execute(
+        f"""
+        INSERT INTO rag.embedding_collections (backend, model, dim, status, activated_at)
+        VALUES (%s, %s, %s, 'active', NOW())
+        ON CONFLICT DO NOTHING
+        RETURNING {_COLLECTION_COLUMNS}
+        """,
+        (settings.embedding_backend, embedder.name, embedder.dim),
+    )
+    row = cur.fetchone()
+    if row:
+        return _collection_from_row(row)
+    # Lost a race with another indexer, or the model exists but is not active.
+    collection = active_collection(cur)
+    if collection is None:
+        raise RuntimeError("No active embedding collection; activate one with POST /rag/collections/{id}/activate")
+    return collection
+
+
+def get_collection(collection_id: int) -> dict[str, Any] | None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {_COLLECTION_COLUMNS} FROM rag.embedding_collections WHERE id = %s",
+                (collection_id,),
+            )
+            row = cur.fetchone()
+    return _collection_from_row(row) if row else None
+
+
+def list_collections() -> list[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {_COLLECTION_COLUMNS} FROM rag.embedding_collections ORDER BY id")
+            rows = cur.fetchall()
+    return [_collection_from_row(row) for row in rows]
+
+
+def create_collection(
+    backend: str,
+    dim: int,
+    activate: bool = True,
+    index_method: str = "ivfflat",
+    quantization: str = "none",
+) -> dict[str, Any]:
+    """Register a (model, dim) collection and fill it in the background.
+
+    Search keeps using the active collection until the new one is complete;
+    with ``activate`` it is then swapped in by :func:`activate_collection`.
+    Asking again for a retired or failed collection resumes it.
+    ``quantization`` selects what its ANN index scans (see :func:`build_vector_index`).
+    """
+    embedder = get_embedder(backend, dim)
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}'")
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO rag.embedding_collections (
+                    backend, model, dim, index_method, quantization, activate_when_ready
+                )
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (model, dim) DO UPDATE
+                SET status = CASE
+                        WHEN rag.embedding_collections.status IN ('active', 'building')
+                        THEN rag.embedding_collections.status
+                        ELSE 'building'
+                    END,
+                    index_method = EXCLUDED.index_method,
+                    quantization = CASE
+                        WHEN rag.embedding_collections.status = 'active'
+                        THEN rag.embedding_collections.quantization
+                        ELSE EXCLUDED.quantization
+                    END,
+                    activate_when_ready = EXCLUDED.activate_when_ready,
+                    error = NULL,
+                    updated_at = NOW()
+                RETURNING {_COLLECTION_COLUMNS}
+                """,
+                (backend, embedder.name, dim, index_method, quantization, activate),
+            )
+            collection = _collection_from_row(cur.fetchone())
+    if collection["status"] == "building":
+        _schedule(collection["id"])
+    return collection
+
+
+def activate_collection(collection_id: int) -> dict[str, Any]:
+    """Atomically make ``collection_id`` the collection search reads from.
+
+    Raises ``ValueError`` if some chunks still lack an embedding in it.
+    """
+    with get_connection() as conn:
+        with conn.transaction(), conn.cursor() as cur:
+            # Lock every active/building row: indexers hold share locks on them
+            # until their chunks (and embeddings) are committed.
+            cur.execute(
+                """
+                SELECT id FROM rag.embedding_collections
+                WHERE id = %s OR status IN ('active', 'building')
+                ORDER BY id
+                FOR UPDATE
+                """,
+                (collection_id,),
+            )
+            if collection_id not in {row[0] for row in cur.fetchall()}:
+                raise LookupError(f"Unknown embedding collection {collection_id}")
+            missing = _count_missing(cur, collection_id)
+            if missing:
+                raise ValueError(f"Collection {collection_id} is missing {missing} embeddings")
+            cur.execute(
+                """
+                UPDATE rag.embedding_collections
+                SET status = 'retired', updated_at = NOW()
+                WHERE status = 'active' AND id <> %s
+                """,
+                (collection_id,),
+            )
+            cur.execute(
+                f"""
+                UPDATE rag.embedding_collections
+                SET status = 'active', activated_at = NOW(), updated_at = NOW()
+                WHERE id = %s
+                RETURNING {_COLLECTION_COLUMNS}
+                """,
+                (collection_id,),
+            )
+            return _collection_from_row(cur.fetchone())
+
+
+def delete_collection(collection_id: int) -> bool:
+    """Drop a collection that is not active, with its embeddings."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM rag.embedding_collections WHERE id = %s AND status <> 'active' RETURNING id",
+                (collection_id,),
+            )
+            return cur.fetchone() is not None
+
+
+def _count_missing(cur: psycopg.Cursor, collection_id: int) -> int:
+    cur.execute(
+        """
+        SELECT count(*)
+        FROM rag.documents d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM rag.document_embeddings e
+            WHERE e.pharma_id = d.pharma_id AND e.collection_id = %s AND e.document_id = d.id
+        )
+        """,
+        (collection_id,),
+    )
+    return cur.fetchone()[0]
+
+
+def start_reembed_workers() -> None:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-reembed")
+
+
+def stop_reembed_workers() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def resume_reembedding() -> int:
+    """Re-schedule collections that were still building when the API stopped."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM rag.embedding_collections WHERE status = 'building' ORDER BY id")
+            collection_ids = [row[0] for row in cur.fetchall()]
+    for collection_id in collection_ids:
+        _schedule(collection_id)
+    return len(collection_ids)
+
+
+def _schedule(collection_id: int) -> None:
+    start_reembed_workers()
+    assert _executor is not None
+    _executor.submit(_run_reembed, collection_id)
+
+
+def _set_status(collection_id: int, status: str, error: str | None = None) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE rag.embedding_collections
+                SET status = %s, error = %s, updated_at = NOW()
+                WHERE id = %s
+                """,
+                (status, error, collection_id),
+            )
+
+
+def _run_reembed(collection_id: int) -> None:
+    collection = get_collection(collection_id)
+    if not collection or collection["status"] != "building":
+        return
+    try:
+        _reembed(collection)
+    except Exception as exc:
+        _set_status(collection_id, "failed", f"{type(exc).__name__}: {exc}")
+
+
+def _fill_missing(conn: psycopg.Connection, collection_id: int, embedder: EmbeddingBackend, batch_size: int) -> bool:
+    """Embed every chunk the collection lacks, one batch per transaction.
+
+    Returns ``False`` if the collection stopped building (deleted) meanwhile.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pharma_id FROM rag.document_partitions ORDER BY pharma_id")
+        pharma_ids = [row[0] for row in cur.fetchall()]
+        for pharma_id in pharma_ids:
+            while True:
+                cur.execute(_MISSING_SQL, (pharma_id, collection_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                ids = [row[0] for row in rows]
+                vectors = [vector_literal(vector) for vector in embedder.embed_batch([row[1] for row in rows])]
+                with conn.transaction():
+                    cur.execute(_INSERT_SQL, (pharma_id, ids, collection_id, pharma_id, ids, vectors))
+                    cur.execute(
+                        """
+                        UPDATE rag.embedding_collections
+                        SET rows_done = rows_done + %s, updated_at = NOW()
+                        WHERE id = %s AND status = 'building'
+                        RETURNING id
+                        """,
+                        (cur.rowcount, collection_id),
+                    )
+                    if cur.fetchone() is None:
+                        return False
+    return True
+
+
+def _reembed(collection: dict[str, Any]) -> None:
+    # Imported here: ann builds on retrieval, which imports this module.
+    from .ann import build_vector_index
+
+    collection_id = collection["id"]
+    embedder = collection_embedder(collection)
+    batch_size = int(os.environ.get("RAG_REEMBED_BATCH_SIZE", "256"))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE rag.embedding_collections
+                SET rows_total = (SELECT count(*) FROM rag.documents),
+                    rows_done = (SELECT count(*) FROM rag.document_embeddings WHERE collection_id = %s),
+                    updated_at = NOW()
+                WHERE id = %s
+                """,
+                (collection_id, collection_id),
+            )
+        if not _fill_missing(conn, collection_id, embedder, batch_size):
+            return
+    build_vector_index(
+        collection["index_method"], collection_id=collection_id, quantization=collection["quantization"]
+    )
+    if not collection["activate_when_ready"]:
+        _set_status(collection_id, "ready")
+        return
+    for _ in range(3):
+        try:
+            activate_collection(collection_id)
+            return
+        except ValueError:
+            # Chunks committed before their indexer saw this collection: fill and retry.
+            with get_connection() as conn:
+                if not _fill_missing(conn, collection_id, embedder, batch_size):
+                    return
+    raise RuntimeError("Embeddings kept falling behind; activate the collection manually")
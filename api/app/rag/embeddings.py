@@ -1,14 +1,121 @@
 from __future__ import annotations
 
-import hashlib
-from typing import Iterable
+import re
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from typing import Iterable, Protocol, Sequence
 
+import numpy as np
 
-def embed_text(text: str, dimension: int) -> list[float]:
-    digest = hashlib.sha256(text.encode("utf-8")).digest()
-    values = [b / 255.0 for b in digest]
-    repeated = (values * ((dimension // len(values)) + 1))[:dimension]
-    return repeated
+_WORD = re.compile(r"\w+", re.UNICODE)
+_COMBINING = re.compile("[\u0300-\u036f]")
+_FNV_PRIME = np.uint64(1099511628211)
+_FNV_OFFSET = np.uint64(14695981039346656037)
+
+
+class EmbeddingBackend(Protocol):
+    name: str
+    dim: int
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a ``(len(texts), dim)`` float32 array of L2-normalised vectors."""
+        ...
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, strip accents and collapse everything but word characters to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = _COMBINING.sub("", decomposed)
+    return " ".join(_WORD.findall(stripped))
+
+
+@dataclass
+class HashingEmbedder:
+    """Character n-gram embeddings built on CPU with NumPy only.
+
+    Each text is padded and split into character n-grams (``ngram_range``) plus
+    whole words. Every feature is hashed (FNV-1a) into ``buckets`` and the bucket
+    log-scaled counts are mapped to ``dim`` dimensions by a fixed Gaussian random
+    projection, so texts sharing many n-grams end up close in L2 distance.
+    Results are deterministic for a given ``seed`` and configuration, which is
+    what :attr:`name` encodes.
+    """
+
+    dim: int = 128
+    ngram_range: tuple[int, int] = (3, 5)
+    buckets: int = 1 << 15
+    seed: int = 20240601
+    _projection: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        rng = np.random.default_rng(self.seed)
+        projection = rng.standard_normal((self.buckets, self.dim), dtype=np.float32)
+        self._projection = projection / np.float32(np.sqrt(self.dim))
+
+    @property
+    def name(self) -> str:
+        low, high = self.ngram_range
+        return f"hashing-ngram{low}{high}-b{self.buckets}-s{self.seed}"
+
+    def _features(self, text: str) -> np.ndarray:
+        normalized = normalize_text(text)
+        if not normalized:
+            return np.empty(0, dtype=np.int64)
+        codes = np.frombuffer(f" {normalized} ".encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        hashes = []
+        low, high = self.ngram_range
+        with np.errstate(over="ignore"):
+            for size in range(low, high + 1):
+                count = codes.size - size + 1
+                if count <= 0:
+                    continue
+                value = np.full(count, _FNV_OFFSET ^ np.uint64(size), dtype=np.uint64)
+                for offset in range(size):
+                    value = (value ^ codes[offset : offset + count]) * _FNV_PRIME
+                hashes.append(value)
+            # Whole words give exact terms (CIP codes, molecule names) their own feature.
+            hashes.append(
+                np.array([zlib.crc32(word.encode("utf-8")) for word in normalized.split(" ")], dtype=np.uint64)
+            )
+        return (np.concatenate(hashes) % np.uint64(self.buckets)).astype(np.int64)
+
+    def embed_batch(self, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+        output = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            features = [self._features(text) for text in texts[start : start + batch_size]]
+            rows = np.repeat(np.arange(len(features)), [item.size for item in features])
+            if not rows.size:
+                continue
+            # Bucket counts for the whole sub-batch in one bincount, damped with log1p
+            # so a term repeated in a long chunk does not dominate, then one matmul.
+            counts = np.bincount(
+                rows * self.buckets + np.concatenate(features),
+                minlength=len(features) * self.buckets,
+            ).reshape(len(features), self.buckets)
+            output[start : start + len(features)] = np.log1p(counts, dtype=np.float32) @ self._projection
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        np.divide(output, norms, out=output, where=norms > 0)
+        return output
+
+
+_BACKENDS = {"hashing": HashingEmbedder}
+_instances: dict[tuple[str, int], EmbeddingBackend] = {}
+
+
+def get_embedder(backend: str = "hashing", dim: int = 128) -> EmbeddingBackend:
+    """Return the shared embedder for ``backend`` at ``dim`` dimensions."""
+    key = (backend, dim)
+    if key not in _instances:
+        factory = _BACKENDS.get(backend)
+        if factory is None:
+            raise ValueError(f"Unknown embedding backend '{backend}'")
+        _instances[key] = factory(dim=dim)
+    return _instances[key]
+
+
+def embed_text(text: str, dimension: int, backend: str = "hashing") -> list[float]:
+    return get_embedder(backend, dimension).embed_batch([text])[0].tolist()
 
 
 def vector_literal(vector: Iterable[float]) -> str:
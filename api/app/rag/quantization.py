@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import Literal
+
+from psycopg import sql
+
+Quantization = Literal["none", "halfvec", "binary"]
+
+# What the ANN index of a collection scans: (expression, operator class, distance
+# operator). halfvec halves the index; binary_quantize keeps one bit per
+# dimension (32x smaller) and compares by Hamming distance.
+QUANTIZATIONS: dict[str, tuple[str, str, str]] = {
+    "none": ("{value}::vector({dim})", "vector_l2_ops", "<->"),
+    "halfvec": ("{value}::halfvec({dim})", "halfvec_l2_ops", "<->"),
+    "binary": ("binary_quantize({value}::vector({dim}))::bit({dim})", "bit_hamming_ops", "<~>"),
+}
+
+
+def quantized(quantization: str, value: sql.Composable, dim: int) -> sql.Composed:
+    """``value`` (a ``vector``) as the ANN index of ``quantization`` stores it."""
+    template = QUANTIZATIONS[quantization][0]
+    return sql.SQL(template).format(value=value, dim=sql.Literal(dim))
+
+
+def operator_class(quantization: str) -> sql.SQL:
+    return sql.SQL(QUANTIZATIONS[quantization][1])
+
+
+def distance_operator(quantization: str) -> sql.SQL:
+    return sql.SQL(QUANTIZATIONS[quantization][2])
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any, Literal
+
+import psycopg
+from psycopg import sql
+
+from ..cache import rag_embedding_cache, rag_search_cache
+from ..db import get_connection
+from .collections import active_collection, collection_embedder
+from .embeddings import vector_literal
+from .quantization import distance_operator, quantized
+
+if TYPE_CHECKING:
+    from .service import RagSettings
+
+SearchMode = Literal["vector", "text", "hybrid"]
+
+# The collection id and dimension are inlined so the planner can match the
+# partial expression index built for that collection (see ann.py).
+_VECTOR_SQL = """
+    SELECT d.id, d.source_path, d.content
+    FROM rag.document_embeddings e
+    JOIN rag.documents d ON d.pharma_id = e.pharma_id AND d.id = e.document_id
+    WHERE e.pharma_id = %(pharma_id)s AND e.collection_id = {collection_id}
+    ORDER BY {indexed} {operator} {query}
+    LIMIT %(limit)s
+"""
+
+# Quantized collections: the index ranks candidates on the quantized vectors,
+# then the full-precision vectors re-rank them.
+_RERANK_SQL = """
+    SELECT d.id, d.source_path, d.content
+    FROM (
+        SELECT e.pharma_id, e.document_id, e.embedding
+        FROM rag.document_embeddings e
+        WHERE e.pharma_id = %(pharma_id)s AND e.collection_id = {collection_id}
+        ORDER BY {indexed} {operator} {query}
+        LIMIT %(candidates)s
+    ) e
+    JOIN rag.documents d ON d.pharma_id = e.pharma_id AND d.id = e.document_id
+    ORDER BY e.embedding::vector({dim}) <-> %(vector)s::vector({dim})
+    LIMIT %(limit)s
+"""
+
+# plainto_tsquery ANDs every word, which a natural-language question rarely
+# satisfies; OR-ing the lexemes lets ts_rank_cd score partial matches instead.
+_TEXT_SQL = """
+    SELECT id, source_path, content
+    FROM rag.documents,
+         CAST(replace(plainto_tsquery('french', %s)::text, '&', '|') AS tsquery) AS query
+    WHERE pharma_id = %s AND content_tsv @@ query
+    ORDER BY ts_rank_cd(content_tsv, query, 1) DESC, id
+    LIMIT %s
+"""
+
+
+@dataclass(frozen=True)
+class SearchOptions:
+    """Per-request retrieval knobs.
+
+    ``hybrid`` fuses the vector and full-text rankings with reciprocal rank
+    fusion: each document scores ``weight / (rrf_k + rank)`` per list it
+    appears in. ``candidates`` rows are taken from each list before fusion.
+    ``probes`` (ivfflat) and ``ef_search`` (hnsw) trade ANN recall for latency
+    for this search only; ``None`` keeps the server setting. On a quantized
+    collection the index returns ``rerank_factor`` times the rows needed,
+    which are re-ranked at full precision.
+    """
+
+    k: int = 5
+    mode: SearchMode = "hybrid"
+    vector_weight: float = 1.0
+    text_weight: float = 1.0
+    candidates: int = 50
+    rrf_k: int = 60
+    probes: int | None = None
+    ef_search: int | None = None
+    rerank_factor: int = 4
+
+    def with_overrides(self, **overrides: Any) -> SearchOptions:
+        return replace(self, **{key: value for key, value in overrides.items() if value is not None})
+
+
+def load_search_options() -> SearchOptions:
+    return SearchOptions(
+        k=int(os.environ.get("RAG_SEARCH_K", "5")),
+        mode=os.environ.get("RAG_SEARCH_MODE", "hybrid"),  # type: ignore[arg-type]
+        vector_weight=float(os.environ.get("RAG_VECTOR_WEIGHT", "1.0")),
+        text_weight=float(os.environ.get("RAG_TEXT_WEIGHT", "1.0")),
+        candidates=int(os.environ.get("RAG_SEARCH_CANDIDATES", "50")),
+        probes=int(os.environ["RAG_IVFFLAT_PROBES"]) if os.environ.get("RAG_IVFFLAT_PROBES") else None,
+        ef_search=int(os.environ["RAG_HNSW_EF_SEARCH"]) if os.environ.get("RAG_HNSW_EF_SEARCH") else None,
+        rerank_factor=int(os.environ.get("RAG_RERANK_FACTOR", "4")),
+    )
+
+
+def vector_search_sql(collection: dict[str, Any], exact: bool = False) -> sql.Composed:
+    """Nearest-neighbour query on ``collection``.
+
+    Parameters are named ``pharma_id``, ``vector``, ``limit`` and, for a
+    quantized collection, ``candidates``. ``exact`` orders by the
+    full-precision vectors whatever the collection's quantization.
+    """
+    quantization = "none" if exact else collection.get("quantization", "none")
+    dim = collection["dim"]
+    return sql.SQL(_VECTOR_SQL if quantization == "none" else _RERANK_SQL).format(
+        collection_id=sql.Literal(collection["id"]),
+        dim=sql.Literal(dim),
+        indexed=quantized(quantization, sql.SQL("e.embedding"), dim),
+        operator=distance_operator(quantization),
+        query=quantized(quantization, sql.SQL("%(vector)s"), dim),
+    )
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of ``question``: what is searched and cached."""
+    return " ".join(question.split()).casefold()
+
+
+def _index_version(cur: psycopg.Cursor, pharma_id: str) -> int:
+    cur.execute("SELECT index_version FROM rag.document_partitions WHERE pharma_id = %s", (pharma_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _embed_question(collection: dict[str, Any], question: str) -> str:
+    embedder = collection_embedder(collection)
+    # The embedder name does not carry the dimension: two collections of the
+    # same backend at different sizes must not share entries.
+    key = (collection["backend"], collection["dim"], embedder.name, question)
+    vector = rag_embedding_cache.get(key)
+    if vector is None:
+        vector = vector_literal(embedder.embed_batch([question])[0])
+        rag_embedding_cache.set(key, vector)
+    return vector
+
+
+def fuse_rankings(
+    rankings: list[tuple[str, float, list[tuple[Any, ...]]]],
+    k: int,
+    rrf_k: int,
+) -> list[dict[str, Any]]:
+    """Reciprocal rank fusion of ``(name, weight, rows)`` rankings; rows start with ``id, source_path, content``."""
+    fused: dict[Any, dict[str, Any]] = {}
+    for name, weight, rows in rankings:
+        for rank, row in enumerate(rows, start=1):
+            item = fused.setdefault(
+                row[0],
+                {"id": row[0], "source_path": row[1], "content": row[2], "score": 0.0, "ranks": {}},
+            )
+            item["score"] += weight / (rrf_k + rank)
+            item["ranks"][name] = rank
+    ordered = sorted(fused.values(), key=lambda item: (-item["score"], item["id"]))
+    for item in ordered:
+        item["score"] = round(item["score"], 6)
+    return ordered[:k]
+
+
+def search_documents(
+    pharma_id: str,
+    question: str,
+    settings: RagSettings,
+    options: SearchOptions | None = None,
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    """Retrieve the top ``options.k`` chunks for ``question`` with per-stage timings in milliseconds.
+
+    The vector stage searches the active embedding collection, whatever
+    ``settings.embedding_backend`` says, and is skipped if there is none yet.
+    Question embeddings are cached per model; with ``use_cache`` whole results
+    are cached per pharmacy, question, index version, collection and options,
+    so any indexing of the pharmacy or collection cutover misses the cache.
+    """
+    options = options or SearchOptions()
+    question = normalize_question(question)
+    use_vector = options.mode in ("vector", "hybrid") and options.vector_weight > 0
+    use_text = options.mode in ("text", "hybrid") and options.text_weight > 0
+    # A single-list search needs no more rows than it returns.
+    limit = options.candidates if use_vector and use_text else options.k
+    timings: dict[str, float] = {}
+    rankings: list[tuple[str, float, list[tuple[Any, ...]]]] = []
+    started = time.perf_counter()
+
+    def lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = round((now - since) * 1000, 3)
+        return now
+
+    mark = started
+    collection = None
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if use_vector:
+                # Embed with the active collection's model: during a re-embed the
+                # configured backend may already differ from what search serves.
+                collection = active_collection(cur)
+            if use_cache:
+                cache_key = (
+                    pharma_id,
+                    question,
+                    _index_version(cur, pharma_id),
+                    (collection["id"], collection.get("quantization")) if collection else None,
+                    options,
+                )
+                cached = rag_search_cache.get(cache_key)
+                if cached is not None:
+                    lap("total_ms", started)
+                    return cached | {"cached": True, "timings_ms": timings}
+            if collection is not None:
+                vector = _embed_question(collection, question)
+                mark = lap("embed_ms", mark)
+                # set_config(..., true) only lasts for the transaction, so the
+                # pooled connection goes back with the server defaults.
+                with conn.transaction():
+                    if options.probes is not None:
+                        cur.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(options.probes),))
+                    if options.ef_search is not None:
+                        cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(options.ef_search),))
+                    cur.execute(
+                        vector_search_sql(collection),
+                        {
+                            "pharma_id": pharma_id,
+                            "vector": vector,
+                            "limit": limit,
+                            "candidates": limit * options.rerank_factor,
+                        },
+                    )
+                    rankings.append(("vector", options.vector_weight, cur.fetchall()))
+                mark = lap("vector_ms", mark)
+            if use_text:
+                cur.execute(_TEXT_SQL, (question, pharma_id, limit))
+                rankings.append(("text", options.text_weight, cur.fetchall()))
+                mark = lap("text_ms", mark)
+    items = fuse_rankings(rankings, options.k, options.rrf_k)
+    lap("fuse_ms", mark)
+    lap("total_ms", started)
+    result = {
+        "mode": options.mode,
+        "k": options.k,
+        "collection_id": collection["id"] if collection else None,
+        "items": items,
+        "cached": False,
+        "timings_ms": timings,
+    }
+    if use_cache:
+        rag_search_cache.set(cache_key, result)
+    return result
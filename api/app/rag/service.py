@@ -1,21 +1,30 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
 from datetime import date
+from multiprocessing import get_context
 from pathlib import Path
-from typing import Iterable
+from typing import Any, Iterable, Iterator
 
+import psycopg
 from docx import Document
 from pypdf import PdfReader
 from psycopg.types.json import Json
 
+from ..cache import rag_search_cache
 from ..db import get_connection
 from ..kpi import build_kpi_summary
 from ..table_descriptions import list_table_descriptions
-from .embeddings import embed_text, vector_literal
+from .collections import collection_embedder, ensure_active_collection, writable_collections
+from .embeddings import EmbeddingBackend, get_embedder, vector_literal
 from .llm import GPT4AllProvider, LLMProvider, NoLLMProvider, OllamaProvider
+from .retrieval import SearchOptions, load_search_options, search_documents
 
 
 @dataclass
@@ -23,11 +32,20 @@ class RagSettings:
     embedding_dim: int
     chunk_size: int
     llm_provider: LLMProvider
+    embedding_backend: str = "hashing"
+    parse_workers: int = 1
+    search: SearchOptions = field(default_factory=SearchOptions)
+
+    @property
+    def embedder(self) -> EmbeddingBackend:
+        return get_embedder(self.embedding_backend, self.embedding_dim)
 
 
 def load_rag_settings() -> RagSettings:
     embedding_dim = int(os.environ.get("RAG_EMBEDDING_DIM", "128"))
     chunk_size = int(os.environ.get("RAG_CHUNK_SIZE", "800"))
+    embedding_backend = os.environ.get("RAG_EMBEDDING_BACKEND", "hashing")
+    parse_workers = int(os.environ.get("RAG_PARSE_WORKERS", str(os.cpu_count() or 1)))
 
     gpt4all_url = os.environ.get("GPT4ALL_URL", "http://192.168.0.100:4891")
     gpt4all_model = os.environ.get("GPT4ALL_MODEL")
@@ -45,6 +63,9 @@ def load_rag_settings() -> RagSettings:
         embedding_dim=embedding_dim,
         chunk_size=chunk_size,
         llm_provider=provider,
+        embedding_backend=embedding_backend,
+        parse_workers=parse_workers,
+        search=load_search_options(),
     )
 
 
@@ -78,60 +99,339 @@ def _chunk_text(text: str, chunk_size: int) -> Iterable[str]:
         yield " ".join(buffer)
 
 
-def index_folder(pharma_id: str, path: str, settings: RagSettings) -> tuple[int, list[dict[str, str]]]:
+def _parse_file(path: str, chunk_size: int) -> list[str]:
+    """Read and chunk one file; runs in a worker process, so only the chunks travel back."""
+    return list(_chunk_text(_read_text(Path(path)), chunk_size))
+
+
+_parse_pool: ProcessPoolExecutor | None = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool_workers != workers:
+            if _parse_pool is not None:
+                _parse_pool.shutdown(wait=False)
+            # spawn rather than fork: the API process runs threads (pool, job workers).
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _parse_pool_workers = workers
+        return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+
+def _parse_files(
+    paths: Iterable[str], chunk_size: int, workers: int
+) -> Iterator[tuple[str, list[str] | None, BaseException | None]]:
+    """Yield ``(path, chunks, error)`` for each file as soon as it is parsed.
+
+    With more than one worker, PDF/DOCX parsing runs in a process pool so it
+    uses every core instead of one request thread. ``paths`` is consumed
+    lazily: at most ``2 * workers`` files are in flight, and finished ones are
+    yielded before the next path is asked for, so chunking and embedding
+    overlap with files that are still being produced (e.g. uploads).
+    """
+    if workers <= 1:
+        for path in paths:
+            try:
+                yield path, _parse_file(path, chunk_size), None
+            except Exception as exc:
+                yield path, None, exc
+        return
+    pool = _get_parse_pool(workers)
+    remaining = iter(paths)
+    pending: dict[Future, str] = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < 2 * workers:
+            path = next(remaining, None)
+            if path is None:
+                exhausted = True
+                break
+            pending[pool.submit(_parse_file, path, chunk_size)] = path
+            if any(future.done() for future in pending):
+                break
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path = pending.pop(future)
+            error = future.exception()
+            yield path, None if error else future.result(), error
+
+
+SUPPORTED_SUFFIXES = {".txt", ".pdf", ".docx"}
+
+_DOCUMENT_COPY = "COPY rag.documents (id, pharma_id, source_path, content, metadata) FROM STDIN"
+_EMBEDDING_COPY = "COPY rag.document_embeddings (collection_id, pharma_id, document_id, embedding) FROM STDIN"
+
+
+def _file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(cur: psycopg.Cursor, pharma_id: str, base: Path) -> dict[str, dict[str, Any]]:
+    """Return the manifest entries of ``pharma_id`` for files under ``base``, keyed by path."""
+    cur.execute(
+        """
+        SELECT source_path, size_bytes, mtime_ns, content_hash, chunk_ids, embedding_model
+        FROM rag.index_manifest
+        WHERE pharma_id = %s
+        """,
+        (pharma_id,),
+    )
+    manifest = {}
+    for row in cur.fetchall():
+        if Path(row[0]).is_relative_to(base):
+            manifest[row[0]] = {
+                "size": row[1],
+                "mtime_ns": row[2],
+                "hash": row[3],
+                "chunk_ids": row[4] or [],
+                "embedding_model": row[5],
+            }
+    return manifest
+
+
+def _delete_chunks(cur: psycopg.Cursor, pharma_id: str, source_path: str, entry: dict[str, Any] | None) -> None:
+    if entry is not None:
+        cur.execute(
+            "DELETE FROM rag.documents WHERE pharma_id = %s AND id = ANY(%s)",
+            (pharma_id, entry["chunk_ids"]),
+        )
+    else:
+        # Files indexed before the manifest existed are only known by path.
+        cur.execute(
+            "DELETE FROM rag.documents WHERE pharma_id = %s AND source_path = %s",
+            (pharma_id, source_path),
+        )
+
+
+def _write_chunks(
+    cur: psycopg.Cursor,
+    pharma_id: str,
+    file_path: Path,
+    chunks: list[str],
+    collections: list[dict[str, Any]],
+) -> list[int]:
+    """Load ``chunks`` with a single ``COPY`` and return their ids.
+
+    Ids are reserved from the sequence up front because ``COPY`` cannot return
+    them. The chunks are embedded in one batch per collection in
+    ``collections`` (see :func:`writable_collections`), each loaded by ``COPY``.
+    """
+    if not chunks:
+        return []
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('rag.documents', 'id')) FROM generate_series(1, %s)",
+        (len(chunks),),
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    metadata = json.dumps({"filename": file_path.name})
+    with cur.copy(_DOCUMENT_COPY) as copy:
+        for chunk_id, chunk in zip(ids, chunks):
+            copy.write_row((chunk_id, pharma_id, str(file_path), chunk, metadata))
+    for collection in collections:
+        vectors = collection_embedder(collection).embed_batch(chunks)
+        with cur.copy(_EMBEDDING_COPY) as copy:
+            for chunk_id, vector in zip(ids, vectors):
+                copy.write_row((collection["id"], pharma_id, chunk_id, vector_literal(vector)))
+    return ids
+
+
+def _save_manifest(
+    cur: psycopg.Cursor,
+    pharma_id: str,
+    source_path: str,
+    stat: os.stat_result,
+    content_hash: str,
+    chunk_ids: list[int],
+    embedding_model: str,
+) -> None:
+    cur.execute(
+        """
+        INSERT INTO rag.index_manifest (
+            pharma_id, source_path, size_bytes, mtime_ns, content_hash, chunk_ids, embedding_model
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (pharma_id, source_path) DO UPDATE
+        SET size_bytes = EXCLUDED.size_bytes,
+            mtime_ns = EXCLUDED.mtime_ns,
+            content_hash = EXCLUDED.content_hash,
+            chunk_ids = EXCLUDED.chunk_ids,
+            embedding_model = EXCLUDED.embedding_model,
+            indexed_at = NOW()
+        """,
+        (pharma_id, source_path, stat.st_size, stat.st_mtime_ns, content_hash, chunk_ids, embedding_model),
+    )
+
+
+def _bump_index_version(cur: psycopg.Cursor, pharma_id: str) -> None:
+    # Last statement of the write transaction: the row lock is held only until commit.
+    cur.execute(
+        "UPDATE rag.document_partitions SET index_version = index_version + 1 WHERE pharma_id = %s",
+        (pharma_id,),
+    )
+
+
+def _index_changed(
+    conn: psycopg.Connection,
+    pharma_id: str,
+    files: Iterable[tuple[Path, str | None]],
+    manifest: dict[str, dict[str, Any]],
+    settings: RagSettings,
+    report: dict[str, Any],
+) -> set[str]:
+    """Index ``(path, content_hash)`` pairs against ``manifest`` and return the paths seen.
+
+    ``files`` is consumed lazily: each changed file is handed to the parse pool
+    as soon as it is produced, so parsing overlaps whatever produces the files.
+    A ``None`` hash is computed here. Chunks are embedded into every writable
+    collection; the manifest records the model of the active one.
+    """
+    with conn.cursor() as cur:
+        model = ensure_active_collection(cur, settings)["model"]
+    seen: set[str] = set()
+    changed: dict[str, tuple[dict[str, Any] | None, os.stat_result, str]] = {}
+
+    def to_parse() -> Iterator[str]:
+        for file_path, content_hash in files:
+            source_path = str(file_path)
+            seen.add(source_path)
+            entry = manifest.get(source_path)
+            try:
+                stat = file_path.stat()
+                if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    report["skipped"] += 1
+                    continue
+                content_hash = content_hash or _file_hash(file_path)
+                if entry is not None and entry["hash"] == content_hash:
+                    with conn.transaction(), conn.cursor() as cur:
+                        _save_manifest(
+                            cur, pharma_id, source_path, stat, content_hash, entry["chunk_ids"], model
+                        )
+                    report["skipped"] += 1
+                    continue
+            except Exception as exc:
+                report["errors"].append({"path": source_path, "error": str(exc)})
+                continue
+            changed[source_path] = (entry, stat, content_hash)
+            yield source_path
+
+    for source_path, chunks, error in _parse_files(to_parse(), settings.chunk_size, settings.parse_workers):
+        entry, stat, content_hash = changed[source_path]
+        try:
+            if error is not None:
+                raise error
+            with conn.transaction(), conn.cursor() as cur:
+                collections = writable_collections(cur)
+                _delete_chunks(cur, pharma_id, source_path, entry)
+                chunk_ids = _write_chunks(cur, pharma_id, Path(source_path), chunks, collections)
+                _save_manifest(cur, pharma_id, source_path, stat, content_hash, chunk_ids, model)
+                _bump_index_version(cur, pharma_id)
+        except Exception as exc:
+            report["errors"].append({"path": source_path, "error": str(exc)})
+            continue
+        report["indexed"] += len(chunks)
+        report["updated" if entry is not None else "added"] += 1
+    return seen
+
+
+def _new_report() -> dict[str, Any]:
+    return {"indexed": 0, "added": 0, "updated": 0, "skipped": 0, "removed": 0, "errors": []}
+
+
+def _finish_report(pharma_id: str, report: dict[str, Any], started: float) -> dict[str, Any]:
+    if report["added"] or report["updated"] or report["removed"]:
+        # Other processes see the new index version; this one also frees the memory now.
+        rag_search_cache.invalidate(pharma_id)
+    elapsed = time.perf_counter() - started
+    report["elapsed_s"] = round(elapsed, 3)
+    report["chunks_per_second"] = round(report["indexed"] / elapsed, 1) if elapsed > 0 else 0.0
+    return report
+
+
+def index_folder(pharma_id: str, path: str, settings: RagSettings) -> dict[str, Any]:
+    """Bring the index of ``path`` in line with the files on disk.
+
+    ``rag.index_manifest`` records size, mtime, content hash and chunk ids per
+    file. Files whose size and mtime (or, failing that, hash) are unchanged are
+    skipped; modified files have their chunks replaced and files gone from disk
+    have their chunks deleted. Changed files are parsed in parallel
+    (``settings.parse_workers``) and written as each one finishes. Each file is
+    handled in its own transaction, so a failure is reported in ``errors``
+    without undoing the others.
+    """
     base = Path(path)
     if not base.exists():
         raise FileNotFoundError(path)
 
-    inserted = 0
-    errors: list[dict[str, str]] = []
+    report = _new_report()
+    started = time.perf_counter()
+    files = (
+        (file_path, None)
+        for file_path in sorted(base.rglob("*"))
+        if file_path.suffix.lower() in SUPPORTED_SUFFIXES and file_path.is_file()
+    )
     with get_connection() as conn:
         with conn.cursor() as cur:
-            for file_path in base.rglob("*"):
-                if file_path.suffix.lower() not in {".txt", ".pdf", ".docx"}:
-                    continue
-                try:
-                    content = _read_text(file_path)
-                except Exception as exc:
-                    errors.append({"path": str(file_path), "error": str(exc)})
-                    continue
-                if not content:
-                    continue
-                for chunk in _chunk_text(content, settings.chunk_size):
-                    vector = embed_text(chunk, settings.embedding_dim)
+            cur.execute("SELECT rag.ensure_document_partition(%s)", (pharma_id,))
+            manifest = _load_manifest(cur, pharma_id, base)
+        seen = _index_changed(conn, pharma_id, files, manifest, settings, report)
+        for source_path in sorted(set(manifest) - seen):
+            try:
+                with conn.transaction(), conn.cursor() as cur:
+                    _delete_chunks(cur, pharma_id, source_path, manifest[source_path])
                     cur.execute(
-                        """
-                        INSERT INTO rag.documents (pharma_id, source_path, content, embedding, metadata)
-                        VALUES (%s, %s, %s, %s::vector, %s::jsonb)
-                        """,
-                        (
-                            pharma_id,
-                            str(file_path),
-                            chunk,
-                            vector_literal(vector),
-                            json.dumps({"filename": file_path.name}),
-                        ),
+                        "DELETE FROM rag.index_manifest WHERE pharma_id = %s AND source_path = %s",
+                        (pharma_id, source_path),
                     )
-                    inserted += 1
-    return inserted, errors
+                    _bump_index_version(cur, pharma_id)
+            except psycopg.Error as exc:
+                report["errors"].append({"path": source_path, "error": str(exc)})
+                continue
+            report["removed"] += 1
+    return _finish_report(pharma_id, report, started)
 
 
-def search_documents(pharma_id: str, question: str, settings: RagSettings) -> list[dict[str, str]]:
-    vector = embed_text(question, settings.embedding_dim)
+def index_files(
+    pharma_id: str,
+    base: Path,
+    files: Iterable[tuple[Path, str | None]],
+    settings: RagSettings,
+) -> dict[str, Any]:
+    """Index only ``files`` (``(path, sha256)`` pairs under ``base``), leaving other files alone.
+
+    Used for uploads: ``files`` may be a generator still writing later files
+    while earlier ones are parsed, and hashes computed during the copy are
+    reused instead of reading the file again.
+    """
+    report = _new_report()
+    started = time.perf_counter()
+    files = (
+        (file_path, content_hash)
+        for file_path, content_hash in files
+        if file_path.suffix.lower() in SUPPORTED_SUFFIXES
+    )
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT source_path, content
-                FROM rag.documents
-                WHERE pharma_id = %s
-                ORDER BY embedding <-> %s::vector
-                LIMIT 5
-                """,
-                (pharma_id, vector_literal(vector)),
-            )
-            rows = cur.fetchall()
-    return [{"source_path": row[0], "content": row[1]} for row in rows]
+            cur.execute("SELECT rag.ensure_document_partition(%s)", (pharma_id,))
+            manifest = _load_manifest(cur, pharma_id, base)
+        _index_changed(conn, pharma_id, files, manifest, settings, report)
+    return _finish_report(pharma_id, report, started)
 
 
 def answer_question(
@@ -140,8 +440,10 @@ def answer_question(
     start: date | None,
     end: date | None,
     settings: RagSettings,
+    options: SearchOptions | None = None,
 ) -> dict[str, object]:
-    sources = search_documents(pharma_id, question, settings)
+    retrieval = search_documents(pharma_id, question, settings, options or settings.search)
+    sources = [{"source_path": item["source_path"], "content": item["content"]} for item in retrieval["items"]]
     kpi_summary = build_kpi_summary(pharma_id, start, end)
     table_descriptions = list_table_descriptions()
     prompt = (
@@ -180,4 +482,5 @@ def answer_question(
         "answer": answer,
         "sources": sources,
         "kpi_summary": kpi_summary,
+        "retrieval": {key: retrieval[key] for key in ("mode", "k", "cached", "timings_ms")},
     }
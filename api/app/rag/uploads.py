@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import BinaryIO
+
+_UNSAFE = re.compile(r"[^\w.\- ]+", re.UNICODE)
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def upload_limits() -> tuple[int, int]:
+    """Return ``(max_bytes, chunk_size)`` from ``RAG_UPLOAD_MAX_BYTES`` and ``RAG_UPLOAD_CHUNK_SIZE``."""
+    max_bytes = int(os.environ.get("RAG_UPLOAD_MAX_BYTES", str(250 * 1024 * 1024)))
+    chunk_size = int(os.environ.get("RAG_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    return max_bytes, chunk_size
+
+
+def upload_request_limit() -> int:
+    """Largest ``/rag/upload`` request body, from ``RAG_UPLOAD_MAX_REQUEST_BYTES``.
+
+    Defaults to four files at the per-file limit plus 1 MiB of multipart
+    framing. The multipart body is spooled to temporary files before the
+    handler runs, so this is checked against ``Content-Length`` before it is read.
+    """
+    max_bytes, _ = upload_limits()
+    return int(os.environ.get("RAG_UPLOAD_MAX_REQUEST_BYTES", str(4 * max_bytes + 1024 * 1024)))
+
+
+def safe_filename(filename: str | None) -> str:
+    """Reduce a client-supplied name to a plain file name inside the upload directory.
+
+    Directory parts (``/`` or ``\\``) are dropped, anything but word characters,
+    dots, dashes and spaces becomes ``_``, and leading dots are removed so the
+    result can never be hidden, empty or escape the directory.
+    """
+    name = unicodedata.normalize("NFC", (filename or "").replace("\\", "/")).rsplit("/", 1)[-1]
+    name = _UNSAFE.sub("_", name).strip().lstrip(".")
+    if not name:
+        raise ValueError(f"Invalid file name {filename!r}")
+    stem, dot, suffix = name.rpartition(".")
+    if len(name) > 200:
+        name = (stem[: 199 - len(suffix)] + dot + suffix) if dot else name[:200]
+    return name
+
+
+def save_upload(
+    source: BinaryIO,
+    directory: Path,
+    filename: str,
+    max_bytes: int,
+    chunk_size: int = 1024 * 1024,
+) -> tuple[Path, str, int]:
+    """Copy ``source`` to ``directory / filename`` in ``chunk_size`` blocks.
+
+    Returns the target path, its SHA-256 and its size, both computed while
+    copying. Data goes to a hidden ``.part`` file that is renamed only once
+    complete, so the indexer never sees a half-written file; it is removed if
+    the upload exceeds ``max_bytes`` (:class:`UploadTooLarge`) or fails.
+    """
+    target = directory / filename
+    partial = directory / f".{filename}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with partial.open("wb") as buffer:
+            for block in iter(lambda: source.read(chunk_size), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} exceeds the {max_bytes} byte upload limit")
+                digest.update(block)
+                buffer.write(block)
+        partial.replace(target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return target, digest.hexdigest(), size
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from itertools import chain
+from typing import Any, Iterable, Iterator
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def negotiate_format(request: Request, explicit: str | None) -> str:
+    """Return ``json``, ``ndjson`` or ``csv`` from the ``format`` parameter or the Accept header."""
+    if explicit:
+        return explicit
+    accept = request.headers.get("accept", "")
+    if "application/x-ndjson" in accept or "application/jsonl" in accept:
+        return "ndjson"
+    if "text/csv" in accept:
+        return "csv"
+    return "json"
+
+
+def _ndjson_lines(rows: Iterable[Any]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+def _csv_lines(rows: Iterable[Any]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer: csv.DictWriter | None = None
+    for row in rows:
+        if not isinstance(row, dict):
+            row = {"value": row}
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_rows(rows: Iterable[Any], fmt: str, filename: str | None = None) -> StreamingResponse:
+    """Stream ``rows`` as NDJSON or CSV.
+
+    The first row is pulled before the response starts so that connection and
+    query errors still surface as a normal HTTP error instead of a cut-off body.
+    """
+    iterator = iter(rows)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        source: Iterable[Any] = ()
+    else:
+        source = chain([first], iterator)
+    encode = _csv_lines if fmt == "csv" else _ndjson_lines
+    headers = {}
+    if filename:
+        extension = "csv" if fmt == "csv" else "ndjson"
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return StreamingResponse(encode(source), media_type=STREAM_MEDIA_TYPES[fmt], headers=headers)
@@ -0,0 +1,68 @@
+"""Per-call overhead of a fresh DataSnap connection vs. the pooled keep-alive client.
+
+Usage: python -m benchmarks.datasnap_keepalive [--calls 500]
+
+Starts a stub DataSnap server on 127.0.0.1:8001 and times ``query_thread``
+calls made the old way (one ``httpx.Client`` per call) and through the shared
+client returned by ``get_client``.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import httpx
+
+from api.app.datasnap import close_clients, get_client
+
+from .stub_datasnap import StubDataSnapServer
+
+HOST = "127.0.0.1"
+URL = f"http://{HOST}:8001/query_thread/"
+PAYLOAD = {"sql": "SELECT 1"}
+
+
+def _fresh_client_call() -> None:
+    with httpx.Client(timeout=10) as client:
+        response = client.post(URL, json=PAYLOAD)
+    response.raise_for_status()
+    response.json()
+
+
+def _pooled_call() -> None:
+    get_client(HOST).call("query_thread", PAYLOAD)
+
+
+def _measure(func, calls: int) -> list[float]:
+    func()
+    timings: list[float] = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _report(label: str, timings: list[float]) -> float:
+    ordered = sorted(timings)
+    mean = statistics.mean(ordered)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(f"{label:<14} mean={mean:.3f} ms  p50={statistics.median(ordered):.3f} ms  p99={p99:.3f} ms")
+    return mean
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    with StubDataSnapServer():
+        fresh = _report("fresh client", _measure(_fresh_client_call, args.calls))
+        pooled = _report("pooled client", _measure(_pooled_call, args.calls))
+        close_clients()
+    print(f"saved per call: {fresh - pooled:.3f} ms ({fresh / pooled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
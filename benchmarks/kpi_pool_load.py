@@ -0,0 +1,81 @@
+"""p50/p99 latency of ``/kpi/{pharma_id}/sales`` with and without the Postgres pool.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.kpi_pool_load \
+    [--pharma-id frang] [--requests 2000] [--concurrency 16]
+
+Runs the API in-process (one TestClient per worker thread) against the
+database in ``DATABASE_URL``; the first pass opens a connection per query,
+the second borrows from the pool. The KPI cache is bypassed (its entries
+expire as soon as they are stored) so that every request reaches Postgres;
+clearing it per request would race between the worker threads.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from api.app import db
+from api.app.cache import kpi_cache
+from api.app.main import app
+
+
+def _run(pharma_id: str, total: int, concurrency: int) -> list[float]:
+    local = threading.local()
+    url = f"/kpi/{pharma_id}/sales"
+
+    def one(_: int) -> float:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = TestClient(app)
+        started = time.perf_counter()
+        response = client.get(url)
+        response.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+    ttl, kpi_cache.ttl = kpi_cache.ttl, -1.0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(concurrency)))
+            return list(executor.map(one, range(total)))
+    finally:
+        kpi_cache.ttl = ttl
+        kpi_cache.clear()
+
+
+def _report(label: str, timings: list[float], wall: float) -> None:
+    ordered = sorted(timings)
+    p99 = ordered[max(int(len(ordered) * 0.99) - 1, 0)]
+    print(
+        f"{label:<8} p50={statistics.median(ordered):.2f} ms  p99={p99:.2f} ms  "
+        f"throughput={len(ordered) / wall:.0f} req/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pharma-id", default="frang")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    db.close_pool()
+    started = time.perf_counter()
+    timings = _run(args.pharma_id, args.requests, args.concurrency)
+    _report("no pool", timings, time.perf_counter() - started)
+
+    pool = db.open_pool()
+    pool.wait()
+    started = time.perf_counter()
+    timings = _run(args.pharma_id, args.requests, args.concurrency)
+    _report("pool", timings, time.perf_counter() - started)
+    print(db.pool_stats())
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Recall@k vs. latency of the ``rag.documents`` ANN index against exact search.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.rag_ann_recall --pharma-id frang \
+    [--build ivfflat|hnsw] [--lists N] [--m 16] [--ef-construction 64] \
+    [--k 10] [--samples 50] [--probes 1 2 4 8] [--ef-search 20 40 80]
+
+Optionally (re)builds the index first, then runs vector-only searches for each
+``probes`` (ivfflat) or ``ef_search`` (hnsw) value with questions taken from
+the pharmacy's own chunks, and prints recall and p50/p95 latency per setting.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+from api.app.rag.ann import build_vector_index, recall_report, vector_index_info
+from api.app.rag.service import load_rag_settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pharma-id", required=True)
+    parser.add_argument("--build", choices=["ivfflat", "hnsw"])
+    parser.add_argument("--lists", type=int)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--probes", type=int, nargs="+")
+    parser.add_argument("--ef-search", type=int, nargs="+")
+    args = parser.parse_args()
+
+    if args.build:
+        build = build_vector_index(
+            args.build, pharma_id=args.pharma_id, lists=args.lists, m=args.m, ef_construction=args.ef_construction
+        )
+        print("build:", json.dumps(build["partitions"]))
+    print("index:", json.dumps(vector_index_info(args.pharma_id)["partitions"]))
+    report = recall_report(
+        args.pharma_id,
+        load_rag_settings(),
+        k=args.k,
+        probes=args.probes,
+        ef_search=args.ef_search,
+        samples=args.samples,
+    )
+    knob = "ef_search" if report["method"] == "hnsw" else "probes"
+    print(f"{report['method']}  k={report['k']}  questions={report['questions']}")
+    print(f"{knob:>10} {'recall':>8} {'p50_ms':>9} {'p95_ms':>9}")
+    for row in report["results"]:
+        print(f"{row[knob]:>10} {row['recall']:>8.4f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
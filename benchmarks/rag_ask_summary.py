@@ -0,0 +1,97 @@
+"""``/rag/ask`` latency with the legacy KPI summary vs. the single-query, LIMIT-pushed one.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.rag_ask_summary \
+    [--stock-rows 100000] [--requests 50]
+
+Seeds a scratch pharmacy (``bench_kpi``) with ``--stock-rows`` stock rows,
+plus some sales and purchase rows, then times ``/rag/ask`` in-process with the
+KPI cache cleared before each call. The scratch rows are deleted afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from api.app import kpi
+from api.app.cache import kpi_cache
+from api.app.db import get_connection
+from api.app.main import app
+
+PHARMA_ID = "bench_kpi"
+
+
+def _legacy_summary(pharma_id: str, start: date | None, end: date | None) -> dict:
+    sales = kpi.get_sales_kpi(pharma_id, start, end)
+    stock = kpi.get_stock_alerts(pharma_id)
+    purchases = kpi.get_purchase_changes(pharma_id)
+    return {"sales": sales[:5], "stock_alerts": stock[:5], "purchase_changes": purchases[:5]}
+
+
+def _seed(stock_rows: int) -> None:
+    today = date.today()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(
+                "COPY mart.stock_status (pharma_id, snapshot_date, product_code, product_name, "
+                "stock_qty, coverage_days, status) FROM STDIN"
+            ) as copy:
+                for idx in range(stock_rows):
+                    copy.write_row(
+                        (PHARMA_ID, today, f"{3400930000000 + idx}", f"Produit {idx}", idx % 90, idx % 365, "ok")
+                    )
+            cur.executemany(
+                "INSERT INTO mart.sales_daily (pharma_id, sales_date, gross_revenue, estimated_margin, ticket_count) "
+                "VALUES (%s, %s, %s, %s, %s) ON CONFLICT DO NOTHING",
+                [(PHARMA_ID, today - timedelta(days=idx), 1000 + idx, 250, 80) for idx in range(730)],
+            )
+            cur.executemany(
+                "INSERT INTO mart.purchase_price_changes (pharma_id, product_code, previous_price, latest_price, change_pct) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(PHARMA_ID, f"{3400930000000 + idx}", 10, 11, 10) for idx in range(5000)],
+            )
+            cur.execute("ANALYZE mart.stock_status")
+
+
+def _cleanup() -> None:
+    with get_connection() as conn:
+        for table in ("stock_status", "sales_daily", "purchase_price_changes"):
+            conn.execute(f"DELETE FROM mart.{table} WHERE pharma_id = %s", (PHARMA_ID,))
+
+
+def _measure(client: TestClient, requests: int) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        kpi_cache.clear()
+        started = time.perf_counter()
+        response = client.post("/rag/ask", json={"pharma_id": PHARMA_ID, "question": "ruptures de stock"})
+        response.raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stock-rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    _seed(args.stock_rows)
+    client = TestClient(app)
+    optimized = kpi._load_kpi_summary
+    try:
+        for label, loader in (("legacy", _legacy_summary), ("single query", optimized)):
+            kpi._load_kpi_summary = loader
+            timings = sorted(_measure(client, args.requests))
+            p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+            print(f"{label:<13} p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+    finally:
+        kpi._load_kpi_summary = optimized
+        _cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Index size, recall@k and latency of each vector quantization (none, halfvec, binary).
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.rag_quantization --pharma-id frang \
+    [--method hnsw|ivfflat] [--modes none halfvec binary] [--k 10] [--samples 50] \
+    [--probes 8] [--ef-search 40] [--rerank-factor 1 4 10]
+
+Rebuilds the active collection's ANN indexes (every partition) once per mode,
+measures recall against exact full-precision search and latency for each
+re-rank factor, then restores the collection's original quantization.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+from api.app.rag.ann import build_vector_index, recall_report, vector_index_info
+from api.app.rag.service import load_rag_settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pharma-id", required=True)
+    parser.add_argument("--method", choices=["ivfflat", "hnsw"], default="hnsw")
+    modes = ["none", "halfvec", "binary"]
+    parser.add_argument("--modes", nargs="+", choices=modes, default=modes)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--probes", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[1, 4, 10])
+    args = parser.parse_args()
+
+    settings = load_rag_settings()
+    original = vector_index_info(args.pharma_id)["quantization"]
+    rows = []
+    try:
+        for mode in args.modes:
+            build = build_vector_index(args.method, quantization=mode)
+            print(f"build {mode}:", json.dumps(build["partitions"]))
+            for factor in args.rerank_factor if mode != "none" else [1]:
+                report = recall_report(
+                    args.pharma_id,
+                    settings,
+                    k=args.k,
+                    probes=[args.probes],
+                    ef_search=[args.ef_search],
+                    samples=args.samples,
+                    rerank_factor=factor,
+                )
+                rows.append((mode, factor, report["index_bytes"], report["results"][0]))
+    finally:
+        build_vector_index(args.method, quantization=original)
+
+    baseline = next((size for mode, _, size, _ in rows if mode == "none"), None)
+    print(f"{args.method}  k={args.k}  pharma={args.pharma_id}")
+    print(f"{'mode':>8} {'rerank':>6} {'index_kb':>10} {'ratio':>6} {'recall':>8} {'p50_ms':>9} {'p95_ms':>9}")
+    for mode, factor, size, result in rows:
+        ratio = f"{baseline / size:.1f}x" if baseline and size else "-"
+        print(
+            f"{mode:>8} {factor:>6} {size / 1024:>10.1f} {ratio:>6} {result['recall']:>8.4f} "
+            f"{result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Rows/s of the single-INSERT staging load vs. row-level COPY.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.staging_copy_load \
+    [--rows 1000000] [--batch-size 10000]
+
+Loads the same synthetic ``orditem``-like dataset into a scratch
+``staging.bench_raw`` table twice: once as one JSONB document through
+``insert_payload`` (the historical path) and once as one row per record
+through ``copy_rows``. The table is dropped afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Any, Iterator
+
+from extractor.app.db import copy_rows, get_connection, insert_payload
+
+TABLE = "bench_raw"
+
+
+def synthetic_rows(count: int) -> Iterator[dict[str, Any]]:
+    for idx in range(count):
+        yield {
+            "id": idx,
+            "cip": f"34009{idx % 999983:07d}",
+            "qty": idx % 7 + 1,
+            "price": round(1.5 + (idx % 500) * 0.37, 2),
+            "DTime_Send": 1704067200 + idx * 30,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL", "postgresql://ia:ia@localhost:5432/ia_pharma")
+    with get_connection(database_url) as conn:
+        conn.execute(f"DROP TABLE IF EXISTS staging.{TABLE}")
+        conn.execute(f"CREATE TABLE staging.{TABLE} (LIKE staging.sales_raw INCLUDING DEFAULTS)")
+        try:
+            rows = list(synthetic_rows(args.rows))
+
+            started = time.perf_counter()
+            insert_payload(conn, TABLE, "bench", {"dataset": "bench", "result": rows})
+            insert_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            copy_rows(conn, TABLE, "bench", rows, batch_size=args.batch_size)
+            copy_s = time.perf_counter() - started
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS staging.{TABLE}")
+
+    print(f"single INSERT  {insert_s:8.2f} s  {args.rows / insert_s:12,.0f} rows/s  (1 staging row)")
+    print(f"row-level COPY {copy_s:8.2f} s  {args.rows / copy_s:12,.0f} rows/s  ({args.rows:,} staging rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Minimal DataSnap REST stand-in used by the benchmark scripts.
+
+Answers ``POST /query_thread/`` with a fixed JSON result and ``GET /test/``
+with HTTP 200. Speaks HTTP/1.1 so clients can keep connections alive.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self._send_json({"status": "ok"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self._send_json({"result": [self.server.handle_query(request)]})
+
+
+class StubDataSnapServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 8001) -> None:
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def handle_query(self, request: dict[str, Any]) -> Any:
+        return [{"status": "ok"}]
+
+    def __enter__(self) -> StubDataSnapServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.shutdown()
+        self.server_close()
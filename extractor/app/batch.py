@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any
+
+from .config import Settings, load_settings
+from .extractor import ExtractionError, run_extraction
+from .logger import get_logger, setup_logging
+from .queries import DATASET_QUERIES
+
+
+def _run_job(settings: Settings, pharma_id: str, spec: dict[str, Any]) -> dict[str, Any]:
+    options = {key: value for key, value in spec.items() if key != "dataset"}
+    started = time.perf_counter()
+    try:
+        report = run_extraction(settings, pharma_id, spec["dataset"], **options)
+        outcome: dict[str, Any] = {"status": "ok", "rows": report.get("rows", 0)}
+        for key in ("pages", "mode", "cursor_to", "rows_per_second"):
+            if key in report:
+                outcome[key] = report[key]
+    except Exception as exc:
+        outcome = {"status": "error", "rows": 0, "error": f"{type(exc).__name__}: {exc}"}
+    outcome["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return outcome
+
+
+def run_batch(
+    settings: Settings,
+    datasets: list[dict[str, Any]],
+    pharma_ids: list[str] | None = None,
+    max_concurrency: int | None = None,
+    per_host_concurrency: int | None = None,
+) -> dict[str, Any]:
+    """Run every dataset spec against every selected pharmacy.
+
+    At most ``max_concurrency`` extractions run at once overall and at most
+    ``per_host_concurrency`` against any single DataSnap host, shared by
+    the pharmacies it serves. Jobs are only handed to the pool when their host
+    has a free slot, so a slow pharmacy never holds global workers idle. A
+    failing job is reported, not raised. Dataset names must be unique: they
+    key the report.
+    """
+    names: set[str] = set()
+    for spec in datasets:
+        if not spec.get("dataset") or not spec.get("sql"):
+            raise ExtractionError("Each dataset needs a 'dataset' name and 'sql'")
+        if spec["dataset"] in names:
+            raise ExtractionError(f"Dataset '{spec['dataset']}' is listed more than once")
+        names.add(spec["dataset"])
+    selected = list(settings.pharmacy_hosts) if pharma_ids is None else pharma_ids
+    unknown = [pharma_id for pharma_id in selected if pharma_id not in settings.pharmacy_hosts]
+    if unknown:
+        raise ExtractionError(f"Unknown pharmacy '{unknown[0]}'")
+    global_cap = max(1, max_concurrency or settings.batch_max_concurrency)
+    host_cap = max(1, per_host_concurrency or settings.batch_per_host_concurrency)
+
+    pending: dict[str, deque[dict[str, Any]]] = {
+        pharma_id: deque(datasets) for pharma_id in selected if datasets
+    }
+    host_of = settings.pharmacy_hosts
+    running_per_host: dict[str, int] = {host_of[pharma_id]: 0 for pharma_id in pending}
+    futures: dict[Future[dict[str, Any]], tuple[str, str]] = {}
+    report: dict[str, dict[str, Any]] = {pharma_id: {} for pharma_id in selected}
+    logger = get_logger("batch", jobs=len(selected) * len(datasets), max_concurrency=global_cap)
+    logger.info("batch_started")
+
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=global_cap) as executor:
+        while pending or futures:
+            for pharma_id in list(pending):
+                while (
+                    len(futures) < global_cap
+                    and running_per_host[host_of[pharma_id]] < host_cap
+                    and pending[pharma_id]
+                ):
+                    spec = pending[pharma_id].popleft()
+                    future = executor.submit(_run_job, settings, pharma_id, spec)
+                    futures[future] = (pharma_id, spec["dataset"])
+                    running_per_host[host_of[pharma_id]] += 1
+                if not pending[pharma_id]:
+                    del pending[pharma_id]
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                pharma_id, dataset = futures.pop(future)
+                running_per_host[host_of[pharma_id]] -= 1
+                outcome = future.result()
+                report[pharma_id][dataset] = outcome
+                get_logger("batch", pharma_id=pharma_id, dataset=dataset, **outcome).info("batch_job_done")
+
+    outcomes = [outcome for per_host in report.values() for outcome in per_host.values()]
+    summary = {
+        "started_at": started_at.isoformat(),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "jobs": len(outcomes),
+        "failed": sum(1 for outcome in outcomes if outcome["status"] != "ok"),
+        "rows": sum(outcome["rows"] for outcome in outcomes),
+        "hosts": report,
+    }
+    get_logger("batch", jobs=summary["jobs"], failed=summary["failed"], rows=summary["rows"]).info("batch_done")
+    return summary
+
+
+def _dataset_specs(names: list[str], spec_file: str | None) -> list[dict[str, Any]]:
+    specs: list[dict[str, Any]] = []
+    if spec_file:
+        with open(spec_file, encoding="utf-8") as handle:
+            specs.extend(json.load(handle))
+    for name in names:
+        query = DATASET_QUERIES.get(name)
+        if not query:
+            raise ExtractionError(f"Unknown dataset '{name}'")
+        specs.append({"dataset": name, "sql": query["payload"]["sql"]})
+    return specs
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run extractions across all pharmacies.")
+    parser.add_argument("--dataset", action="append", default=[], help="dataset name from queries.py")
+    parser.add_argument("--spec", help="JSON file with a list of {dataset, sql, ...} specs")
+    parser.add_argument("--pharma", action="append", help="restrict to these pharmacy codes")
+    parser.add_argument("--max-concurrency", type=int)
+    parser.add_argument("--per-host-concurrency", type=int)
+    args = parser.parse_args(argv)
+
+    settings = load_settings()
+    setup_logging(settings.log_level)
+    summary = run_batch(
+        settings,
+        _dataset_specs(args.dataset, args.spec),
+        pharma_ids=args.pharma,
+        max_concurrency=args.max_concurrency,
+        per_host_concurrency=args.per_host_concurrency,
+    )
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2, default=str)
+    sys.stdout.write("\n")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
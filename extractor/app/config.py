@@ -22,6 +22,11 @@ class Settings:
     pharmacy_hosts: dict[str, str]
     datasnap_timeout: float
     datasnap_retries: int
+    datasnap_max_connections: int
+    datasnap_keepalive_expiry: float
+    copy_batch_size: int
+    batch_max_concurrency: int
+    batch_per_host_concurrency: int
     log_level: str
 
 
@@ -32,5 +37,10 @@ def load_settings() -> Settings:
         pharmacy_hosts=_parse_hosts(os.environ.get("PHARMACY_HOSTS", "")),
         datasnap_timeout=float(os.environ.get("DATASNAP_TIMEOUT", "10")),
         datasnap_retries=int(os.environ.get("DATASNAP_RETRIES", "3")),
+        datasnap_max_connections=int(os.environ.get("DATASNAP_MAX_CONNECTIONS", "10")),
+        datasnap_keepalive_expiry=float(os.environ.get("DATASNAP_KEEPALIVE_EXPIRY", "30")),
+        copy_batch_size=int(os.environ.get("STAGING_COPY_BATCH_SIZE", "10000")),
+        batch_max_concurrency=int(os.environ.get("EXTRACT_BATCH_CONCURRENCY", "8")),
+        batch_per_host_concurrency=int(os.environ.get("EXTRACT_BATCH_PER_HOST", "2")),
         log_level=os.environ.get("LOG_LEVEL", "INFO"),
     )
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 import time
 from dataclasses import dataclass
 from typing import Any
@@ -17,33 +18,62 @@ class DataSnapError(RuntimeError):
     pass
 
 
+def _endpoint(base_url: str, method_name: str) -> str:
+    if method_name == "query_thread":
+        return f"{base_url}/query_thread/"
+    return f"{base_url}/datasnap/rest/TServerMethods1/%22{method_name}%22/"
+
+
+def _parse_response(response: httpx.Response) -> DataSnapResponse:
+    data = response.json()
+    if "result" not in data:
+        raise DataSnapError("Missing 'result' field in response")
+    result = data["result"][0] if isinstance(data["result"], list) else data["result"]
+    return DataSnapResponse(raw=data, result=result)
+
+
 class DataSnapClient:
-    def __init__(self, host: str, timeout: float = 10.0, retries: int = 3) -> None:
+    def __init__(
+        self,
+        host: str,
+        timeout: float = 10.0,
+        retries: int = 3,
+        max_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+    ) -> None:
+        self.host = host
         self.base_url = f"http://{host}:8001"
         self.timeout = timeout
         self.retries = retries
+        self._client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+        )
+
+    def __enter__(self) -> DataSnapClient:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._client.close()
 
     def _endpoint(self, method_name: str) -> str:
-        if method_name == "query_thread":
-            return f"{self.base_url}/query_thread/"
-        return f"{self.base_url}/datasnap/rest/TServerMethods1/%22{method_name}%22/"
+        return _endpoint(self.base_url, method_name)
 
     def call(self, method_name: str, payload: dict[str, Any]) -> DataSnapResponse:
         last_error: Exception | None = None
         for attempt in range(1, self.retries + 1):
             try:
-                with httpx.Client(timeout=self.timeout) as client:
-                    response = client.post(
-                        self._endpoint(method_name),
-                        json=payload,
-                        headers={"Accept": "application/json", "Content-Type": "application/json"},
-                    )
+                response = self._client.post(self._endpoint(method_name), json=payload)
                 response.raise_for_status()
-                data = response.json()
-                if "result" not in data:
-                    raise DataSnapError("Missing 'result' field in response")
-                result = data["result"][0] if isinstance(data["result"], list) else data["result"]
-                return DataSnapResponse(raw=data, result=result)
+                return _parse_response(response)
             except (httpx.HTTPError, ValueError, DataSnapError) as exc:
                 last_error = exc
                 if attempt < self.retries:
@@ -51,3 +81,37 @@ class DataSnapClient:
                     continue
                 break
         raise DataSnapError(f"DataSnap call failed after {self.retries} attempts: {last_error}")
+
+
+_clients: dict[str, DataSnapClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    host: str,
+    timeout: float = 10.0,
+    retries: int = 3,
+    max_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+) -> DataSnapClient:
+    """Return the process-wide keep-alive client for ``host``, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = DataSnapClient(
+                host,
+                timeout=timeout,
+                retries=retries,
+                max_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            )
+            _clients[host] = client
+        return client
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+from itertools import islice
+from typing import Any, Iterable
 
 import psycopg
 
@@ -21,3 +22,108 @@ def insert_payload(
             f"INSERT INTO staging.{table} (pharma_id, payload) VALUES (%s, %s)",
             (pharma_id, json.dumps(payload)),
         )
+
+
+def copy_rows(
+    conn: psycopg.Connection,
+    table: str,
+    pharma_id: str,
+    rows: Iterable[Any],
+    batch_size: int = 10000,
+) -> int:
+    """Load one staging row per source record with ``COPY ... FROM STDIN``.
+
+    Each batch is its own COPY statement, so an autocommit connection commits
+    every ``batch_size`` rows. Returns the number of rows written.
+    """
+    iterator = iter(rows)
+    written = 0
+    with conn.cursor() as cur:
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            with cur.copy(f"COPY staging.{table} (pharma_id, payload) FROM STDIN") as copy:
+                for row in batch:
+                    copy.write_row((pharma_id, json.dumps(row)))
+            written += len(batch)
+    return written
+
+
+def get_watermark(conn: psycopg.Connection, pharma_id: str, dataset: str) -> dict[str, Any] | None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT cursor_column, cursor_value, rows_extracted, updated_at, boundary_keys
+            FROM staging.extract_watermarks
+            WHERE pharma_id = %s AND dataset = %s
+            """,
+            (pharma_id, dataset),
+        )
+        row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        "cursor_column": row[0],
+        "cursor_value": row[1],
+        "rows_extracted": row[2],
+        "updated_at": row[3].isoformat() if row[3] else None,
+        "boundary_keys": row[4] or [],
+    }
+
+
+def list_watermarks(conn: psycopg.Connection, pharma_id: str) -> list[dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT dataset, cursor_column, cursor_value, rows_extracted, updated_at
+            FROM staging.extract_watermarks
+            WHERE pharma_id = %s
+            ORDER BY dataset
+            """,
+            (pharma_id,),
+        )
+        rows = cur.fetchall()
+    return [
+        {
+            "dataset": row[0],
+            "cursor_column": row[1],
+            "cursor_value": row[2],
+            "rows_extracted": row[3],
+            "updated_at": row[4].isoformat() if row[4] else None,
+        }
+        for row in rows
+    ]
+
+
+def save_watermark(
+    conn: psycopg.Connection,
+    pharma_id: str,
+    dataset: str,
+    cursor_column: str,
+    cursor_value: Any,
+    rows_extracted: int,
+    boundary_keys: list[Any] | None = None,
+) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO staging.extract_watermarks
+                (pharma_id, dataset, cursor_column, cursor_value, rows_extracted, boundary_keys)
+            VALUES (%s, %s, %s, %s::jsonb, %s, %s::jsonb)
+            ON CONFLICT (pharma_id, dataset) DO UPDATE
+            SET cursor_column = EXCLUDED.cursor_column,
+                cursor_value = EXCLUDED.cursor_value,
+                boundary_keys = EXCLUDED.boundary_keys,
+                rows_extracted = staging.extract_watermarks.rows_extracted + EXCLUDED.rows_extracted,
+                updated_at = NOW()
+            """,
+            (
+                pharma_id,
+                dataset,
+                cursor_column,
+                json.dumps(cursor_value),
+                rows_extracted,
+                json.dumps(boundary_keys or []),
+            ),
+        )
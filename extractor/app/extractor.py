@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import Any
+import json
+import re
+import time
+from typing import Any, Callable, Iterable, Iterator
 
 from .config import Settings
-from .datasnap import DataSnapClient
-from .db import insert_payload
+from .datasnap import DataSnapClient, get_client
+from .db import copy_rows, get_watermark, insert_payload, save_watermark
 from .logger import get_logger
 
 
@@ -12,6 +15,22 @@ class ExtractionError(RuntimeError):
     pass
 
 
+ProgressCallback = Callable[[int, int], None]
+
+
+def _client_for(settings: Settings, pharma_id: str) -> DataSnapClient:
+    host = settings.pharmacy_hosts.get(pharma_id)
+    if not host:
+        raise ExtractionError(f"Unknown pharmacy '{pharma_id}'")
+    return get_client(
+        host,
+        timeout=settings.datasnap_timeout,
+        retries=settings.datasnap_retries,
+        max_connections=settings.datasnap_max_connections,
+        keepalive_expiry=settings.datasnap_keepalive_expiry,
+    )
+
+
 def extract_dataset(
     settings: Settings,
     pharma_id: str,
@@ -21,11 +40,7 @@ def extract_dataset(
 ) -> dict[str, Any]:
     if not sql:
         raise ExtractionError("SQL query is required")
-    host = settings.pharmacy_hosts.get(pharma_id)
-    if not host:
-        raise ExtractionError(f"Unknown pharmacy '{pharma_id}'")
-
-    client = DataSnapClient(host, timeout=settings.datasnap_timeout, retries=settings.datasnap_retries)
+    client = _client_for(settings, pharma_id)
     payload: dict[str, Any] = {"sql": sql}
     if params:
         payload["params"] = params
@@ -37,16 +52,365 @@ def extract_dataset(
     return {"dataset": dataset, "result": response.result}
 
 
+def _check_identifier(name: str, label: str) -> str:
+    if not name.replace("_", "").isalnum():
+        raise ExtractionError(f"Invalid {label} '{name}'")
+    return name
+
+
+def _sql_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.I)
+_WINDOW = re.compile(r"\b(?:LIMIT|OFFSET|FETCH)\b", re.I)
+
+
+def _ends_with_order_by(source: str) -> bool:
+    """Whether ``source`` ends with a top-level ORDER BY and no LIMIT/OFFSET/FETCH."""
+    matches = list(_ORDER_BY.finditer(source))
+    if not matches:
+        return False
+    tail = source[matches[-1].end() :]
+    depth = 0
+    for char in tail:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth < 0:
+            return False
+    return depth == 0 and not _WINDOW.search(tail)
+
+
+def _page_sql(sql: str, page_size: int, offset: int, key_column: str | None, last_key: Any) -> str:
+    source = sql.strip().rstrip(";")
+    if key_column is None:
+        # Engines may drop an ORDER BY inside a derived table, so an ordered
+        # source gets its window appended and keeps the ORDER BY at top level.
+        if _ends_with_order_by(source):
+            return f"{source} LIMIT {page_size} OFFSET {offset}"
+        return f"SELECT * FROM ({source}) AS page_src LIMIT {page_size} OFFSET {offset}"
+    where = "" if last_key is None else f" WHERE page_src.{key_column} > {_sql_literal(last_key)}"
+    return f"SELECT * FROM ({source}) AS page_src{where} ORDER BY page_src.{key_column} LIMIT {page_size}"
+
+
+def _result_rows(result: Any) -> list[Any]:
+    if result is None:
+        return []
+    if isinstance(result, list):
+        return result
+    return [result]
+
+
+def iter_pages(
+    client: DataSnapClient,
+    sql: str,
+    page_size: int,
+    key_column: str | None = None,
+    params: dict[str, Any] | None = None,
+) -> Iterator[list[Any]]:
+    """Yield the rows of ``sql`` one window at a time.
+
+    With ``key_column`` the source is walked by keyset (``key > last``), which
+    stays fast on deep pages; the key must be unique, since rows sharing the
+    last key of a page would be skipped. Otherwise LIMIT/OFFSET windows are
+    used and the source query must end with its own ORDER BY on a unique set
+    of columns for the pages to be stable; the window is then appended to it
+    rather than wrapped around it.
+    """
+    if page_size <= 0:
+        raise ExtractionError("page_size must be positive")
+    if key_column is not None:
+        _check_identifier(key_column, "key column")
+    offset = 0
+    last_key: Any = None
+    while True:
+        payload: dict[str, Any] = {"sql": _page_sql(sql, page_size, offset, key_column, last_key)}
+        if params:
+            payload["params"] = params
+        rows = _result_rows(client.call("query_thread", payload).result)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        offset += len(rows)
+        if key_column is not None:
+            last = rows[-1]
+            if not isinstance(last, dict) or key_column not in last:
+                raise ExtractionError(f"Key column '{key_column}' missing from result rows")
+            last_key = last[key_column]
+
+
+def extract_paged(
+    settings: Settings,
+    pharma_id: str,
+    dataset: str,
+    sql: str,
+    page_size: int,
+    key_column: str | None = None,
+    params: dict[str, Any] | None = None,
+    progress: ProgressCallback | None = None,
+) -> dict[str, Any]:
+    """Page through ``sql`` and COPY each page to staging, one row per record, as soon as it arrives.
+
+    Only one page is held in memory at a time.
+    """
+    if not sql:
+        raise ExtractionError("SQL query is required")
+    client = _client_for(settings, pharma_id)
+    table = f"{dataset}_raw"
+    from .db import get_connection
+
+    rows = 0
+    pages = 0
+    started = time.perf_counter()
+    with get_connection(settings.database_url) as conn:
+        for page in iter_pages(client, sql, page_size, key_column=key_column, params=params):
+            rows += copy_rows(conn, table, pharma_id, page, batch_size=settings.copy_batch_size)
+            pages += 1
+            get_logger("extractor", pharma_id=pharma_id, dataset=dataset, page=pages, rows=rows).info(
+                "page_inserted"
+            )
+            if progress:
+                progress(rows, pages)
+    elapsed = time.perf_counter() - started
+    rows_per_second = round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    get_logger(
+        "extractor",
+        pharma_id=pharma_id,
+        dataset=dataset,
+        rows=rows,
+        pages=pages,
+        rows_per_second=rows_per_second,
+    ).info("paged_extraction_done")
+    return {
+        "dataset": dataset,
+        "rows": rows,
+        "pages": pages,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_second": rows_per_second,
+    }
+
+
+def _since_sql(sql: str, cursor_column: str, cursor_value: Any) -> str:
+    source = sql.strip().rstrip(";")
+    return f"SELECT * FROM ({source}) AS inc_src WHERE inc_src.{cursor_column} >= {_sql_literal(cursor_value)}"
+
+
+def _row_key(row: dict[str, Any], key_column: str | None) -> Any:
+    if key_column is not None:
+        return row.get(key_column)
+    return json.dumps(row, sort_keys=True, default=str)
+
+
+def _new_rows(
+    rows: list[Any],
+    cursor_column: str,
+    key_column: str | None,
+    watermark: Any,
+    extracted_keys: set[Any],
+    cursor: Any,
+    boundary_keys: set[Any],
+) -> tuple[list[Any], Any, set[Any]]:
+    """Drop the rows already extracted at the watermark and advance the cursor over the rest.
+
+    The stored ``watermark`` is re-read inclusively, so rows sharing it that
+    arrived after the previous run are not lost; ``extracted_keys`` (the
+    natural keys written at the watermark) tell the repeats apart, whatever
+    order the source returns rows in. ``cursor`` and ``boundary_keys`` track
+    the highest value seen so far and the keys written at it.
+    Returns the rows to write, the new cursor and its boundary keys.
+    """
+    fresh = []
+    for row in rows:
+        if not isinstance(row, dict):
+            fresh.append(row)
+            continue
+        value = row.get(cursor_column)
+        key = _row_key(row, key_column)
+        if value is not None and value == watermark and key in extracted_keys:
+            continue
+        fresh.append(row)
+        if value is None:
+            continue
+        if cursor is None or value > cursor:
+            cursor, boundary_keys = value, {key}
+        elif value == cursor:
+            boundary_keys.add(key)
+    return fresh, cursor, boundary_keys
+
+
+def extract_incremental(
+    settings: Settings,
+    pharma_id: str,
+    dataset: str,
+    sql: str,
+    cursor_column: str,
+    page_size: int | None = None,
+    key_column: str | None = None,
+    params: dict[str, Any] | None = None,
+    full_resync: bool = False,
+    progress: ProgressCallback | None = None,
+) -> dict[str, Any]:
+    """Extract only the rows whose ``cursor_column`` is past the stored watermark.
+
+    The watermark (last extracted date, id or ``DTime_Send``) is kept per
+    pharmacy and dataset in ``staging.extract_watermarks`` and only advances
+    once every row has been written, so a failed run is simply retried from
+    the previous cursor. ``full_resync`` ignores the stored watermark. The
+    cursor column must be non-decreasing for new or changed source rows.
+
+    The stored cursor value is read again (``>=``) so late rows carrying the
+    same value are picked up; the ones already written are recognised by
+    ``key_column`` (or by their whole content without one), whose values at
+    the watermark are saved with it as ``boundary_keys``.
+    """
+    if not sql:
+        raise ExtractionError("SQL query is required")
+    _check_identifier(cursor_column, "cursor column")
+    client = _client_for(settings, pharma_id)
+    table = f"{dataset}_raw"
+    from .db import get_connection
+
+    rows = 0
+    pages = 0
+    started = time.perf_counter()
+    with get_connection(settings.database_url) as conn:
+        watermark = None if full_resync else get_watermark(conn, pharma_id, dataset)
+        cursor_from = None
+        extracted_keys: set[Any] = set()
+        if watermark and watermark["cursor_column"] == cursor_column:
+            cursor_from = watermark["cursor_value"]
+            extracted_keys = set(watermark.get("boundary_keys") or [])
+        source_sql = sql if cursor_from is None else _since_sql(sql, cursor_column, cursor_from)
+
+        if page_size:
+            source_pages: Iterable[list[Any]] = iter_pages(
+                client, source_sql, page_size, key_column=key_column, params=params
+            )
+        else:
+            payload: dict[str, Any] = {"sql": source_sql}
+            if params:
+                payload["params"] = params
+            source_pages = [_result_rows(client.call("query_thread", payload).result)]
+
+        cursor_to = cursor_from
+        boundary_keys = set(extracted_keys)
+        for page in source_pages:
+            page, cursor_to, boundary_keys = _new_rows(
+                page, cursor_column, key_column, cursor_from, extracted_keys, cursor_to, boundary_keys
+            )
+            if not page:
+                continue
+            rows += copy_rows(conn, table, pharma_id, page, batch_size=settings.copy_batch_size)
+            pages += 1
+            if progress:
+                progress(rows, pages)
+        if rows or full_resync:
+            save_watermark(conn, pharma_id, dataset, cursor_column, cursor_to, rows, sorted(boundary_keys, key=str))
+    elapsed = time.perf_counter() - started
+    rows_per_second = round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    mode = "incremental" if cursor_from is not None else "full"
+    get_logger(
+        "extractor",
+        pharma_id=pharma_id,
+        dataset=dataset,
+        mode=mode,
+        rows=rows,
+        cursor_to=cursor_to,
+    ).info("incremental_extraction_done")
+    return {
+        "dataset": dataset,
+        "mode": mode,
+        "cursor_column": cursor_column,
+        "cursor_from": cursor_from,
+        "cursor_to": cursor_to,
+        "rows": rows,
+        "pages": pages,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_second": rows_per_second,
+    }
+
+
 def persist_result(
     settings: Settings,
     pharma_id: str,
     dataset: str,
     result: dict[str, Any],
-) -> None:
+    row_level: bool = False,
+) -> int:
+    """Write an extraction result to ``staging.<dataset>_raw``.
+
+    By default the whole result is stored as a single JSONB document; with
+    ``row_level`` each source record becomes its own staging row, loaded with
+    COPY. Returns the number of staging rows written.
+    """
     table = f"{dataset}_raw"
     from .db import get_connection
 
     logger = get_logger("extractor", pharma_id=pharma_id, dataset=dataset)
     with get_connection(settings.database_url) as conn:
-        insert_payload(conn, table, pharma_id, result)
+        if row_level:
+            written = copy_rows(
+                conn,
+                table,
+                pharma_id,
+                _result_rows(result.get("result")),
+                batch_size=settings.copy_batch_size,
+            )
+        else:
+            insert_payload(conn, table, pharma_id, result)
+            written = 1
     logger.info("staging_inserted", extra={"table": table})
+    return written
+
+
+def run_extraction(
+    settings: Settings,
+    pharma_id: str,
+    dataset: str,
+    sql: str,
+    params: dict[str, Any] | None = None,
+    page_size: int | None = None,
+    key_column: str | None = None,
+    row_level: bool = False,
+    cursor_column: str | None = None,
+    full_resync: bool = False,
+    progress: ProgressCallback | None = None,
+) -> dict[str, Any]:
+    """Run one extraction in the mode selected by the options and return its report.
+
+    ``progress`` is called with the running (rows, pages) totals after each page.
+    """
+    if cursor_column:
+        return extract_incremental(
+            settings,
+            pharma_id,
+            dataset,
+            sql,
+            cursor_column,
+            page_size=page_size,
+            key_column=key_column,
+            params=params,
+            full_resync=full_resync,
+            progress=progress,
+        )
+    if page_size:
+        return extract_paged(
+            settings,
+            pharma_id,
+            dataset,
+            sql,
+            page_size,
+            key_column=key_column,
+            params=params,
+            progress=progress,
+        )
+    result = extract_dataset(settings, pharma_id, dataset, sql, params)
+    written = persist_result(settings, pharma_id, dataset, result, row_level=row_level)
+    if progress:
+        progress(written, 1)
+    return {"dataset": dataset, "rows": written}
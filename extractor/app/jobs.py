@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import psycopg
+
+from .db import get_connection
+
+
+class JobTracker:
+    """Writes progress and the final outcome of an API-submitted job to ``staging.extract_jobs``."""
+
+    def __init__(self, database_url: str, job_id: int) -> None:
+        self.database_url = database_url
+        self.job_id = job_id
+        self._conn: psycopg.Connection | None = None
+
+    def _execute(self, sql: str, params: tuple[Any, ...]) -> None:
+        if self._conn is None or self._conn.closed:
+            self._conn = get_connection(self.database_url)
+        with self._conn.cursor() as cur:
+            cur.execute(sql, (*params, self.job_id))
+
+    def progress(self, rows: int, pages: int) -> None:
+        self._execute(
+            """
+            UPDATE staging.extract_jobs
+            SET rows_done = %s, pages_done = %s, updated_at = NOW()
+            WHERE id = %s
+            """,
+            (rows, pages),
+        )
+
+    def succeed(self, result: dict[str, Any]) -> None:
+        self._execute(
+            """
+            UPDATE staging.extract_jobs
+            SET status = 'succeeded', result = %s::jsonb, finished_at = NOW(), updated_at = NOW()
+            WHERE id = %s
+            """,
+            (json.dumps(result, default=str),),
+        )
+        self.close()
+
+    def fail(self, error: str) -> None:
+        self._execute(
+            """
+            UPDATE staging.extract_jobs
+            SET status = 'failed', error = %s, finished_at = NOW(), updated_at = NOW()
+            WHERE id = %s
+            """,
+            (error,),
+        )
+        self.close()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -3,8 +3,12 @@ from __future__ import annotations
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
+from .batch import run_batch
 from .config import load_settings
-from .extractor import ExtractionError, extract_dataset, persist_result
+from .datasnap import close_clients
+from .db import get_connection, list_watermarks
+from .extractor import ExtractionError, run_extraction
+from .jobs import JobTracker
 from .logger import setup_logging
 
 settings = load_settings()
@@ -13,9 +17,38 @@ setup_logging(settings.log_level)
 app = FastAPI(title="Winpharma Extractor")
 
 
+@app.on_event("shutdown")
+def close_datasnap_clients() -> None:
+    close_clients()
+
+
 class ExtractRequest(BaseModel):
     sql: str
     params: dict | None = None
+    page_size: int | None = None
+    key_column: str | None = None
+    row_level: bool = False
+    cursor_column: str | None = None
+    full_resync: bool = False
+    job_id: int | None = None
+
+
+class BatchDataset(BaseModel):
+    dataset: str
+    sql: str
+    params: dict | None = None
+    page_size: int | None = None
+    key_column: str | None = None
+    row_level: bool = False
+    cursor_column: str | None = None
+    full_resync: bool = False
+
+
+class BatchRequest(BaseModel):
+    datasets: list[BatchDataset]
+    pharma_ids: list[str] | None = None
+    max_concurrency: int | None = None
+    per_host_concurrency: int | None = None
 
 
 @app.get("/health")
@@ -25,14 +58,49 @@ def health() -> dict:
 
 @app.post("/extract/{pharma_id}/{dataset}")
 def extract(pharma_id: str, dataset: str, payload: ExtractRequest) -> dict:
+    tracker = JobTracker(settings.database_url, payload.job_id) if payload.job_id else None
+    options = payload.model_dump(exclude={"job_id"})
+    try:
+        report = run_extraction(
+            settings,
+            pharma_id,
+            dataset,
+            progress=tracker.progress if tracker else None,
+            **options,
+        )
+    except Exception as exc:
+        if tracker:
+            tracker.fail(f"{type(exc).__name__}: {exc}")
+        if isinstance(exc, ExtractionError):
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        raise
+    response = {"status": "ok", **report}
+    if tracker:
+        tracker.succeed(response)
+    return response
+
+
+@app.post("/extract/batch")
+def extract_batch(payload: BatchRequest) -> dict:
     try:
-        result = extract_dataset(settings, pharma_id, dataset, payload.sql, payload.params)
-        persist_result(settings, pharma_id, dataset, result)
-        return {"status": "ok", "dataset": dataset}
+        return run_batch(
+            settings,
+            [spec.model_dump() for spec in payload.datasets],
+            pharma_ids=payload.pharma_ids,
+            max_concurrency=payload.max_concurrency,
+            per_host_concurrency=payload.per_host_concurrency,
+        )
     except ExtractionError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
+@app.get("/watermarks/{pharma_id}")
+def watermarks(pharma_id: str) -> dict:
+    with get_connection(settings.database_url) as conn:
+        items = list_watermarks(conn, pharma_id)
+    return {"pharma_id": pharma_id, "items": items}
+
+
 def run() -> None:
     import uvicorn
 
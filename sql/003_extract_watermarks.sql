@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS staging.extract_watermarks (
+    pharma_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    cursor_column TEXT NOT NULL,
+    cursor_value JSONB,
+    rows_extracted BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (pharma_id, dataset)
+);
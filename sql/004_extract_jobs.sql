@@ -0,0 +1,18 @@
+CREATE TABLE IF NOT EXISTS staging.extract_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    pharma_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    request JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_extract_jobs_status ON staging.extract_jobs (status);
+CREATE INDEX IF NOT EXISTS idx_extract_jobs_pharma_created ON staging.extract_jobs (pharma_id, created_at DESC);
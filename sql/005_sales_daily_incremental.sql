@@ -0,0 +1,21 @@
+-- Keep the most recent row per (pharma_id, sales_date) before enforcing uniqueness.
+DELETE FROM mart.sales_daily older
+USING mart.sales_daily newer
+WHERE older.pharma_id = newer.pharma_id
+AND older.sales_date = newer.sales_date
+AND older.id < newer.id;
+
+ALTER TABLE mart.sales_daily ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+DROP INDEX IF EXISTS mart.idx_sales_daily_pharma_date;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sales_daily_pharma_date ON mart.sales_daily (pharma_id, sales_date);
+
+CREATE INDEX IF NOT EXISTS idx_sales_raw_pharma_id ON staging.sales_raw (pharma_id, id);
+
+CREATE TABLE IF NOT EXISTS mart.refresh_state (
+    pharma_id TEXT NOT NULL,
+    mart_table TEXT NOT NULL,
+    last_staging_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (pharma_id, mart_table)
+);
@@ -0,0 +1,19 @@
+CREATE TABLE IF NOT EXISTS mart.sales_rollup (
+    pharma_id TEXT NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('week', 'month', 'year')),
+    period_start DATE NOT NULL,
+    gross_revenue NUMERIC,
+    estimated_margin NUMERIC,
+    ticket_count BIGINT,
+    day_count INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (pharma_id, grain, period_start)
+);
+
+INSERT INTO mart.sales_rollup (pharma_id, grain, period_start, gross_revenue, estimated_margin, ticket_count, day_count)
+SELECT pharma_id, grain.name, date_trunc(grain.name, sales_date)::date,
+    SUM(gross_revenue), SUM(estimated_margin), SUM(ticket_count), COUNT(*)
+FROM mart.sales_daily
+CROSS JOIN (VALUES ('week'), ('month'), ('year')) AS grain(name)
+GROUP BY pharma_id, grain.name, date_trunc(grain.name, sales_date)::date
+ON CONFLICT (pharma_id, grain, period_start) DO NOTHING;
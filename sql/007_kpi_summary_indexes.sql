@@ -0,0 +1,4 @@
+CREATE INDEX IF NOT EXISTS idx_stock_status_pharma_coverage
+    ON mart.stock_status (pharma_id, coverage_days DESC NULLS LAST);
+CREATE INDEX IF NOT EXISTS idx_purchase_price_pharma_detected
+    ON mart.purchase_price_changes (pharma_id, detected_at DESC);
@@ -0,0 +1,15 @@
+-- Keyset pagination orders on (sort key, id); these replace the 007 indexes.
+DROP INDEX IF EXISTS mart.idx_stock_status_pharma_coverage;
+DROP INDEX IF EXISTS mart.idx_purchase_price_pharma_detected;
+
+CREATE INDEX IF NOT EXISTS idx_stock_status_pharma_coverage_id
+    ON mart.stock_status (pharma_id, coverage_days DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS idx_stock_status_pharma_status_coverage_id
+    ON mart.stock_status (pharma_id, status, coverage_days DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS idx_stock_status_pharma_snapshot_coverage_id
+    ON mart.stock_status (pharma_id, snapshot_date, coverage_days DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_purchase_price_pharma_detected_id
+    ON mart.purchase_price_changes (pharma_id, detected_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_price_pharma_change
+    ON mart.purchase_price_changes (pharma_id, change_pct);
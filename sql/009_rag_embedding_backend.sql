@@ -0,0 +1,8 @@
+-- Each vector records the embedding backend and dimension that produced it; search only
+-- compares vectors from the configured backend. Rows from the old digest embedding have no
+-- backend and must be re-indexed.
+ALTER TABLE rag.documents ADD COLUMN IF NOT EXISTS embedding_model TEXT;
+ALTER TABLE rag.documents ADD COLUMN IF NOT EXISTS embedding_dim INTEGER;
+
+CREATE INDEX IF NOT EXISTS idx_rag_documents_pharma_model
+    ON rag.documents (pharma_id, embedding_model);
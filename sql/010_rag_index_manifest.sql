@@ -0,0 +1,16 @@
+-- One row per indexed file: re-indexing skips files whose size/mtime or content hash is
+-- unchanged and replaces or deletes the listed chunks otherwise.
+CREATE TABLE IF NOT EXISTS rag.index_manifest (
+    pharma_id TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    content_hash TEXT NOT NULL,
+    chunk_ids BIGINT[] NOT NULL DEFAULT '{}',
+    embedding_model TEXT,
+    indexed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (pharma_id, source_path)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rag_documents_pharma_source
+    ON rag.documents (pharma_id, source_path);
@@ -0,0 +1,7 @@
+-- French full-text column for hybrid retrieval. Generated, so COPY and INSERT stay unchanged.
+ALTER TABLE rag.documents
+    ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('french', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_rag_documents_content_tsv
+    ON rag.documents USING GIN (content_tsv);
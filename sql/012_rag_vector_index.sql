@@ -0,0 +1,4 @@
+-- The ivfflat index from 001 was created on an empty table, so its centroids were never
+-- trained. Drop it; build a properly sized one once documents are loaded with
+-- POST /rag/vector_index (ivfflat lists sized to the row count, or hnsw).
+DROP INDEX IF EXISTS rag.idx_rag_documents_embedding;
@@ -0,0 +1,85 @@
+-- rag.documents becomes LIST-partitioned by pharma_id: each pharmacy's chunks, and its
+-- vector index, live in their own partition, so a search only ever scans that pharmacy.
+-- Partitions are created on demand by rag.ensure_document_partition(), which the indexer
+-- calls before writing. Existing rows are moved into one partition per pharmacy.
+
+CREATE TABLE IF NOT EXISTS rag.document_partitions (
+    pharma_id TEXT PRIMARY KEY,
+    partition_name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION rag.document_partition_name(p_pharma_id TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT 'documents_'
+        || left(regexp_replace(lower(p_pharma_id), '[^a-z0-9_]', '_', 'g'), 32)
+        || '_' || left(md5(p_pharma_id), 8)
+$$;
+
+CREATE OR REPLACE FUNCTION rag.ensure_document_partition(p_pharma_id TEXT) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_name TEXT;
+BEGIN
+    SELECT partition_name INTO v_name FROM rag.document_partitions WHERE pharma_id = p_pharma_id;
+    IF FOUND THEN
+        RETURN v_name;
+    END IF;
+    -- Serialise concurrent first writes for the same pharmacy.
+    PERFORM pg_advisory_xact_lock(hashtext('rag.documents:' || p_pharma_id));
+    SELECT partition_name INTO v_name FROM rag.document_partitions WHERE pharma_id = p_pharma_id;
+    IF FOUND THEN
+        RETURN v_name;
+    END IF;
+    v_name := rag.document_partition_name(p_pharma_id);
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS rag.%I PARTITION OF rag.documents FOR VALUES IN (%L)',
+        v_name, p_pharma_id
+    );
+    INSERT INTO rag.document_partitions (pharma_id, partition_name) VALUES (p_pharma_id, v_name);
+    RETURN v_name;
+END;
+$$;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'rag.documents'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    CREATE TABLE rag.documents_partitioned (
+        id BIGINT NOT NULL DEFAULT nextval('rag.documents_id_seq'),
+        pharma_id TEXT NOT NULL,
+        source_path TEXT NOT NULL,
+        content TEXT NOT NULL,
+        embedding VECTOR(128),
+        metadata JSONB,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        embedding_model TEXT,
+        embedding_dim INTEGER,
+        content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('french', content)) STORED,
+        PRIMARY KEY (pharma_id, id)
+    ) PARTITION BY LIST (pharma_id);
+
+    ALTER SEQUENCE rag.documents_id_seq OWNED BY rag.documents_partitioned.id;
+    ALTER TABLE rag.documents RENAME TO documents_unpartitioned;
+    ALTER TABLE rag.documents_partitioned RENAME TO documents;
+
+    PERFORM rag.ensure_document_partition(pharma_id)
+    FROM (SELECT DISTINCT pharma_id FROM rag.documents_unpartitioned) AS pharmacies;
+
+    INSERT INTO rag.documents (
+        id, pharma_id, source_path, content, embedding, metadata, created_at, embedding_model, embedding_dim
+    )
+    SELECT id, pharma_id, source_path, content, embedding, metadata, created_at, embedding_model, embedding_dim
+    FROM rag.documents_unpartitioned;
+
+    DROP TABLE rag.documents_unpartitioned;
+END;
+$$;
+
+-- Defined on the parent, so every partition (present and future) gets them.
+CREATE INDEX IF NOT EXISTS idx_rag_documents_pharma_model ON rag.documents (pharma_id, embedding_model);
+CREATE INDEX IF NOT EXISTS idx_rag_documents_pharma_source ON rag.documents (pharma_id, source_path);
+CREATE INDEX IF NOT EXISTS idx_rag_documents_content_tsv ON rag.documents USING GIN (content_tsv);
+-- Vector indexes are built per partition, sized to that pharmacy: POST /rag/vector_index.
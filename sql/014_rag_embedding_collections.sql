@@ -0,0 +1,104 @@
+-- Embeddings move out of rag.documents into one collection per (model, dimension). Search
+-- reads the single 'active' collection; a new collection is filled in the background
+-- ('building') while the indexer writes to both, then swapped in atomically. The vector
+-- column has no fixed dimension: indexes and queries cast it to the collection's size.
+
+CREATE TABLE IF NOT EXISTS rag.embedding_collections (
+    id SERIAL PRIMARY KEY,
+    backend TEXT NOT NULL,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL CHECK (dim BETWEEN 1 AND 16000),
+    status TEXT NOT NULL DEFAULT 'building',
+    index_method TEXT NOT NULL DEFAULT 'ivfflat',
+    activate_when_ready BOOLEAN NOT NULL DEFAULT TRUE,
+    rows_total BIGINT NOT NULL DEFAULT 0,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    activated_at TIMESTAMPTZ,
+    UNIQUE (model, dim)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_embedding_collections_active
+    ON rag.embedding_collections ((TRUE)) WHERE status = 'active';
+
+CREATE TABLE IF NOT EXISTS rag.document_embeddings (
+    collection_id INTEGER NOT NULL REFERENCES rag.embedding_collections (id) ON DELETE CASCADE,
+    pharma_id TEXT NOT NULL,
+    document_id BIGINT NOT NULL,
+    embedding VECTOR NOT NULL,
+    PRIMARY KEY (pharma_id, collection_id, document_id),
+    FOREIGN KEY (pharma_id, document_id) REFERENCES rag.documents (pharma_id, id) ON DELETE CASCADE
+) PARTITION BY LIST (pharma_id);
+
+ALTER TABLE rag.document_partitions ADD COLUMN IF NOT EXISTS embeddings_partition TEXT;
+
+CREATE OR REPLACE FUNCTION rag.ensure_document_partition(p_pharma_id TEXT) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_name TEXT;
+    v_embeddings TEXT;
+BEGIN
+    SELECT partition_name INTO v_name
+    FROM rag.document_partitions
+    WHERE pharma_id = p_pharma_id AND embeddings_partition IS NOT NULL;
+    IF FOUND THEN
+        RETURN v_name;
+    END IF;
+    -- Serialise concurrent first writes for the same pharmacy.
+    PERFORM pg_advisory_xact_lock(hashtext('rag.documents:' || p_pharma_id));
+    v_name := rag.document_partition_name(p_pharma_id);
+    v_embeddings := 'embeddings' || substr(v_name, length('documents') + 1);
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS rag.%I PARTITION OF rag.documents FOR VALUES IN (%L)',
+        v_name, p_pharma_id
+    );
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS rag.%I PARTITION OF rag.document_embeddings FOR VALUES IN (%L)',
+        v_embeddings, p_pharma_id
+    );
+    INSERT INTO rag.document_partitions (pharma_id, partition_name, embeddings_partition)
+    VALUES (p_pharma_id, v_name, v_embeddings)
+    ON CONFLICT (pharma_id) DO UPDATE SET embeddings_partition = EXCLUDED.embeddings_partition;
+    RETURN v_name;
+END;
+$$;
+
+SELECT rag.ensure_document_partition(pharma_id) FROM rag.document_partitions WHERE embeddings_partition IS NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'rag' AND table_name = 'documents' AND column_name = 'embedding'
+    ) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO rag.embedding_collections (backend, model, dim, status)
+    SELECT split_part(embedding_model, '-', 1), embedding_model, embedding_dim, 'retired'
+    FROM rag.documents
+    WHERE embedding IS NOT NULL AND embedding_model IS NOT NULL
+    GROUP BY embedding_model, embedding_dim
+    ORDER BY count(*) DESC
+    ON CONFLICT (model, dim) DO NOTHING;
+
+    UPDATE rag.embedding_collections
+    SET status = 'active', activated_at = NOW()
+    WHERE id = (SELECT min(id) FROM rag.embedding_collections)
+    AND NOT EXISTS (SELECT 1 FROM rag.embedding_collections WHERE status = 'active');
+
+    INSERT INTO rag.document_embeddings (collection_id, pharma_id, document_id, embedding)
+    SELECT c.id, d.pharma_id, d.id, d.embedding
+    FROM rag.documents d
+    JOIN rag.embedding_collections c ON c.model = d.embedding_model AND c.dim = d.embedding_dim
+    WHERE d.embedding IS NOT NULL;
+
+    -- Also drops the per-partition vector indexes and idx_rag_documents_pharma_model.
+    ALTER TABLE rag.documents
+        DROP COLUMN embedding,
+        DROP COLUMN embedding_model,
+        DROP COLUMN embedding_dim;
+END;
+$$;
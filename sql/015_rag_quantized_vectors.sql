@@ -0,0 +1,9 @@
+-- ANN indexes can scan a quantized copy of each vector: halfvec (2 bytes per dimension, index about 2x
+-- smaller) or binary_quantize() (1 bit per dimension, about 32x smaller). rag.document_embeddings keeps
+-- full-precision vectors, which re-rank the candidates the index returns. Needs pgvector >= 0.7.
+
+ALTER EXTENSION vector UPDATE;
+
+ALTER TABLE rag.embedding_collections
+    ADD COLUMN IF NOT EXISTS quantization TEXT NOT NULL DEFAULT 'none'
+    CHECK (quantization IN ('none', 'halfvec', 'binary'));
@@ -0,0 +1,4 @@
+-- Bumped in every transaction that changes a pharmacy's chunks. Cached search results are keyed by it,
+-- so every API process stops serving results from before an indexing run.
+
+ALTER TABLE rag.document_partitions ADD COLUMN IF NOT EXISTS index_version BIGINT NOT NULL DEFAULT 0;
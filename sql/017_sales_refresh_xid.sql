@@ -0,0 +1,13 @@
+-- staging ids are handed out when a row is inserted but become visible when its transaction
+-- commits, so "id > last refreshed id" skips rows committed late by a concurrent extraction.
+-- Each staging row now records the transaction that wrote it; a refresh reads every row whose
+-- transaction was not yet finished at the previous refresh (pg_snapshot_xmin), and the upsert
+-- keeps the highest staging id per day, so re-reading rows is harmless.
+
+ALTER TABLE staging.sales_raw ADD COLUMN IF NOT EXISTS txid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_sales_raw_pharma_txid ON staging.sales_raw (pharma_id, txid);
+
+ALTER TABLE mart.sales_daily ADD COLUMN IF NOT EXISTS staging_id BIGINT;
+
+-- '0' makes the first refresh after this migration re-read the whole staging history once.
+ALTER TABLE mart.refresh_state ADD COLUMN IF NOT EXISTS last_xmin xid8 NOT NULL DEFAULT '0';
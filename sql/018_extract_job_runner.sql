@@ -0,0 +1,4 @@
+-- Who claimed a running job: 'extractor' when delegated to the extractor service, otherwise
+-- 'api@<host>' for a direct DataSnap query run inside that API process. On startup an API
+-- process requeues the jobs it was running itself, since nothing else can finish them.
+ALTER TABLE staging.extract_jobs ADD COLUMN IF NOT EXISTS runner TEXT;
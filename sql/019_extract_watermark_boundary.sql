@@ -0,0 +1,3 @@
+-- Natural keys of the rows already extracted at cursor_value. Incremental runs re-read the
+-- watermark value inclusively (>=) and skip these keys, so late rows sharing it are not lost.
+ALTER TABLE staging.extract_watermarks ADD COLUMN IF NOT EXISTS boundary_keys JSONB NOT NULL DEFAULT '[]';
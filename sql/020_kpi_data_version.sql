@@ -0,0 +1,61 @@
+-- Bumped by every statement that changes a pharmacy's KPI marts, whoever runs it (API refresh,
+-- extractor, manual load). Cached KPI responses are keyed by it, so every API process stops
+-- serving payloads from before the change without waiting for KPI_CACHE_TTL.
+CREATE TABLE IF NOT EXISTS mart.data_versions (
+    pharma_id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION mart.bump_data_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO mart.data_versions (pharma_id, version)
+    SELECT DISTINCT pharma_id, 1 FROM changed
+    ON CONFLICT (pharma_id) DO UPDATE
+    SET version = mart.data_versions.version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION mart.bump_all_data_versions() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE mart.data_versions SET version = version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    mart_table TEXT;
+BEGIN
+    FOREACH mart_table IN ARRAY ARRAY['sales_daily', 'sales_rollup', 'stock_status', 'purchase_price_changes']
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON mart.%I', mart_table || '_version_ins', mart_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON mart.%I REFERENCING NEW TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION mart.bump_data_version()',
+            mart_table || '_version_ins', mart_table
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON mart.%I', mart_table || '_version_upd', mart_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON mart.%I REFERENCING NEW TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION mart.bump_data_version()',
+            mart_table || '_version_upd', mart_table
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON mart.%I', mart_table || '_version_del', mart_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON mart.%I REFERENCING OLD TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION mart.bump_data_version()',
+            mart_table || '_version_del', mart_table
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON mart.%I', mart_table || '_version_trunc', mart_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER TRUNCATE ON mart.%I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION mart.bump_all_data_versions()',
+            mart_table || '_version_trunc', mart_table
+        );
+    END LOOP;
+END;
+$$;
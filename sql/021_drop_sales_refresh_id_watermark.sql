@@ -0,0 +1,5 @@
+-- The sales refresh tracks staging rows by transaction since sql/017_sales_refresh_xid.sql:
+-- the id watermark of sql/005_sales_daily_incremental.sql and its index are no longer read.
+
+ALTER TABLE mart.refresh_state DROP COLUMN IF EXISTS last_staging_id;
+DROP INDEX IF EXISTS staging.idx_sales_raw_pharma_id;
@@ -1,13 +1,49 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+
+import pytest
 from fastapi.testclient import TestClient
 
-from api.app import main
+from api.app import kpi, main
+from api.app.cache import etag_matches
+from api.app.kpi import decode_cursor, encode_cursor
 
 
 client = TestClient(main.app)
 
 
+class FakeKpiConnection:
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.params: dict = {}
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql: str, params: dict) -> None:
+        self.params = params
+
+    def fetchall(self) -> list[tuple]:
+        return self.rows[: self.params.get("limit")]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+@pytest.fixture(autouse=True)
+def data_version(monkeypatch) -> dict[str, int]:
+    versions: dict[str, int] = {}
+    monkeypatch.setattr(main, "kpi_data_version", lambda pharma_id: versions.get(pharma_id, 0))
+    return versions
+
+
 def test_health_endpoint(monkeypatch) -> None:
     monkeypatch.setattr(main, "check_connection", lambda: True)
     response = client.get("/health")
@@ -20,3 +56,149 @@ def test_sales_kpi_endpoint(monkeypatch) -> None:
     response = client.get("/kpi/frang/sales")
     assert response.status_code == 200
     assert response.json()["items"][0]["sales_date"] == "2024-01-01"
+
+
+def test_extract_returns_job_immediately(monkeypatch) -> None:
+    monkeypatch.setenv("EXTRACTOR_URL", "http://extractor:8000")
+    submitted = {}
+
+    def fake_submit(pharma_id, dataset, request):
+        submitted.update(pharma_id=pharma_id, dataset=dataset, request=request)
+        return {"id": 7, "status": "queued", "progress": {"rows": 0, "pages": 0}}
+
+    monkeypatch.setattr(main, "submit_extraction", fake_submit)
+    response = client.post("/extract/frang/sales", json={"sql": "SELECT 1"})
+    assert response.status_code == 202
+    assert response.json()["id"] == 7
+    assert submitted["request"]["sql"] == "SELECT 1"
+
+
+def test_job_status_not_found(monkeypatch) -> None:
+    monkeypatch.setattr(main, "get_job", lambda _: None)
+    response = client.get("/jobs/99")
+    assert response.status_code == 404
+
+
+def test_sales_kpi_auto_granularity_uses_rollup(monkeypatch) -> None:
+    calls = {}
+
+    def fake_rollup(pharma_id, grain, start, end):
+        calls["grain"] = grain
+        return [{"period_start": "2023-01-01"}]
+
+    monkeypatch.setattr(main, "get_sales_rollup", fake_rollup)
+    response = client.get("/kpi/frang/sales?from=2020-01-01&to=2023-12-31&granularity=auto")
+    assert response.status_code == 200
+    assert response.json()["granularity"] == "month"
+    assert calls["grain"] == "month"
+
+
+def test_sales_rollup_cuts_edge_periods(monkeypatch) -> None:
+    conn = FakeKpiConnection(
+        [
+            (date(2024, 3, 1), date(2024, 3, 10), Decimal("120.50"), Decimal("30"), 12, 10, True),
+            (date(2024, 2, 1), date(2024, 2, 29), Decimal("900"), Decimal("200"), 80, 29, False),
+            (date(2024, 1, 15), date(2024, 1, 31), Decimal("400"), None, 35, 17, True),
+        ]
+    )
+    monkeypatch.setattr(kpi, "get_connection", lambda: conn)
+    items = kpi.get_sales_rollup("big", "month", date(2024, 1, 15), date(2024, 3, 10))
+    assert conn.params == {"pharma_id": "big", "grain": "month", "start": date(2024, 1, 15), "end": date(2024, 3, 10)}
+    assert [(i["period_start"], i["period_end"], i["partial"]) for i in items] == [
+        ("2024-03-01", "2024-03-10", True),
+        ("2024-02-01", "2024-02-29", False),
+        ("2024-01-15", "2024-01-31", True),
+    ]
+    assert items[0]["gross_revenue"] == 120.5 and items[2]["estimated_margin"] is None
+    # Whole periods come from the rollup, cut ones from the daily mart.
+    whole, edges = kpi.SALES_ROLLUP_SQL.split("), edges AS (")
+    assert "mart.sales_rollup" in whole and "mart.sales_daily" in edges
+
+
+def test_kpi_cache_etag_and_invalidation(monkeypatch, data_version) -> None:
+    main.kpi_cache.clear()
+    calls = []
+
+    def fake_alerts(pharma_id, **_):
+        calls.append(pharma_id)
+        return {"items": [{"product_code": "3400930000001", "status": "low"}], "next_cursor": None}
+
+    monkeypatch.setattr(main, "get_stock_alerts_page", fake_alerts)
+    first = client.get("/kpi/gpp/stock_alerts")
+    etag = first.headers["etag"]
+    second = client.get("/kpi/gpp/stock_alerts", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert len(calls) == 1
+
+    main.kpi_cache.invalidate("gpp")
+    third = client.get("/kpi/gpp/stock_alerts")
+    assert third.status_code == 200
+    assert len(calls) == 2
+    assert main.kpi_cache.stats()["hits"] >= 1
+
+    # A write to the marts from another process bumps the version: no stale hit.
+    data_version["gpp"] = 1
+    fourth = client.get("/kpi/gpp/stock_alerts", headers={"If-None-Match": etag})
+    assert len(calls) == 3
+    assert fourth.status_code == 304
+
+
+def test_if_none_match_compares_whole_tags() -> None:
+    etag = '"abc123"'
+    assert etag_matches('"abc123"', etag)
+    assert etag_matches('"zzz", W/"abc123" , "yyy"', etag)
+    assert etag_matches(" * ", etag)
+    assert etag_matches('"a,b", "abc123"', etag)
+    assert not etag_matches('"abc1234"', etag)
+    assert not etag_matches('"xabc123"', etag)
+    assert not etag_matches("abc123", etag)
+    assert not etag_matches('"*"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_stock_alerts_keyset_page(monkeypatch) -> None:
+    main.kpi_cache.clear()
+    conn = FakeKpiConnection([(10 - idx, "p", "P", 1, Decimal("30.125") - idx, "low") for idx in range(3)])
+    monkeypatch.setattr(kpi, "get_connection", lambda: conn)
+    response = client.get("/kpi/big/stock_alerts?status=low&limit=2")
+    body = response.json()
+    assert conn.params["limit"] == 3
+    assert conn.params["status"] == "low"
+    assert [item["id"] for item in body["items"]] == [10, 9]
+    # The cursor keeps the exact numeric, not a float.
+    assert decode_cursor(body["next_cursor"], 2) == ["29.125", 9]
+
+
+def test_stock_alerts_cursor_is_a_row_comparison() -> None:
+    sql, params = kpi._stock_alerts_query("big", "low", None, 101, encode_cursor("29.125", 9))
+    first_branch = sql.split("UNION ALL")[0]
+    assert "(coverage_days, id) < (%(after_coverage)s::numeric, %(after_id)s)" in first_branch
+    assert " OR " not in sql
+    assert "coverage_days IS NULL" in sql.split("UNION ALL")[1]
+    assert (params["after_coverage"], params["after_id"]) == ("29.125", 9)
+
+    sql, params = kpi._stock_alerts_query("big", None, None, 101, encode_cursor(None, 4))
+    assert "UNION ALL" not in sql and "coverage_days IS NULL AND id < %(after_id)s" in sql
+    with pytest.raises(ValueError):
+        kpi._stock_alerts_query("big", None, None, 101, encode_cursor("abc", 4))
+
+
+def test_stock_alerts_rejects_bad_cursor() -> None:
+    main.kpi_cache.clear()
+    response = client.get("/kpi/big/stock_alerts?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+
+def test_stock_alerts_export_formats(monkeypatch) -> None:
+    rows = [{"id": 2, "product_code": "A", "status": "low"}, {"id": 1, "product_code": "B", "status": "out"}]
+    monkeypatch.setattr(main, "iter_stock_alerts", lambda pharma_id, **_: iter(rows))
+    ndjson = client.get("/kpi/gpp/stock_alerts", headers={"Accept": "application/x-ndjson"})
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    assert [line for line in ndjson.text.splitlines()] == [
+        '{"id": 2, "product_code": "A", "status": "low"}',
+        '{"id": 1, "product_code": "B", "status": "out"}',
+    ]
+    csv_response = client.get("/kpi/gpp/stock_alerts?format=csv")
+    assert csv_response.headers["content-type"].startswith("text/csv")
+    assert csv_response.text.splitlines() == ["id,product_code,status", "2,A,low", "1,B,out"]
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import time
 
 import httpx
 import pytest
 
-from extractor.app.datasnap import DataSnapClient
+from api.app.datasnap import AsyncDataSnapClient, DataSnapError, probe_hosts
+from extractor.app.datasnap import DataSnapClient, close_clients, get_client
 
 
 class MockTransport(httpx.BaseTransport):
@@ -27,3 +30,77 @@ def test_datasnap_client_success(monkeypatch: pytest.MonkeyPatch) -> None:
     response = client.call("SALES_QUERY", {"sql": "SALES_QUERY"})
 
     assert response.result == {"status": "ok"}
+
+
+def test_get_client_reuses_one_client_per_host() -> None:
+    first = get_client("127.0.0.1")
+    assert get_client("127.0.0.1") is first
+    assert get_client("127.0.0.2") is not first
+
+    close_clients()
+
+    assert first._client.is_closed
+    assert get_client("127.0.0.1") is not first
+    close_clients()
+
+
+class SlowAsyncTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "10.0.0.9":
+            raise httpx.ConnectTimeout("timed out", request=request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200)
+
+
+def test_probe_hosts_runs_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    transport = SlowAsyncTransport()
+
+    class MockAsyncClient(httpx.AsyncClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(transport=transport, *args, **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", MockAsyncClient)
+    hosts = {f"p{idx}": f"10.0.0.{idx}" for idx in range(1, 10)}
+
+    started = time.perf_counter()
+    items = asyncio.run(probe_hosts(hosts, timeout=1))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+    assert [item["pharma_id"] for item in items] == list(hosts)
+    assert all(item["ok"] for item in items[:-1])
+    assert items[-1]["ok"] is False
+    assert all(item["elapsed_ms"] >= 0 for item in items)
+
+
+class FlakyAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.requests: list[httpx.Request] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if len(self.requests) <= self.failures:
+            return httpx.Response(503)
+        return httpx.Response(200, content=json.dumps({"result": [{"status": "ok"}]}).encode())
+
+
+def test_async_client_call_retries(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def no_sleep(_: float) -> None:
+        return None
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+
+    async def run(failures: int, retries: int):
+        transport = FlakyAsyncTransport(failures)
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            client = AsyncDataSnapClient("127.0.0.1", retries=retries, http_client=http_client)
+            return await client.call("query_thread", {"sql": "SELECT 1"}), transport
+
+    response, transport = asyncio.run(run(failures=2, retries=3))
+    assert response.result == {"status": "ok"}
+    assert len(transport.requests) == 3
+    assert transport.requests[0].url.path == "/query_thread/"
+
+    with pytest.raises(DataSnapError, match="after 2 attempts"):
+        asyncio.run(run(failures=5, retries=2))
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from api.app.datasnap import DataSnapError, iter_result_rows
+
+
+def _chunks(body: str, size: int) -> list[bytes]:
+    raw = body.encode()
+    return [raw[idx : idx + size] for idx in range(0, len(raw), size)]
+
+
+ROWS = [
+    {"id": 1, "label": "Doliprane 1000 mg", "price": 2.18, "stock": None, "active": True},
+    {"id": 23456, "label": "Crème éà€", "price": -0.5e-3, "stock": 12, "active": False},
+    [7, "nested", [1, 2]],
+    42,
+    "plain",
+]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 4096])
+def test_rows_survive_any_chunk_boundary(size: int) -> None:
+    body = json.dumps({"result": [ROWS]}, ensure_ascii=False)
+
+    assert list(iter_result_rows(_chunks(body, size))) == ROWS
+
+
+def test_escaped_quotes_and_brackets_inside_strings() -> None:
+    rows = [{"note": 'a "quoted" ] } [ { \\ value', "esc": "\\\"]"}, {"note": "],[", "esc": " "}]
+    body = json.dumps({"result": [rows]})
+
+    assert list(iter_result_rows(_chunks(body, 3))) == rows
+
+
+@pytest.mark.parametrize("body", ['{"result": [[]]}', '{"result":[ [ ] ]}', '{"result": []}', '{"result": null}'])
+def test_empty_results_yield_nothing(body: str) -> None:
+    assert list(iter_result_rows(_chunks(body, 2))) == []
+
+
+def test_other_shapes_are_decoded_whole() -> None:
+    body = json.dumps({"result": [{"status": "ok"}]})
+
+    assert list(iter_result_rows(_chunks(body, 5))) == [{"status": "ok"}]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        '{"result": [[{"id": 1}, {"id": 2',
+        '{"result": [[{"id": 1}, {"label": "unterminated',
+        '{"result": [[{"id": 1},',
+        '{"result": [[12',
+        '{"result": [[',
+        '{"resu',
+        "",
+    ],
+)
+def test_truncated_bodies_raise(body: str) -> None:
+    with pytest.raises(DataSnapError):
+        list(iter_result_rows(_chunks(body, 4)))
+
+
+def test_rows_before_the_cut_are_still_yielded() -> None:
+    rows = iter_result_rows(_chunks('{"result": [[{"id": 1}, {"id": 2}, {"id"', 6))
+
+    assert next(rows) == {"id": 1}
+    assert next(rows) == {"id": 2}
+    with pytest.raises(DataSnapError):
+        next(rows)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import replace
+from typing import Any
+
+import pytest
+
+from extractor.app import batch
+from extractor.app.config import load_settings
+
+
+def test_run_batch_respects_caps_and_reports_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = replace(load_settings(), pharmacy_hosts={"a": "10.0.0.1", "b": "10.0.0.2", "c": "10.0.0.3"})
+    lock = threading.Lock()
+    running: dict[str, int] = {}
+    peak = {"total": 0, "host": 0}
+
+    def fake_run(settings, pharma_id: str, dataset: str, **_: Any) -> dict[str, Any]:
+        with lock:
+            running[pharma_id] = running.get(pharma_id, 0) + 1
+            peak["total"] = max(peak["total"], sum(running.values()))
+            peak["host"] = max(peak["host"], running[pharma_id])
+        time.sleep(0.02)
+        with lock:
+            running[pharma_id] -= 1
+        if pharma_id == "b" and dataset == "stock":
+            raise RuntimeError("DataSnap down")
+        return {"dataset": dataset, "rows": 10}
+
+    monkeypatch.setattr(batch, "run_extraction", fake_run)
+    datasets = [{"dataset": name, "sql": "SELECT 1"} for name in ("sales", "stock", "orders", "products")]
+
+    summary = batch.run_batch(settings, datasets, max_concurrency=4, per_host_concurrency=2)
+
+    assert peak["total"] <= 4
+    assert peak["host"] <= 2
+    assert summary["jobs"] == 12
+    assert summary["failed"] == 1
+    assert summary["rows"] == 110
+    assert summary["hosts"]["b"]["stock"]["status"] == "error"
+    assert "DataSnap down" in summary["hosts"]["b"]["stock"]["error"]
+    assert summary["hosts"]["a"]["sales"]["elapsed_s"] >= 0
+
+
+def test_run_batch_caps_pharmacies_sharing_a_host(monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = replace(load_settings(), pharmacy_hosts={"a": "10.0.0.1", "b": "10.0.0.1", "c": "10.0.0.2"})
+    lock = threading.Lock()
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    def fake_run(settings, pharma_id: str, dataset: str, **_: Any) -> dict[str, Any]:
+        host = settings.pharmacy_hosts[pharma_id]
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+        time.sleep(0.02)
+        with lock:
+            running[host] -= 1
+        return {"dataset": dataset, "rows": 1}
+
+    monkeypatch.setattr(batch, "run_extraction", fake_run)
+    datasets = [{"dataset": name, "sql": "SELECT 1"} for name in ("sales", "stock", "orders")]
+
+    summary = batch.run_batch(settings, datasets, max_concurrency=8, per_host_concurrency=2)
+
+    assert summary["jobs"] == 9
+    assert peak["10.0.0.1"] <= 2
+
+
+def test_run_batch_rejects_duplicate_datasets() -> None:
+    settings = replace(load_settings(), pharmacy_hosts={"a": "10.0.0.1"})
+    datasets = [{"dataset": "sales", "sql": "SELECT 1"}, {"dataset": "sales", "sql": "SELECT 2"}]
+    with pytest.raises(batch.ExtractionError, match="more than once"):
+        batch.run_batch(settings, datasets)
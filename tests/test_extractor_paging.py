@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from extractor.app.datasnap import DataSnapResponse
+from extractor.app.extractor import ExtractionError, iter_pages
+
+
+class FakeClient:
+    def __init__(self, rows: list[dict[str, Any]]) -> None:
+        self.rows = rows
+        self.sql: list[str] = []
+
+    def call(self, method_name: str, payload: dict[str, Any]) -> DataSnapResponse:
+        sql = payload["sql"]
+        self.sql.append(sql)
+        if "LIMIT" not in sql:
+            return DataSnapResponse(raw={"result": [self.rows]}, result=self.rows)
+        limit = int(sql.rsplit("LIMIT", 1)[1].split()[0])
+        if "OFFSET" in sql:
+            start = int(sql.rsplit("OFFSET", 1)[1])
+        elif "WHERE" in sql:
+            last = int(sql.split(" > ", 1)[1].split()[0])
+            start = next((i for i, row in enumerate(self.rows) if row["id"] > last), len(self.rows))
+        else:
+            start = 0
+        page = self.rows[start : start + limit]
+        return DataSnapResponse(raw={"result": [page]}, result=page)
+
+
+def test_iter_pages_offset_windows() -> None:
+    client = FakeClient([{"id": idx} for idx in range(1, 11)])
+
+    pages = list(iter_pages(client, "SELECT * FROM orditem ORDER BY id;", page_size=4))
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    # The window stays next to the source's ORDER BY instead of wrapping it in a derived table.
+    assert client.sql[1] == "SELECT * FROM orditem ORDER BY id LIMIT 4 OFFSET 4"
+
+
+def test_page_sql_wraps_only_unordered_sources() -> None:
+    from extractor.app.extractor import _page_sql
+
+    assert _page_sql("SELECT a FROM t ORDER BY f(a), b DESC", 5, 10, None, None) == (
+        "SELECT a FROM t ORDER BY f(a), b DESC LIMIT 5 OFFSET 10"
+    )
+    for source in ["SELECT a FROM t", "SELECT * FROM (SELECT a FROM t ORDER BY a) x", "SELECT a FROM t ORDER BY a LIMIT 3"]:
+        assert _page_sql(source, 5, 10, None, None) == f"SELECT * FROM ({source}) AS page_src LIMIT 5 OFFSET 10"
+
+
+def test_iter_pages_keyset_stops_on_exact_multiple() -> None:
+    client = FakeClient([{"id": idx} for idx in range(1, 9)])
+
+    pages = list(iter_pages(client, "SELECT * FROM orditem", page_size=4, key_column="id"))
+
+    assert [row["id"] for page in pages for row in page] == list(range(1, 9))
+    assert "WHERE page_src.id > 4 ORDER BY page_src.id LIMIT 4" in client.sql[1]
+    assert len(client.sql) == 3
+
+
+def test_iter_pages_rejects_bad_key_column() -> None:
+    with pytest.raises(ExtractionError):
+        list(iter_pages(FakeClient([]), "SELECT 1", page_size=10, key_column="id; DROP"))
+
+
+def test_extract_incremental_resumes_from_watermark(monkeypatch: pytest.MonkeyPatch) -> None:
+    from contextlib import nullcontext
+
+    from extractor.app import db, extractor
+    from extractor.app.config import load_settings
+
+    client = FakeClient([{"id": idx, "DTime_Send": 100 + idx} for idx in range(2, 6)])
+    saved: dict[str, Any] = {}
+    monkeypatch.setattr(extractor, "_client_for", lambda *_: client)
+    monkeypatch.setattr(db, "get_connection", lambda *_: nullcontext(None))
+    monkeypatch.setattr(
+        extractor,
+        "get_watermark",
+        lambda *_: {"cursor_column": "DTime_Send", "cursor_value": 102, "boundary_keys": []},
+    )
+    monkeypatch.setattr(extractor, "copy_rows", lambda conn, table, pharma_id, rows, **_: len(rows))
+    monkeypatch.setattr(extractor, "save_watermark", lambda *args: saved.update(args=args))
+
+    report = extractor.extract_incremental(
+        load_settings(), "frang", "orders", "SELECT * FROM orders", "DTime_Send"
+    )
+
+    assert client.sql == ["SELECT * FROM (SELECT * FROM orders) AS inc_src WHERE inc_src.DTime_Send >= 102"]
+    assert report["mode"] == "incremental"
+    assert report["cursor_to"] == 105
+    assert saved["args"][3:] == ("DTime_Send", 105, 4, ['{"DTime_Send": 105, "id": 5}'])
+
+
+def test_extract_incremental_keeps_late_rows_at_the_watermark(monkeypatch: pytest.MonkeyPatch) -> None:
+    from contextlib import nullcontext
+
+    from extractor.app import db, extractor
+    from extractor.app.config import load_settings
+
+    # id 3 was extracted at DTime_Send 102 last run; id 7 committed later with the same value.
+    client = FakeClient([{"id": 3, "DTime_Send": 102}, {"id": 7, "DTime_Send": 102}])
+    written: list[Any] = []
+    saved: dict[str, Any] = {}
+    monkeypatch.setattr(extractor, "_client_for", lambda *_: client)
+    monkeypatch.setattr(db, "get_connection", lambda *_: nullcontext(None))
+    monkeypatch.setattr(
+        extractor,
+        "get_watermark",
+        lambda *_: {"cursor_column": "DTime_Send", "cursor_value": 102, "boundary_keys": [3]},
+    )
+    monkeypatch.setattr(
+        extractor, "copy_rows", lambda conn, table, pharma_id, rows, **_: written.extend(rows) or len(rows)
+    )
+    monkeypatch.setattr(extractor, "save_watermark", lambda *args: saved.update(args=args))
+
+    report = extractor.extract_incremental(
+        load_settings(), "frang", "orders", "SELECT * FROM orders", "DTime_Send", key_column="id"
+    )
+
+    assert written == [{"id": 7, "DTime_Send": 102}]
+    assert report["cursor_to"] == 102
+    assert saved["args"][3:] == ("DTime_Send", 102, 1, [3, 7])
+
+
+def test_extract_incremental_skips_repeats_in_any_order(monkeypatch: pytest.MonkeyPatch) -> None:
+    from contextlib import nullcontext
+
+    from extractor.app import db, extractor
+    from extractor.app.config import load_settings
+
+    # The newer row comes first: id 3 must still be recognised as extracted at 102.
+    client = FakeClient([{"id": 8, "DTime_Send": 105}, {"id": 3, "DTime_Send": 102}, {"id": 9, "DTime_Send": 102}])
+    written: list[Any] = []
+    saved: dict[str, Any] = {}
+    monkeypatch.setattr(extractor, "_client_for", lambda *_: client)
+    monkeypatch.setattr(db, "get_connection", lambda *_: nullcontext(None))
+    monkeypatch.setattr(
+        extractor,
+        "get_watermark",
+        lambda *_: {"cursor_column": "DTime_Send", "cursor_value": 102, "boundary_keys": [3]},
+    )
+    monkeypatch.setattr(
+        extractor, "copy_rows", lambda conn, table, pharma_id, rows, **_: written.extend(rows) or len(rows)
+    )
+    monkeypatch.setattr(extractor, "save_watermark", lambda *args: saved.update(args=args))
+
+    extractor.extract_incremental(
+        load_settings(), "frang", "orders", "SELECT * FROM orders", "DTime_Send", key_column="id"
+    )
+
+    assert [row["id"] for row in written] == [8, 9]
+    assert saved["args"][3:] == ("DTime_Send", 105, 2, [8])
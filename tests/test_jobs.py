@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import socket
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from api.app import jobs
+
+
+class FakeConnection:
+    """One staging.extract_jobs table answering the claim and resume statements."""
+
+    def __init__(self) -> None:
+        self.jobs: dict[int, dict] = {}
+        self._result: list[tuple] = []
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def _row(self, job: dict) -> tuple:
+        now = datetime(2024, 1, 1)
+        return (job["id"], "frang", "sales", {"sql": "SELECT 1"}, job["status"], 0, 0, None, None, now, now, None, now)
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self._result = []
+        if "SET status = 'running'" in sql:
+            job = self.jobs.get(params[1])
+            if job and job["status"] == "queued":
+                job.update(status="running", runner=params[0])
+                self._result = [self._row(job)]
+        elif "SET status = 'queued'" in sql:
+            for job in self.jobs.values():
+                if job["status"] == "running" and job["runner"] == params[0]:
+                    job.update(status="queued", runner=None)
+        elif "SELECT id FROM staging.extract_jobs WHERE status = 'queued'" in sql:
+            self._result = [(job["id"],) for job in self.jobs.values() if job["status"] == "queued"]
+        elif "SET status = 'succeeded'" in sql:
+            self.jobs[params[-1]]["status"] = "succeeded"
+        elif "SET status = 'failed'" in sql:
+            return
+        else:
+            raise AssertionError(sql)
+
+    def fetchone(self) -> tuple | None:
+        return self._result[0] if self._result else None
+
+    def fetchall(self) -> list[tuple]:
+        return self._result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+def test_a_job_is_claimed_once(monkeypatch) -> None:
+    conn = FakeConnection()
+    conn.jobs[1] = {"id": 1, "status": "queued", "runner": None}
+    executed = []
+    monkeypatch.delenv("EXTRACTOR_URL", raising=False)
+    monkeypatch.setattr(jobs, "get_connection", lambda: conn)
+    monkeypatch.setattr(jobs, "_execute", lambda job: executed.append(job["id"]) or {"rows": 1, "pages": 1})
+    jobs._run_job(1)
+    jobs._run_job(1)
+    assert executed == [1]
+    assert conn.jobs[1]["status"] == "succeeded"
+
+
+def test_resume_requeues_jobs_this_host_was_running(monkeypatch) -> None:
+    conn = FakeConnection()
+    conn.jobs[1] = {"id": 1, "status": "running", "runner": f"api@{socket.gethostname()}"}
+    conn.jobs[2] = {"id": 2, "status": "running", "runner": "extractor"}
+    scheduled = []
+    monkeypatch.setattr(jobs, "get_connection", lambda: conn)
+    monkeypatch.setattr(jobs, "_schedule", scheduled.append)
+    assert jobs.resume_jobs() == 1
+    assert scheduled == [1]
+    assert conn.jobs[2]["status"] == "running"
+
+
+def test_direct_path_rejects_extractor_only_options(monkeypatch) -> None:
+    monkeypatch.delenv("EXTRACTOR_URL", raising=False)
+    monkeypatch.setattr(jobs, "get_pharmacy_hosts", lambda: {"frang": "10.0.0.1"})
+    monkeypatch.setattr(jobs, "get_client", lambda *_, **__: pytest.fail("DataSnap should not be called"))
+    job = {"id": 3, "pharma_id": "frang", "dataset": "orders", "request": {"sql": "SELECT 1", "page_size": 500}}
+    with pytest.raises(RuntimeError, match="page_size require the extractor service"):
+        jobs._execute(job)
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import date
+
+from api.app import kpi
+from api.app.kpi import refresh_sales_daily
+
+
+class FakeConnection:
+    """Staging rows with their writing transaction, and snapshots that hide uncommitted ones."""
+
+    def __init__(self) -> None:
+        self.staging: list[dict] = []
+        self.running: set[int] = set()
+        self.next_xid = 100
+        self.daily: dict[date, tuple[float, int]] = {}
+        self.last_xmin = "0"
+        self._result: list[tuple] = []
+
+    def begin(self) -> int:
+        self.next_xid += 1
+        self.running.add(self.next_xid)
+        return self.next_xid
+
+    def insert(self, xid: int, staging_id: int, day: date, revenue: float) -> None:
+        self.staging.append({"id": staging_id, "txid": xid, "date": day, "revenue": revenue})
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql: str, params=None) -> None:
+        if "INSERT INTO mart.refresh_state" in sql or "sales_rollup" in sql:
+            return
+        if "SELECT last_xmin" in sql:
+            self._result = [(self.last_xmin,)]
+        elif "pg_snapshot_xmin" in sql:
+            self._result = [(str(min(self.running, default=self.next_xid + 1)),)]
+        elif "INSERT INTO mart.sales_daily" in sql:
+            visible = [
+                row for row in self.staging if row["txid"] not in self.running and row["txid"] >= int(params[1])
+            ]
+            latest: dict[date, dict] = {}
+            for row in sorted(visible, key=lambda row: row["id"]):
+                latest[row["date"]] = row
+            touched = []
+            for day, row in latest.items():
+                current = self.daily.get(day)
+                if current is None or current[1] <= row["id"]:
+                    self.daily[day] = (row["revenue"], row["id"])
+                    touched.append((day,))
+            self._result = touched
+        elif "UPDATE mart.refresh_state" in sql:
+            self.last_xmin = params[0]
+        else:
+            raise AssertionError(sql)
+
+    def fetchone(self) -> tuple:
+        return self._result[0]
+
+    def fetchall(self) -> list[tuple]:
+        return self._result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+def test_refresh_picks_up_rows_committed_out_of_order(monkeypatch) -> None:
+    conn = FakeConnection()
+    monkeypatch.setattr(kpi, "get_connection", lambda: conn)
+    slow, fast = conn.begin(), conn.begin()
+    conn.insert(slow, 1, date(2024, 1, 1), 100.0)
+    conn.insert(fast, 2, date(2024, 1, 2), 200.0)
+    conn.running.discard(fast)
+
+    first = refresh_sales_daily("frang")
+    assert set(conn.daily) == {date(2024, 1, 2)}
+    assert first["to_xmin"] == str(slow)
+
+    # Id 1 commits after id 2 was refreshed: an id watermark would skip it forever.
+    conn.running.discard(slow)
+    second = refresh_sales_daily("frang")
+    assert conn.daily[date(2024, 1, 1)] == (100.0, 1)
+    assert second["days_upserted"] == 2
+
+    # A re-read older row never overwrites a newer one for the same day.
+    late = conn.begin()
+    conn.insert(late, 3, date(2024, 1, 2), 250.0)
+    conn.running.discard(late)
+    refresh_sales_daily("frang")
+    assert conn.daily[date(2024, 1, 2)] == (250.0, 3)
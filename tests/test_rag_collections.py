@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+
+import pytest
+
+from api.app.rag import collections
+from api.app.rag.collections import activate_collection
+
+
+class FakeConnection:
+    """Answers the locking SELECT and the missing-embeddings count of activate_collection."""
+
+    def __init__(self, ids: list[int], missing: int) -> None:
+        self.ids = ids
+        self.missing = missing
+        self.updates: list[tuple] = []
+        self._result: list[tuple] = []
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql: str, params: tuple) -> None:
+        if "FOR UPDATE" in sql:
+            self._result = [(collection_id,) for collection_id in self.ids]
+        elif "count(*)" in sql:
+            self._result = [(self.missing,)]
+        elif sql.lstrip().startswith("UPDATE"):
+            self.updates.append(params)
+            row = (params[0], "hashing", "hashing-test", 32, "active", "ivfflat", True, 10, 10, None)
+            self._result = [row + (None, None, None, "none")]
+        else:
+            raise AssertionError(sql)
+
+    def fetchall(self) -> list[tuple]:
+        return self._result
+
+    def fetchone(self) -> tuple:
+        return self._result[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+def test_activate_collection_requires_every_embedding(monkeypatch) -> None:
+    conn = FakeConnection([1, 2], missing=3)
+    monkeypatch.setattr(collections, "get_connection", lambda: conn)
+    with pytest.raises(LookupError):
+        activate_collection(5)
+    with pytest.raises(ValueError, match="missing 3"):
+        activate_collection(2)
+    assert conn.updates == []
+
+    conn.missing = 0
+    collection = activate_collection(2)
+    assert collection["status"] == "active" and collection["id"] == 2
+    # The previous active collection is retired in the same transaction.
+    assert conn.updates == [(2,), (2,)]
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import numpy as np
+
+from api.app.rag.embeddings import get_embedder, normalize_text
+
+
+def test_normalize_text_strips_accents_and_punctuation() -> None:
+    assert normalize_text("Paracétamol 500 mg, RUPTURE !") == "paracetamol 500 mg rupture"
+
+
+def test_hashing_embedder_ranks_related_text_closer() -> None:
+    embedder = get_embedder("hashing", 128)
+    vectors = embedder.embed_batch(
+        [
+            "Rupture de stock du paracétamol 500 mg",
+            "ruptures de stock paracetamol",
+            "Chiffre d'affaires du mois de mars",
+            "",
+        ]
+    )
+    assert vectors.shape == (4, 128)
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0, atol=1e-5)
+    assert not vectors[3].any()
+    distances = np.linalg.norm(vectors[1:3] - vectors[0], axis=1)
+    assert distances[0] < distances[1]
+
+
+def test_hashing_embedder_is_deterministic_across_batches() -> None:
+    embedder = get_embedder("hashing", 64)
+    single = embedder.embed_batch(["commande grossiste"])[0]
+    batched = embedder.embed_batch(["autre texte", "commande grossiste"], batch_size=1)[1]
+    assert np.allclose(single, batched)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+from api.app.rag import service
+from api.app.rag.llm import NoLLMProvider
+from api.app.rag.service import RagSettings, index_folder
+
+
+COLLECTIONS = [
+    {"id": 1, "backend": "hashing", "model": "hashing-active", "dim": 32, "status": "active"},
+    {"id": 2, "backend": "hashing", "model": "hashing-building", "dim": 16, "status": "building"},
+]
+
+
+class FakeCopy:
+    def __init__(self, conn: FakeConnection, sql: str) -> None:
+        self.conn = conn
+        self.embeddings = "document_embeddings" in sql
+
+    def write_row(self, row: tuple) -> None:
+        if self.embeddings:
+            self.conn.embeddings[(row[0], row[2])] = row
+        else:
+            self.conn.documents[row[0]] = row
+
+
+class FakeConnection:
+    """Just enough of rag.documents, rag.document_embeddings and rag.index_manifest for index_folder."""
+
+    def __init__(self) -> None:
+        self.documents: dict[int, tuple] = {}
+        self.embeddings: dict[tuple[int, int], tuple] = {}
+        self.manifest: dict[tuple[str, str], tuple] = {}
+        self.ids = itertools.count(1)
+        self.copies = 0
+        self.partitions: set[str] = set()
+        self.versions: dict[str, int] = {}
+        self._result: list[tuple] = []
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    @contextmanager
+    def copy(self, sql: str):
+        self.copies += 1
+        yield FakeCopy(self, sql)
+
+    def execute(self, sql: str, params: tuple) -> None:
+        if "FROM rag.index_manifest" in sql and sql.lstrip().startswith("SELECT"):
+            self._result = [
+                (path, *values) for (pharma_id, path), values in self.manifest.items() if pharma_id == params[0]
+            ]
+        elif "nextval" in sql:
+            self._result = [(next(self.ids),) for _ in range(params[0])]
+        elif "ensure_document_partition" in sql:
+            self.partitions.add(params[0])
+        elif "id = ANY" in sql:
+            for chunk_id in params[1]:
+                if self.documents.get(chunk_id, (None, None))[1] == params[0]:
+                    self._delete(chunk_id)
+        elif "DELETE FROM rag.documents" in sql:
+            for chunk_id, row in list(self.documents.items()):
+                if row[1:3] == params:
+                    self._delete(chunk_id)
+        elif "index_version + 1" in sql:
+            self.versions[params[0]] = self.versions.get(params[0], 0) + 1
+        elif "INSERT INTO rag.index_manifest" in sql:
+            self.manifest[params[:2]] = params[2:]
+        elif "DELETE FROM rag.index_manifest" in sql:
+            del self.manifest[params]
+        else:
+            raise AssertionError(sql)
+
+    def _delete(self, chunk_id: int) -> None:
+        del self.documents[chunk_id]
+        for key in [key for key in self.embeddings if key[1] == chunk_id]:
+            del self.embeddings[key]
+
+    def fetchall(self) -> list[tuple]:
+        return self._result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+def use_fake_connection(monkeypatch) -> FakeConnection:
+    conn = FakeConnection()
+    monkeypatch.setattr(service, "get_connection", lambda: conn)
+    monkeypatch.setattr(service, "ensure_active_collection", lambda cur, settings: COLLECTIONS[0])
+    monkeypatch.setattr(service, "writable_collections", lambda cur: COLLECTIONS)
+    return conn
+
+
+def test_index_folder_is_incremental(monkeypatch, tmp_path) -> None:
+    conn = use_fake_connection(monkeypatch)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text("ligne un\nligne deux\n" * 20, encoding="utf-8")
+    second.write_text("rupture paracetamol", encoding="utf-8")
+    (tmp_path / "ignored.csv").write_text("x", encoding="utf-8")
+
+    report = index_folder("frang", str(tmp_path), settings)
+    assert (report["added"], report["updated"], report["skipped"], report["removed"]) == (2, 0, 0, 0)
+    assert report["indexed"] == len(conn.documents)
+    # One COPY of chunks per file, plus one per collection being written.
+    assert conn.copies == 6
+    assert conn.partitions == {"frang"}
+    assert conn.versions == {"frang": 2}
+    row = next(iter(conn.documents.values()))
+    assert row[1] == "frang"
+    assert len(conn.embeddings) == 2 * len(conn.documents)
+    assert conn.embeddings[(1, row[0])][3].count(",") == 31
+    assert conn.embeddings[(2, row[0])][3].count(",") == 15
+    assert conn.manifest[("frang", row[2])][-1] == "hashing-active"
+
+    # Touching a file without changing it only refreshes its manifest entry.
+    stat = second.stat()
+    os.utime(second, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    report = index_folder("frang", str(tmp_path), settings)
+    assert (report["added"], report["updated"], report["skipped"], report["removed"]) == (0, 0, 2, 0)
+    assert conn.copies == 6
+    assert conn.versions == {"frang": 2}
+
+    second.write_text("commande grossiste en retard", encoding="utf-8")
+    first.unlink()
+    report = index_folder("frang", str(tmp_path), settings)
+    assert (report["added"], report["updated"], report["skipped"], report["removed"]) == (0, 1, 0, 1)
+    assert [row[3] for row in conn.documents.values()] == ["commande grossiste en retard"]
+    assert sorted(key[0] for key in conn.embeddings) == [1, 2]
+    assert list(conn.manifest) == [("frang", str(second))]
+    assert conn.versions == {"frang": 4}
+
+
+def test_index_folder_parses_in_process_pool(monkeypatch, tmp_path) -> None:
+    conn = use_fake_connection(monkeypatch)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider(), parse_workers=2)
+    for idx in range(4):
+        (tmp_path / f"doc{idx}.txt").write_text(f"document {idx}\n" * 10, encoding="utf-8")
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    try:
+        report = index_folder("frang", str(tmp_path), settings)
+    finally:
+        service.shutdown_parse_pool()
+    assert report["added"] == 4
+    assert [error["path"] for error in report["errors"]] == [str(tmp_path / "broken.pdf")]
+    assert {row[2] for row in conn.documents.values()} == {str(tmp_path / f"doc{idx}.txt") for idx in range(4)}
+
+
+def test_parse_files_yields_before_paths_are_exhausted(monkeypatch) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(service, "_get_parse_pool", lambda workers: pool)
+    monkeypatch.setattr(service, "_parse_file", lambda path, chunk_size: [path.upper()])
+    parsed: list[str] = []
+    seen_when_asked: dict[str, list[str]] = {}
+
+    def produced():
+        for idx, name in enumerate("abcdefgh"):
+            seen_when_asked[name] = list(parsed)
+            if idx:
+                time.sleep(0.02)  # the previous file finishes while this one is still being written
+            yield name
+            assert len(seen_when_asked) - len(parsed) <= 4
+
+    try:
+        for path, chunks, error in service._parse_files(produced(), chunk_size=50, workers=2):
+            assert error is None and chunks == [path.upper()]
+            parsed.append(path)
+    finally:
+        pool.shutdown()
+    assert sorted(parsed) == list("abcdefgh")
+    assert "a" in seen_when_asked["c"]
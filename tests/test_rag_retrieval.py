@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+
+import pytest
+
+from api.app.cache import rag_embedding_cache, rag_search_cache
+from api.app.rag import retrieval
+from api.app.rag.ann import default_probes, ivfflat_lists
+from api.app.rag.llm import NoLLMProvider
+from api.app.rag.retrieval import SearchOptions, fuse_rankings, search_documents
+from api.app.rag.service import RagSettings
+
+
+def test_fuse_rankings_rewards_documents_in_both_lists() -> None:
+    vector = [(1, "a", "A"), (2, "b", "B"), (3, "c", "C")]
+    text = [(3, "c", "C"), (4, "d", "D")]
+    items = fuse_rankings([("vector", 1.0, vector), ("text", 1.0, text)], k=3, rrf_k=60)
+    assert [item["id"] for item in items] == [3, 1, 2]
+    assert items[0]["ranks"] == {"vector": 3, "text": 1}
+
+
+def test_fuse_rankings_weights() -> None:
+    vector = [(1, "a", "A")]
+    text = [(2, "b", "B")]
+    items = fuse_rankings([("vector", 0.5, vector), ("text", 2.0, text)], k=2, rrf_k=60)
+    assert [item["id"] for item in items] == [2, 1]
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    rag_embedding_cache.clear()
+    rag_search_cache.clear()
+    yield
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.statements: list[tuple[str, tuple]] = []
+        self.settings: list[tuple] = []
+        self.index_version = 1
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql, params: tuple) -> None:
+        sql = sql if isinstance(sql, str) else sql.as_string(None)
+        if "index_version" in sql:
+            return
+        if "set_config" not in sql:
+            self.statements.append((sql, params))
+        else:
+            self.settings.append(params)
+
+    def fetchone(self) -> tuple:
+        return (self.index_version,)
+
+    def fetchall(self) -> list[tuple]:
+        if "content_tsv" in self.statements[-1][0]:
+            return [(7, "cip.pdf", "CIP 3400930000001")]
+        return [(5, "notice.pdf", "paracetamol"), (7, "cip.pdf", "CIP 3400930000001")]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+ACTIVE = {"id": 3, "backend": "hashing", "model": "hashing-test", "dim": 32}
+
+
+def use_fake_connection(monkeypatch, collection: dict | None = ACTIVE) -> FakeConnection:
+    conn = FakeConnection()
+    monkeypatch.setattr(retrieval, "get_connection", lambda: conn)
+    monkeypatch.setattr(retrieval, "active_collection", lambda cur: collection)
+    return conn
+
+
+def test_search_documents_hybrid_runs_both_stages(monkeypatch) -> None:
+    conn = use_fake_connection(monkeypatch)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    result = search_documents("frang", "CIP 3400930000001", settings, SearchOptions(k=1, candidates=20))
+    assert [item["id"] for item in result["items"]] == [7]
+    (vector_sql, vector_params), (_, text_params) = conn.statements
+    assert (vector_params["limit"], text_params[-1]) == (20, 20)
+    assert "collection_id = 3" in vector_sql and "vector(32)" in vector_sql
+    assert result["collection_id"] == 3
+    assert set(result["timings_ms"]) == {"embed_ms", "vector_ms", "text_ms", "fuse_ms", "total_ms"}
+
+    conn.statements.clear()
+    result = search_documents("frang", "paracetamol", settings, SearchOptions(k=3, mode="text"))
+    assert len(conn.statements) == 1 and conn.statements[0][1][-1] == 3
+    assert "embed_ms" not in result["timings_ms"]
+    assert conn.settings == []
+
+
+def test_search_documents_reranks_quantized_candidates(monkeypatch) -> None:
+    conn = use_fake_connection(monkeypatch, ACTIVE | {"quantization": "binary"})
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    search_documents("frang", "paracetamol", settings, SearchOptions(k=5, mode="vector", rerank_factor=8))
+    [(vector_sql, params)] = conn.statements
+    # Hamming-distance candidates from the bit index, re-ranked on the full vectors.
+    assert "binary_quantize(e.embedding::vector(32))::bit(32) <~>" in vector_sql
+    assert "ORDER BY e.embedding::vector(32) <-> %(vector)s::vector(32)" in vector_sql
+    assert (params["limit"], params["candidates"]) == (5, 40)
+
+
+def test_search_documents_without_active_collection_uses_text_only(monkeypatch) -> None:
+    conn = use_fake_connection(monkeypatch, None)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    result = search_documents("frang", "paracetamol", settings, SearchOptions(k=2))
+    assert len(conn.statements) == 1 and "content_tsv" in conn.statements[0][0]
+    assert result["collection_id"] is None
+    assert [item["id"] for item in result["items"]] == [7]
+
+
+def test_search_documents_sets_ann_knobs_per_search(monkeypatch) -> None:
+    conn = use_fake_connection(monkeypatch)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    search_documents("frang", "paracetamol", settings, SearchOptions(mode="vector", probes=8, ef_search=40))
+    assert conn.settings == [("8",), ("40",)]
+
+
+def test_search_documents_caches_results_per_index_version(monkeypatch) -> None:
+    conn = use_fake_connection(monkeypatch)
+    settings = RagSettings(embedding_dim=32, chunk_size=50, llm_provider=NoLLMProvider())
+    embedding_hits, search_hits = rag_embedding_cache.stats()["hits"], rag_search_cache.stats()["hits"]
+    first = search_documents("frang", "Ruptures de stock", settings, SearchOptions(k=2))
+    again = search_documents("frang", "  ruptures  DE stock", settings, SearchOptions(k=2))
+    assert (first["cached"], again["cached"]) == (False, True)
+    assert again["items"] == first["items"] and set(again["timings_ms"]) == {"total_ms"}
+    assert len(conn.statements) == 2
+
+    # Indexing bumps the pharmacy's version: the search runs again, the question embedding is reused.
+    conn.index_version = 2
+    assert search_documents("frang", "ruptures de stock", settings, SearchOptions(k=2))["cached"] is False
+    assert len(conn.statements) == 4
+    assert rag_embedding_cache.stats()["hits"] == embedding_hits + 1
+    assert rag_search_cache.stats()["hits"] == search_hits + 1
+
+    rag_search_cache.invalidate("frang")
+    assert rag_search_cache.stats()["size"] == 0
+
+
+def test_question_embedding_cache_separates_dimensions() -> None:
+    small = ACTIVE
+    large = ACTIVE | {"id": 4, "dim": 64}
+    hits = rag_embedding_cache.stats()["hits"]
+    first = retrieval._embed_question(small, "ruptures de stock")
+    second = retrieval._embed_question(large, "ruptures de stock")
+    assert first.count(",") == 31 and second.count(",") == 63
+    assert retrieval._embed_question(small, "ruptures de stock") == first
+    assert rag_embedding_cache.stats()["hits"] == hits + 1
+
+
+def test_ivfflat_lists_follow_row_count() -> None:
+    assert ivfflat_lists(0) == 1
+    assert ivfflat_lists(250_000) == 250
+    assert ivfflat_lists(4_000_000) == 2000
+    assert default_probes(250) == 15
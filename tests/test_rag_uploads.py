@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import hashlib
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.app import main
+from api.app.rag.uploads import UploadTooLarge, safe_filename, save_upload
+
+
+client = TestClient(main.app)
+
+
+def test_safe_filename_drops_directories_and_hidden_prefix() -> None:
+    assert safe_filename("../../etc/passwd") == "passwd"
+    assert safe_filename("C:\\docs\\notice ANSM.pdf") == "notice ANSM.pdf"
+    assert safe_filename(".env") == "env"
+    assert safe_filename("ordonnance<1>.pdf") == "ordonnance_1_.pdf"
+    with pytest.raises(ValueError):
+        safe_filename("..")
+
+
+def test_save_upload_hashes_while_copying_and_enforces_limit(tmp_path) -> None:
+    data = b"x" * 10_000
+    target, digest, size = save_upload(io.BytesIO(data), tmp_path, "a.txt", max_bytes=20_000, chunk_size=4096)
+    assert target.read_bytes() == data
+    assert (digest, size) == (hashlib.sha256(data).hexdigest(), 10_000)
+
+    with pytest.raises(UploadTooLarge):
+        save_upload(io.BytesIO(data), tmp_path, "b.txt", max_bytes=5_000, chunk_size=4096)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.txt"]
+
+
+def test_rag_upload_indexes_only_uploaded_files(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("RAG_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("RAG_UPLOAD_MAX_BYTES", "100")
+    indexed = []
+
+    def fake_index_files(pharma_id, base, files, settings):
+        indexed.extend((path.name, content_hash) for path, content_hash in files)
+        return {"indexed": len(indexed), "added": len(indexed), "errors": []}
+
+    monkeypatch.setattr(main, "index_files", fake_index_files)
+    response = client.post(
+        "/rag/upload",
+        data={"pharma_id": "frang"},
+        files=[
+            ("files", ("../notes.txt", b"rupture", "text/plain")),
+            ("files", ("big.txt", b"y" * 200, "text/plain")),
+        ],
+    )
+    body = response.json()
+    assert response.status_code == 200
+    assert indexed == [("notes.txt", hashlib.sha256(b"rupture").hexdigest())]
+    assert body["files"] == [{"filename": "notes.txt", "size": 7, "sha256": indexed[0][1]}]
+    assert body["errors"][0]["path"] == "big.txt"
+    assert (tmp_path / "frang" / "notes.txt").exists()
+
+
+def test_rag_upload_rejects_oversized_request_before_reading(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("RAG_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("RAG_UPLOAD_MAX_REQUEST_BYTES", "1000")
+    monkeypatch.setattr(main, "index_files", lambda *_: pytest.fail("body should not be handled"))
+
+    response = client.post(
+        "/rag/upload",
+        data={"pharma_id": "frang"},
+        files=[("files", ("big.txt", b"y" * 2000, "text/plain"))],
+    )
+    assert response.status_code == 413
+    assert not (tmp_path / "frang").exists()